@@ -0,0 +1,145 @@
+"""Python API for embedding the pipeline.
+
+:class:`Pipeline` runs flows in-process against a data root (a directory
+with ``data/``, ``configs/`` and ``.pscope/``) and an optional shared
+``schemas.yml``::
+
+    from app.api import Pipeline
+
+    pipeline = Pipeline(config="/etc/pscope/schemas.yml")
+    pipeline.for_root("/srv/tenants/a").run()
+    codes = pipeline.run_many(["/srv/tenants/a", "/srv/tenants/b"], jobs=4)
+
+Parsed configuration, compiled header resolvers and other in-process caches
+are shared by all runs of a process, so running many roots through one
+pipeline avoids the interpreter start-up, config parsing and logging set-up
+that a ``scripts/processor.py`` subprocess per root pays.  Logging is left to
+the host application (see :func:`app.utils.logging.setup_logging`); the
+worker processes of :meth:`Pipeline.run_many` only set it up when asked to
+(``worker_logging=True``).
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable
+
+from app.pipeline import runner
+from app.pipeline.flows import DEFAULT_FLOW
+from app.pipeline.journal import RunJournal
+from app.utils import resources
+from app.utils.logging import get_logger, setup_logging
+from app.utils.paths import project_root
+
+
+logger = get_logger(__name__)
+
+
+class Pipeline:
+    """Pipeline bound to a data *root* and an optional shared *config*."""
+
+    def __init__(
+        self,
+        root: str | Path | None = None,
+        *,
+        config: str | Path | None = None,
+        max_memory: str | int | None = None,
+        jobs: int | None = None,
+    ) -> None:
+        self.root = project_root(root)
+        self.config = Path(config).resolve() if config is not None else None
+        self.max_memory = max_memory
+        self.jobs = jobs
+
+    def for_root(self, root: str | Path) -> "Pipeline":
+        """Return a pipeline with the same settings for another data root."""
+
+        return Pipeline(root, config=self.config, max_memory=self.max_memory, jobs=self.jobs)
+
+    def _configure(self) -> None:
+        resources.configure(
+            self.root, config_file=self.config, max_memory=self.max_memory, jobs=self.jobs
+        )
+
+    def run(self, flow: Iterable[str] | None = None, **kwargs) -> int:
+        """Run *flow* (default: all steps); returns the exit code."""
+
+        self._configure()
+        return runner.run_flow(
+            flow=list(flow or DEFAULT_FLOW),
+            root=self.root,
+            config_file=self.config,
+            **kwargs,
+        )
+
+    def resume(self, run_id: str | None = None) -> int:
+        """Resume run *run_id* (default: the latest run, when it failed)."""
+
+        journal = RunJournal.load(self.root, run_id)
+        if journal is None:
+            logger.info("api: %s: nothing to resume", self.root)
+            return 0
+        self._configure()
+        return runner.run_flow(
+            flow=journal.flow, resume=journal, root=self.root, **journal.options
+        )
+
+    def run_many(
+        self,
+        roots: Iterable[str | Path],
+        *,
+        flow: Iterable[str] | None = None,
+        jobs: int | None = None,
+        worker_logging: bool = False,
+        **kwargs,
+    ) -> dict[Path, int]:
+        """Run *flow* for every root; returns ``{root: exit code}``.
+
+        Roots are spread over up to *jobs* worker processes (capped by the
+        resource governor); each worker keeps its caches across the roots it
+        runs and uses a single job internally.  Spawned workers start without
+        logging handlers; *worker_logging* runs
+        :func:`~app.utils.logging.setup_logging` in each of them.
+        """
+
+        roots = [project_root(r) for r in roots]
+        flow = list(flow or DEFAULT_FLOW)
+        workers = min(resources.get_governor().workers(jobs, "tenants"), len(roots))
+        if workers <= 1:
+            return {r: self.for_root(r).run(flow, **kwargs) for r in roots}
+
+        config = str(self.config) if self.config is not None else None
+        ctx = multiprocessing.get_context("spawn")
+        results: dict[Path, int] = {}
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=ctx,
+            initializer=setup_logging if worker_logging else None,
+        ) as pool:
+            futures = {
+                r: pool.submit(_run_root, str(r), config, flow, self.max_memory, kwargs)
+                for r in roots
+            }
+            for r, future in futures.items():
+                try:
+                    results[r] = future.result()
+                except Exception as exc:  # pragma: no cover - minimal error handling
+                    logger.error("api: %s: unexpected error: %s", r, exc)
+                    results[r] = 1
+        failed = sum(1 for code in results.values() if code)
+        logger.info("api: run_many: roots=%d, failed=%d", len(roots), failed)
+        return results
+
+
+def _run_root(
+    root: str,
+    config: str | None,
+    flow: list[str],
+    max_memory: str | int | None,
+    kwargs: dict,
+) -> int:
+    # worker entry point: one job per worker, the pool provides parallelism
+    pipeline = Pipeline(root, config=config, max_memory=max_memory, jobs=1)
+    return pipeline.run(flow, **kwargs)
@@ -6,9 +6,72 @@ This module centralises file-handling helpers shared across steps.
 from __future__ import annotations
 
 from pathlib import Path
+import bz2
 import csv
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import os
+import queue
+import sqlite3
+import threading
+import zipfile
 from typing import Iterator, Iterable
 
+try:  # optional faster non-cryptographic hash
+    import xxhash  # type: ignore
+except Exception:  # pragma: no cover - optional dependency
+    xxhash = None
+
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+# compression suffix -> codec name
+COMPRESSED_SUFFIXES = {".gz": "gzip", ".bz2": "bz2", ".xz": "xz", ".zst": "zstd"}
+
+# separator between a zip archive path and a member name, e.g.
+# "data/raw/siem/2025-08.zip::siem-0812.csv"
+ZIP_MEMBER_SEP = "::"
+
+# gzip inputs larger than this are decompressed in a background thread
+THREADED_GZIP_MIN_SIZE = 32 * 1024 * 1024
+
+
+def split_member(path: str | Path) -> tuple[str, str | None]:
+    """Split ``archive.zip::member.csv`` into archive path and member name."""
+
+    text = str(path)
+    if ZIP_MEMBER_SEP in text:
+        archive, member = text.split(ZIP_MEMBER_SEP, 1)
+        return archive, member
+    return text, None
+
+
+def source_path(path: str | Path) -> Path:
+    """Return the file on disk that holds *path* (the archive for zip members)."""
+
+    return Path(split_member(path)[0])
+
+
+def logical_name(path: str | Path) -> str:
+    """Return CSV name of *path* without compression suffix or archive prefix."""
+
+    archive, member = split_member(path)
+    if member is not None:
+        return Path(member).name
+    name = Path(archive).name
+    for suffix in COMPRESSED_SUFFIXES:
+        if name.lower().endswith(suffix):
+            return name[: -len(suffix)]
+    return name
+
+
+def _is_csv_name(name: str) -> bool:
+    return name.lower().endswith(".csv")
+
 
 def list_csv_in_dir(
     dir_path: str,
@@ -17,33 +80,166 @@ def list_csv_in_dir(
 ) -> list[str]:
     """Return sorted list of CSV file paths within *dir_path*.
 
-    Files whose names end with any suffix in *ignore_suffixes* are skipped.
-    When *recursive* is True, the search descends into subdirectories.
+    Besides plain ``*.csv`` this includes compressed ``*.csv.gz``,
+    ``*.csv.bz2``, ``*.csv.xz``, ``*.csv.zst`` files and CSV members of
+    ``*.zip`` archives (as ``archive.zip::member.csv``).  Files whose CSV
+    name ends with any suffix in *ignore_suffixes* are skipped.  When
+    *recursive* is True, the search descends into subdirectories.
     """
 
     if ignore_suffixes is None:
         ignore_suffixes = ["example.csv"]
+    suffixes = [s.lower() for s in ignore_suffixes]
+
+    def _ignored(name: str) -> bool:
+        name = name.lower()
+        return any(name.endswith(s) for s in suffixes)
 
     base = Path(dir_path)
-    if recursive:
-        paths: Iterable[Path] = base.rglob("*.csv")
-    else:
-        paths = base.glob("*.csv")
+    paths: Iterable[Path] = base.rglob("*") if recursive else base.glob("*")
 
     result: list[str] = []
     for p in paths:
-        name = p.name.lower()
-        if any(name.endswith(s.lower()) for s in ignore_suffixes):
+        if not p.is_file():
+            continue
+        if p.suffix.lower() == ".zip":
+            try:
+                with zipfile.ZipFile(p) as zf:
+                    members = [i.filename for i in zf.infolist() if not i.is_dir()]
+            except zipfile.BadZipFile:
+                continue
+            for member in members:
+                if _is_csv_name(member) and not _ignored(Path(member).name):
+                    result.append(f"{p}{ZIP_MEMBER_SEP}{member}")
             continue
-        if p.is_file():
+        name = logical_name(p)
+        if _is_csv_name(name) and not _ignored(name):
             result.append(str(p))
     return sorted(result)
 
 
+class _PrefetchReader(io.RawIOBase):
+    """Raw reader that pulls chunks from *fh* in a background thread.
+
+    Decompression (e.g. :mod:`gzip`/:mod:`zlib`, which release the GIL)
+    then overlaps with CSV parsing on the consumer side.
+    """
+
+    def __init__(self, fh, chunk_size: int = HASH_CHUNK_SIZE, depth: int = 8) -> None:
+        super().__init__()
+        self._fh = fh
+        self._queue: queue.Queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._buf = b""
+        self._pos = 0
+        self._eof = False
+        self._thread = threading.Thread(
+            target=self._produce, args=(chunk_size,), name="pscope-decompress", daemon=True
+        )
+        self._thread.start()
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self, chunk_size: int) -> None:
+        try:
+            while not self._stop.is_set():
+                data = self._fh.read(chunk_size)
+                if not data:
+                    break
+                if not self._put(data):
+                    return
+            self._put(b"")
+        except BaseException as exc:  # pragma: no cover - propagated to reader
+            self._put(exc)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if self._pos >= len(self._buf):
+            if self._eof:
+                return 0
+            item = self._queue.get()
+            if isinstance(item, BaseException):
+                raise item
+            if not item:
+                self._eof = True
+                return 0
+            self._buf, self._pos = item, 0
+        n = min(len(b), len(self._buf) - self._pos)
+        b[:n] = self._buf[self._pos : self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self) -> None:
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._fh.close()
+        super().close()
+
+
+def _open_zstd(path: str):
+    try:  # Python 3.14+
+        from compression import zstd  # type: ignore
+
+        return zstd.open(path, "rb")
+    except ImportError:
+        pass
+    try:
+        import zstandard  # type: ignore
+    except ImportError:
+        raise RuntimeError(
+            f"cannot read {path}: zstd support requires the 'zstandard' module"
+        ) from None
+    raw = open(path, "rb")
+    return zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+
+
+def open_binary(path: str | Path):
+    """Open *path* for binary reading, transparently decompressing it."""
+
+    archive, member = split_member(path)
+    if member is not None:
+        zf = zipfile.ZipFile(archive)
+        try:
+            fh = zf.open(member)
+        finally:
+            # the member handle keeps its own reference to the archive file
+            zf.close()
+        return fh
+    codec = COMPRESSED_SUFFIXES.get(Path(archive).suffix.lower())
+    if codec == "gzip":
+        fh = gzip.open(archive, "rb")
+        if os.path.getsize(archive) >= THREADED_GZIP_MIN_SIZE:
+            return io.BufferedReader(_PrefetchReader(fh), buffer_size=HASH_CHUNK_SIZE)
+        return fh
+    if codec == "bz2":
+        return bz2.open(archive, "rb")
+    if codec == "xz":
+        return lzma.open(archive, "rb")
+    if codec == "zstd":
+        return _open_zstd(archive)
+    return open(archive, "rb")
+
+
+def open_text(path: str | Path) -> io.TextIOWrapper:
+    """Open CSV *path* (plain, compressed or zip member) as UTF-8 text."""
+
+    return io.TextIOWrapper(open_binary(path), encoding="utf-8", newline="")
+
+
 def read_headers(path: str) -> list[str]:
     """Return list of header names from CSV file at *path*."""
 
-    with open(path, newline="", encoding="utf-8") as fh:
+    with open_text(path) as fh:
         reader = csv.reader(fh)
         return next(reader, [])
 
@@ -51,8 +247,332 @@ def read_headers(path: str) -> list[str]:
 def open_csv_rows(path: str) -> Iterator[list[str]]:
     """Yield rows from CSV file at *path* (excluding the header)."""
 
-    with open(path, newline="", encoding="utf-8") as fh:
+    with open_text(path) as fh:
         reader = csv.reader(fh)
         next(reader, None)  # skip header
         for row in reader:
             yield row
+
+
+def open_csv_dicts(path: str) -> Iterator[dict[str, str]]:
+    """Yield rows from CSV file at *path* as ``{header: value}`` dicts."""
+
+    with open_text(path) as fh:
+        yield from csv.DictReader(fh)
+
+
+def default_hash_algo() -> str:
+    """Return preferred digest algorithm: xxh3_128 when available, else blake2b."""
+
+    return "xxh3_128" if xxhash is not None else "blake2b"
+
+
+def _new_hasher(algo: str):
+    if algo.startswith("xxh"):
+        if xxhash is None:
+            raise ValueError(f"hash algorithm {algo} requires the xxhash module")
+        return getattr(xxhash, algo)()
+    return hashlib.new(algo)
+
+
+def hash_file(path: str | Path, algo: str | None = None) -> str:
+    """Return hex digest of file at *path* computed in 1 MiB chunks."""
+
+    algo = algo or default_hash_algo()
+    with open(path, "rb") as fh:
+        hasher = _new_hasher(algo)
+        buf = bytearray(HASH_CHUNK_SIZE)
+        view = memoryview(buf)
+        while True:
+            size = fh.readinto(buf)
+            if not size:
+                break
+            hasher.update(view[:size])
+        return hasher.hexdigest()
+
+
+class FingerprintCache:
+    """Content digests cached in SQLite by ``(inode, size, mtime_ns)``.
+
+    A digest is recomputed only when the file's stat signature changes, so
+    validate, collect and later steps never hash the same unchanged file
+    twice.  Use as a context manager or call :meth:`close` to persist.
+    """
+
+    def __init__(self, db_path: str | Path, algo: str | None = None) -> None:
+        self.algo = algo or default_hash_algo()
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path))
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            "path TEXT PRIMARY KEY, inode INTEGER, size INTEGER, "
+            "mtime_ns INTEGER, algo TEXT, digest TEXT)"
+        )
+        self._pending = 0
+
+    def __enter__(self) -> "FingerprintCache":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def fingerprint(self, path: str | Path) -> dict:
+        """Return ``{size, mtime, mtime_ns, algo, digest}`` for *path*.
+
+        For zip members the fingerprint is that of the archive; compressed
+        files are fingerprinted on their compressed bytes.
+        """
+
+        path = source_path(path)
+        st = path.stat()
+        key = str(path.resolve())
+        row = self._conn.execute(
+            "SELECT inode, size, mtime_ns, algo, digest FROM fingerprints WHERE path = ?",
+            (key,),
+        ).fetchone()
+        if row is not None and row[:4] == (st.st_ino, st.st_size, st.st_mtime_ns, self.algo):
+            digest = row[4]
+        else:
+            digest = hash_file(path, self.algo)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?)",
+                (key, st.st_ino, st.st_size, st.st_mtime_ns, self.algo, digest),
+            )
+            self._pending += 1
+            if self._pending >= 1000:
+                self._conn.commit()
+                self._pending = 0
+        return {
+            "size": st.st_size,
+            "mtime": int(st.st_mtime),
+            "mtime_ns": st.st_mtime_ns,
+            "algo": self.algo,
+            "digest": digest,
+        }
+
+    def digest(self, path: str | Path) -> str:
+        """Return cached or freshly computed digest of *path*."""
+
+        return self.fingerprint(path)["digest"]
+
+    def matches(self, path: str | Path, expected: dict) -> bool:
+        """Return True when *path* still matches fingerprint *expected*.
+
+        Size must match; an identical ``mtime_ns`` is accepted without
+        hashing, otherwise the content digest decides (so a rewrite within the
+        same second is detected and a plain ``touch`` is not a change).
+        """
+
+        path = source_path(path)
+        try:
+            st = path.stat()
+        except OSError:
+            return False
+        if expected.get("size") != st.st_size:
+            return False
+        if "mtime_ns" in expected:
+            if expected["mtime_ns"] == st.st_mtime_ns:
+                return True
+        elif expected.get("mtime") == int(st.st_mtime):
+            return True
+        digest = expected.get("digest")
+        if not digest:
+            return False
+        if expected.get("algo", self.algo) != self.algo:
+            return hash_file(path, expected["algo"]) == digest
+        return self.digest(path) == digest
+
+    def close(self) -> None:
+        self._conn.commit()
+        self._conn.close()
+
+
+def open_fingerprint_cache(root: str | Path) -> FingerprintCache:
+    """Open the project fingerprint cache at ``<root>/.pscope/fingerprints.db``."""
+
+    return FingerprintCache(Path(root) / ".pscope" / "fingerprints.db")
+
+
+# output compression -> file suffix
+OUTPUT_SUFFIXES = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+OUTPUT_BUFFER_SIZE = 4 * 1024 * 1024
+
+
+class _HashingWriter(io.RawIOBase):
+    """Raw writer that hashes and counts bytes on their way to *fh*."""
+
+    def __init__(self, fh, algo: str) -> None:
+        super().__init__()
+        self._fh = fh
+        self.hasher = _new_hasher(algo)
+        self.size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.hasher.update(b)
+        self._fh.write(b)
+        n = len(b)
+        self.size += n
+        return n
+
+
+def _zstd_writer(fh, level: int):
+    try:  # Python 3.14+
+        from compression import zstd  # type: ignore
+
+        return zstd.ZstdFile(fh, "wb", level=level)
+    except ImportError:
+        pass
+    try:
+        import zstandard  # type: ignore
+    except ImportError:
+        raise RuntimeError(
+            "zstd output requires the 'zstandard' module (or Python 3.14+)"
+        ) from None
+    return zstandard.ZstdCompressor(level=level).stream_writer(fh, closefd=False)
+
+
+def sidecar_path(path: str | Path) -> Path:
+    """Return sidecar metadata path for an output whose base name is *path*.
+
+    The sidecar does not depend on compression: ``siem.csv``,
+    ``siem.csv.gz`` and ``siem.csv.zst`` all share ``siem.meta.json``.
+    """
+
+    path = Path(path)
+    name = logical_name(path)
+    if name.lower().endswith(".csv"):
+        name = name[:-4]
+    return path.with_name(f"{name}.meta.json")
+
+
+class AtomicOutput:
+    """Text output written to a temp file and renamed into place on commit.
+
+    Bytes go through a large write buffer and optional gzip/zstd compression;
+    the size and digest of the bytes on disk are computed while writing.
+    :meth:`commit` fsyncs, atomically renames the file and writes a sidecar
+    (see :func:`sidecar_path`) with row count, size and checksum, so readers
+    can verify an output without rereading it.  Leaving the ``with`` block
+    with an exception discards the temp file.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        *,
+        compression: str = "none",
+        level: int | None = None,
+        buffer_size: int = OUTPUT_BUFFER_SIZE,
+    ) -> None:
+        if compression not in OUTPUT_SUFFIXES:
+            raise ValueError(f"unknown output compression: {compression}")
+        self._base = Path(path)
+        self.path = self._base.with_name(self._base.name + OUTPUT_SUFFIXES[compression])
+        self.compression = compression
+        self.algo = default_hash_algo()
+        self.rows = 0
+        self._tmp = self.path.with_name(self.path.name + ".tmp")
+        self._raw = open(self._tmp, "wb", buffering=buffer_size)
+        self._hashing = _HashingWriter(self._raw, self.algo)
+        if compression == "gzip":
+            self._codec = gzip.GzipFile(
+                fileobj=self._hashing, mode="wb", compresslevel=level or 1, mtime=0
+            )
+        elif compression == "zstd":
+            self._codec = _zstd_writer(self._hashing, level or 3)
+        else:
+            self._codec = None
+        sink = self._codec if self._codec is not None else self._hashing
+        self._buffer = io.BufferedWriter(sink, buffer_size=buffer_size)
+        self.stream = io.TextIOWrapper(self._buffer, encoding="utf-8", newline="")
+        self._closed = False
+
+    def __enter__(self) -> "AtomicOutput":
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is not None:
+            self.abort()
+
+    def _close_streams(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        # detach (not close) the wrappers so the temp file stays open for fsync
+        self.stream.detach()
+        self._buffer.detach()
+        if self._codec is not None:
+            self._codec.close()
+        self._raw.flush()
+
+    def commit(self, **extra) -> dict:
+        """Finish writing, rename into place and write the sidecar.
+
+        Returns the sidecar contents; *extra* keys are stored in it as well.
+        """
+
+        self._close_streams()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+        os.replace(self._tmp, self.path)
+
+        # drop outputs of the same dataset left over with another compression
+        for suffix in OUTPUT_SUFFIXES.values():
+            other = self._base.with_name(self._base.name + suffix)
+            if other != self.path and other.exists():
+                other.unlink()
+
+        meta = {
+            "path": self.path.name,
+            "compression": self.compression,
+            "rows": self.rows,
+            "size": self._hashing.size,
+            "algo": self.algo,
+            "digest": self._hashing.hasher.hexdigest(),
+            **extra,
+        }
+        side = sidecar_path(self.path)
+        tmp_side = side.with_name(side.name + ".tmp")
+        tmp_side.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        tmp_side.replace(side)
+        return meta
+
+    def abort(self) -> None:
+        """Discard the temp file."""
+
+        try:
+            self._close_streams()
+        except Exception:
+            pass
+        self._raw.close()
+        self._tmp.unlink(missing_ok=True)
+
+
+def read_output(path: str | Path, *, verify_digest: bool = False) -> Path | None:
+    """Return committed output for base path *path* if its sidecar checks out.
+
+    *path* is the uncompressed name (e.g. ``data/stage/collect/siem.csv``);
+    the actual file name comes from the sidecar.  The size is always checked
+    against the sidecar; with *verify_digest* the content digest is too.
+    Returns ``None`` when the output is missing, truncated or uncommitted.
+    """
+
+    side = sidecar_path(path)
+    try:
+        meta = json.loads(side.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    out = side.with_name(meta.get("path", ""))
+    try:
+        if out.stat().st_size != meta.get("size"):
+            return None
+    except OSError:
+        return None
+    if verify_digest and hash_file(out, meta.get("algo")) != meta.get("digest"):
+        return None
+    return out
@@ -0,0 +1,322 @@
+"""Hive-style partitioned dataset outputs.
+
+With ``collect.partition`` enabled a dataset is written as::
+
+    data/stage/collect/<ds>/v<ns>/date=2025-08-12/source=10.0.0.10/part-0.csv
+    data/stage/collect/<ds>/_index.json
+
+instead of a single ``<ds>.csv``.  Partition keys are canonical fields;
+``date`` values (epoch ms or UniFi dates) are bucketed per UTC day and other
+values are used as is (percent-encoded where needed).  ``_index.json`` lists
+every partition with its key values and row count, so readers can prune
+partitions by predicate without listing directories.
+
+:class:`PartitionWriter` keeps at most ``max_open`` part files open (least
+recently used ones are closed and reopened for append) and builds the tree in
+a new version directory (``<ds>/v<ns>/``) next to the current one.
+:meth:`commit` publishes it with a single ``os.replace`` of ``_index.json``,
+whose partition paths point into that version, and only then removes older
+versions, so a crash at any point leaves the previous or the new tree
+readable.  :func:`map_partitions` runs inputs under ``PROCESS_MIN_BYTES``
+in-process, where starting a process pool costs more than it saves.
+"""
+
+from __future__ import annotations
+
+import csv
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Iterable, Iterator, NamedTuple
+from urllib.parse import quote
+
+from app.collectors.files import read_output, sidecar_path
+from app.utils.dates import to_day
+from app.utils.resources import get_governor
+
+
+INDEX_NAME = "_index.json"
+PART_NAME = "part-0.csv"
+# value used for empty/unparsable keys (same as Hive)
+DEFAULT_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+# partition keys whose values are bucketed per day
+DATE_KEYS = frozenset({"date", "firstDate", "lastDate"})
+DEFAULT_MAX_OPEN = 64
+# prefix of version directories holding the partition trees
+VERSION_PREFIX = "v"
+# total input size below which map_partitions does not start a process pool
+PROCESS_MIN_BYTES = 32 * 1024 * 1024
+
+
+def partition_value(key: str, value: str | None) -> str:
+    """Return the partition value of field *key* for row *value*."""
+
+    if key in DATE_KEYS:
+        return to_day(value) or DEFAULT_PARTITION
+    value = (value or "").strip()
+    return value or DEFAULT_PARTITION
+
+
+def _segment(key: str, value: str) -> str:
+    return f"{key}={quote(value, safe=' .-_:')}"
+
+
+class PartitionWriter:
+    """Write rows of one dataset into Hive-style partition files."""
+
+    def __init__(
+        self,
+        base_dir: str | Path,
+        keys: list[str],
+        fields: list[str],
+        *,
+        max_open: int = DEFAULT_MAX_OPEN,
+    ) -> None:
+        self.base_dir = Path(base_dir)
+        self.keys = keys
+        self.fields = fields
+        self.max_open = max(int(max_open), 1)
+        self._key_idx = [fields.index(k) for k in keys]
+        self._version = f"{VERSION_PREFIX}{time.time_ns()}"
+        self._staging = self.base_dir / self._version
+        self._staging.mkdir(parents=True)
+        self._open: OrderedDict[tuple[str, ...], tuple] = OrderedDict()
+        self._parts: dict[tuple[str, ...], dict] = {}
+        self.rows = 0
+        self.reopened = 0
+
+    def __enter__(self) -> "PartitionWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.abort()
+
+    def _writer(self, values: tuple[str, ...]):
+        handle = self._open.get(values)
+        if handle is not None:
+            self._open.move_to_end(values)
+            return handle[1]
+        part = self._parts.get(values)
+        if part is None:
+            rel = "/".join(_segment(k, v) for k, v in zip(self.keys, values))
+            rel = f"{rel}/{PART_NAME}"
+            path = self._staging / rel
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fh = path.open("w", newline="", encoding="utf-8")
+            writer = csv.writer(fh)
+            writer.writerow(self.fields)
+            self._parts[values] = {"path": rel, "rows": 0}
+        else:
+            fh = (self._staging / part["path"]).open("a", newline="", encoding="utf-8")
+            writer = csv.writer(fh)
+            self.reopened += 1
+        if len(self._open) >= self.max_open:
+            _, (old_fh, _) = self._open.popitem(last=False)
+            old_fh.close()
+        self._open[values] = (fh, writer)
+        return writer
+
+    def write(self, row: list[str]) -> None:
+        values = tuple(
+            partition_value(k, row[i] if i < len(row) else "")
+            for k, i in zip(self.keys, self._key_idx)
+        )
+        self._writer(values).writerow(row)
+        self._parts[values]["rows"] += 1
+        self.rows += 1
+
+    def _close_files(self) -> None:
+        while self._open:
+            _, (fh, _) = self._open.popitem()
+            fh.close()
+
+    def commit(self, **extra) -> dict:
+        """Write the index and replace the previous partition tree."""
+
+        self._close_files()
+        partitions = []
+        for values, part in sorted(self._parts.items()):
+            partitions.append(
+                {
+                    "path": f"{self._version}/{part['path']}",
+                    "values": dict(zip(self.keys, values)),
+                    "rows": part["rows"],
+                    "size": (self._staging / part["path"]).stat().st_size,
+                }
+            )
+        index = {
+            **extra,
+            "keys": self.keys,
+            "fields": self.fields,
+            "rows": self.rows,
+            "partitions": partitions,
+            "created": datetime.utcnow().isoformat() + "Z",
+        }
+        tmp = self.base_dir / (INDEX_NAME + ".tmp")
+        tmp.write_text(json.dumps(index, indent=2, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.base_dir / INDEX_NAME)
+        # older versions, trees of interrupted writers and pre-version layouts
+        for entry in self.base_dir.iterdir():
+            if entry.name in (INDEX_NAME, self._version):
+                continue
+            if entry.is_dir():
+                shutil.rmtree(entry, ignore_errors=True)
+            else:
+                entry.unlink(missing_ok=True)
+        return index
+
+    def abort(self) -> None:
+        self._close_files()
+        shutil.rmtree(self._staging, ignore_errors=True)
+
+
+# --- reading ---------------------------------------------------------------
+
+
+class Partition(NamedTuple):
+    path: Path
+    values: dict[str, str]
+    rows: int
+
+
+def load_index(ds_dir: str | Path) -> dict | None:
+    """Return the partition index of dataset directory *ds_dir* or ``None``."""
+
+    try:
+        return json.loads((Path(ds_dir) / INDEX_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _matches(values: dict[str, str], where) -> bool:
+    if where is None:
+        return True
+    if callable(where):
+        return bool(where(values))
+    for key, cond in where.items():
+        value = values.get(key)
+        if callable(cond):
+            if not cond(value):
+                return False
+        elif isinstance(cond, (set, frozenset, list, tuple)):
+            if value not in cond:
+                return False
+        elif value != cond:
+            return False
+    return True
+
+
+def list_partitions(ds_dir: str | Path, where=None) -> list[Partition]:
+    """Return partitions of *ds_dir* whose key values satisfy *where*.
+
+    *where* is either a callable receiving the ``{key: value}`` dict of a
+    partition or a mapping ``key -> condition`` where a condition is a value,
+    a collection of values or a callable, e.g.
+    ``{"date": lambda d: "2025-08-01" <= d <= "2025-08-07"}``.
+    """
+
+    ds_dir = Path(ds_dir)
+    index = load_index(ds_dir)
+    if index is None:
+        return []
+    return [
+        Partition(ds_dir / p["path"], p["values"], p.get("rows", 0))
+        for p in index.get("partitions") or []
+        if _matches(p["values"], where)
+    ]
+
+
+def dataset_files(collect_dir: str | Path, ds_name: str, where=None) -> list[Path]:
+    """Return collect output files of *ds_name*.
+
+    Partitioned datasets give their (pruned) part files; otherwise the
+    committed single output is returned, to which *where* does not apply.
+    """
+
+    collect_dir = Path(collect_dir)
+    ds_dir = collect_dir / ds_name
+    if (ds_dir / INDEX_NAME).exists():
+        return [p.path for p in list_partitions(ds_dir, where)]
+    out = read_output(collect_dir / f"{ds_name}.csv")
+    return [out] if out is not None else []
+
+
+def dataset_rows(collect_dir: str | Path, ds_name: str) -> int:
+    """Return the row count of *ds_name*'s collect output without reading it.
+
+    Counts come from ``_index.json`` or the output sidecar; ``0`` when there
+    is no committed output.
+    """
+
+    collect_dir = Path(collect_dir)
+    ds_dir = collect_dir / ds_name
+    if (ds_dir / INDEX_NAME).exists():
+        return sum(p.rows for p in list_partitions(ds_dir))
+    base = collect_dir / f"{ds_name}.csv"
+    if read_output(base) is None:
+        return 0
+    try:
+        meta = json.loads(sidecar_path(base).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return 0
+    return int(meta.get("rows") or 0)
+
+
+def iter_rows(partitions: Iterable[Partition | Path]) -> Iterator[dict[str, str]]:
+    """Yield rows of *partitions* one after another as dicts."""
+
+    for part in partitions:
+        path = part.path if isinstance(part, Partition) else part
+        with open(path, newline="", encoding="utf-8") as fh:
+            yield from csv.DictReader(fh)
+
+
+def _item_size(item) -> int:
+    path = item.path if isinstance(item, Partition) else item
+    try:
+        return os.stat(path).st_size
+    except (OSError, TypeError):
+        # not a file: assume it is worth a worker
+        return PROCESS_MIN_BYTES
+
+
+def map_partitions(
+    func: Callable,
+    items: Iterable,
+    *,
+    jobs: int | None = None,
+    processes: bool = True,
+) -> Iterator:
+    """Apply *func* to every item (partition or path) in parallel.
+
+    Results are yielded in the order of *items*.  With *processes* a process
+    pool is used (*func* must be picklable, i.e. a module-level function;
+    workers are spawned, not forked, as the logging thread may hold locks),
+    otherwise a thread pool.  The worker count is capped by the resource
+    governor; a single item, ``jobs=1`` or, for processes, items totalling
+    less than :data:`PROCESS_MIN_BYTES` run inline.
+    """
+
+    items = list(items)
+    jobs = min(get_governor().workers(jobs, "partitions"), len(items))
+    if jobs > 1 and processes and sum(map(_item_size, items)) < PROCESS_MIN_BYTES:
+        jobs = 1
+    if jobs <= 1:
+        for item in items:
+            yield func(item)
+        return
+    if processes:
+        pool = ProcessPoolExecutor(
+            max_workers=jobs, mp_context=multiprocessing.get_context("spawn")
+        )
+    else:
+        pool = ThreadPoolExecutor(max_workers=jobs)
+    with pool:
+        yield from pool.map(func, items)
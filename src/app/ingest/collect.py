@@ -3,7 +3,17 @@
 This step reads the manifest produced by :mod:`validate` and for each
 dataset that contains validated files exports a single CSV file under
 ``data/stage/collect``.  Only canonical fields described in the manifest are
-written and real headers are renamed to their canonical counterparts.
+written: each file's header row is resolved to canonical fields (see
+:mod:`app.utils.headers`), so files using different header aliases are merged
+in one pass and fields missing from a file are left empty.
+Each output is written to a temporary file (optionally gzip/zstd
+compressed, ``collect.output``) and renamed into place only once the dataset
+is complete, together with a ``<dataset>.meta.json`` sidecar holding the row
+count and checksum.  Datasets listed under ``collect.partition.datasets``
+are written as Hive-style partitions instead (see
+:mod:`app.collectors.partitions`).  With ``collect.dedup.enabled``, datasets
+listed under ``collect.dedup.keys`` in ``configs/schemas.yml`` are
+de-duplicated on those canonical fields (see :mod:`app.ingest.dedup`).
 
 The implementation intentionally avoids external dependencies and relies only
 on the Python standard library.
@@ -11,12 +21,26 @@ on the Python standard library.
 
 from __future__ import annotations
 
-import json
-import hashlib
 from pathlib import Path
 import csv
-from collections import OrderedDict
-
+import shutil
+from typing import Iterator
+
+from app.collectors.files import (
+    OUTPUT_SUFFIXES,
+    AtomicOutput,
+    FingerprintCache,
+    open_fingerprint_cache,
+    open_text,
+    sidecar_path,
+)
+from app.collectors.partitions import DEFAULT_MAX_OPEN, INDEX_NAME, PartitionWriter
+from app.ingest.dedup import Deduplicator
+from app.pipeline.journal import RunJournal
+from app.utils.config import load_yaml
+from app.utils.headers import HeaderResolver, get_resolver
+from app.utils.paths import project_root, schemas_path
+from app.validate.manifests import load_latest
 from app.pipeline.status import DONE
 from app.utils.logging import get_logger
 
@@ -24,155 +48,274 @@ from app.utils.logging import get_logger
 logger = get_logger(__name__)
 
 
-def _hash_file(path: Path) -> str:
-    data = path.read_bytes()
-    return hashlib.sha256(data).hexdigest()
-
-
-def _current_schemas_hash(root: Path) -> str:
-    cfg = root / "configs" / "schemas.yml"
-    return _hash_file(cfg)
-
-
-def _verify_fingerprints(manifest: dict, root: Path) -> bool:
+def _verify_fingerprints(manifest: dict, root: Path, fingerprints: FingerprintCache) -> bool:
     for ds in manifest.get("datasets", {}).values():
         for info in ds.get("files", []):
-            file_path = root / info["path"]
-            if not file_path.exists():
-                return False
-            stat = file_path.stat()
-            fp = info.get("fingerprint", {})
-            if fp.get("size") != stat.st_size or fp.get("mtime") != int(stat.st_mtime):
+            if not fingerprints.matches(root / info["path"], info.get("fingerprint", {})):
                 return False
     return True
 
 
-def run(*, validated_manifest: dict | None = None, **kwargs) -> int:  # noqa: D401
-    """Run the collect step."""
+class _StaleInput(Exception):
+    """Raised when an input file no longer matches the manifest."""
+
+
+def _iter_rows(
+    root: Path,
+    ds_name: str,
+    files: list[dict],
+    fields: list[str],
+    resolver: HeaderResolver,
+    counter: list[int],
+) -> Iterator[list[str]]:
+    """Yield rows of all *files* projected onto canonical *fields*.
+
+    Column positions are resolved per file from its own header row; fields a
+    file does not have are emitted as empty strings.  ``counter[0]`` is
+    incremented for every input row.
+    """
+
+    for info in files:
+        rel_path = info.get("path", "")
+        file_path = root / rel_path
+        try:
+            with open_text(file_path) as in_fh:
+                reader = csv.reader(in_fh)
+                found = resolver.resolve(ds_name, next(reader, []))
+                missing = [c for c in info.get("columns_present") or [] if c not in found]
+                if missing:
+                    raise _StaleInput(
+                        f"{ds_name}: missing column(s) {','.join(missing)} in "
+                        f"{rel_path} -> run 'validate'"
+                    )
+                indexes = [found[c][1] if c in found else -1 for c in fields]
+                for row in reader:
+                    counter[0] += 1
+                    width = len(row)
+                    yield [row[i] if 0 <= i < width else "" for i in indexes]
+        except FileNotFoundError:
+            raise _StaleInput(
+                f"{ds_name}: file not found {rel_path} -> run 'validate'"
+            ) from None
+
+
+def run(
+    *,
+    validated_manifest: dict | None = None,
+    datasets: list[str] | None = None,
+    allow_sampled: bool = False,
+    journal: RunJournal | None = None,
+    root: str | Path | None = None,
+    config_file: str | Path | None = None,
+    **kwargs,
+) -> int:  # noqa: D401
+    """Run the collect step.
+
+    When *datasets* is given only those datasets are verified and written.
+    Each written dataset is checkpointed in the run *journal*; datasets it
+    already records with unchanged outputs are not written again.  A manifest
+    from ``validate --sample`` is refused unless *allow_sampled* is set.
+    """
     try:
-        root = Path(__file__).resolve().parents[3]
-        manifest_path = root / ".pscope" / "latest.json"
+        root = project_root(root)
+        config_path = schemas_path(root, config_file)
         if validated_manifest is None:
-            if not manifest_path.exists():
+            manifest = load_latest(root)
+            if manifest is None:
                 logger.error("collect: manifest missing -> run 'validate' first")
                 return 1
-            manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
         else:
             manifest = validated_manifest
 
-        datasets = manifest.get("datasets", {})
+        if manifest.get("sampled"):
+            if not allow_sampled:
+                logger.error(
+                    "collect: manifest is sampled (sample=%s) -> run full 'validate' "
+                    "or pass --allow-sampled",
+                    manifest.get("sample", ""),
+                )
+                return 1
+            logger.warning(
+                "collect: using sampled manifest (sample=%s): content was not fully checked",
+                manifest.get("sample", ""),
+            )
+
+        selected = manifest.get("datasets", {})
+        if datasets:
+            selected = {k: v for k, v in selected.items() if k in datasets}
         logger.info(
             "collect: using manifest %s (schemas_hash=%s, datasets=%d)",
-            str(manifest_path),
+            manifest.get("run_id", ""),
             manifest.get("schemas_hash", ""),
-            len(datasets),
+            len(selected),
         )
 
-        current_hash = _current_schemas_hash(root)
-        if manifest.get("schemas_hash") != current_hash:
-            logger.error("collect: manifest stale (schema changed) -> run 'validate'")
-            return 1
+        with open_fingerprint_cache(root) as fingerprints:
+            current_hash = fingerprints.digest(config_path)
+            if manifest.get("schemas_hash") != current_hash:
+                logger.error("collect: manifest stale (schema changed) -> run 'validate'")
+                return 1
 
-        if not _verify_fingerprints(manifest, root):
-            logger.error("collect: manifest stale (inputs changed) -> run 'validate'")
-            return 1
+            if not _verify_fingerprints({"datasets": selected}, root, fingerprints):
+                logger.error("collect: manifest stale (inputs changed) -> run 'validate'")
+                return 1
 
         out_dir = root / "data" / "stage" / "collect"
         out_dir.mkdir(parents=True, exist_ok=True)
 
+        config = load_yaml(config_path)
+        resolver = get_resolver(config.get("validate") or {}, current_hash)
+        collect_cfg = config.get("collect") or {}
+        dedup_cfg = collect_cfg.get("dedup") or {}
+        dedup_enabled = bool(dedup_cfg.get("enabled"))
+        dedup_keys: dict[str, list[str]] = dedup_cfg.get("keys") or {}
+        dedup_budget = int(float(dedup_cfg.get("memory_budget_mb", 256)) * 1024 * 1024)
+        output_cfg = collect_cfg.get("output") or {}
+        out_compression = str(output_cfg.get("compression") or "none").lower()
+        out_level = output_cfg.get("level")
+        out_buffer = int(float(output_cfg.get("buffer_mb", 4)) * 1024 * 1024)
+        partition_cfg = collect_cfg.get("partition") or {}
+        partition_keys: dict[str, list[str]] = (
+            partition_cfg.get("datasets") or {} if partition_cfg.get("enabled") else {}
+        )
+        partition_max_open = int(partition_cfg.get("max_open_files", DEFAULT_MAX_OPEN))
+
         datasets_written = 0
 
-        for ds_name, ds in datasets.items():
+        for ds_name, ds in selected.items():
             files = ds.get("files") or []
             if not files:
                 logger.info("collect: skipped %s: no files", ds_name)
                 continue
+            if journal is not None and journal.unit_done("collect", ds_name):
+                logger.info(
+                    "collect: %s: done in run %s -> skipped", ds_name, journal.run_id
+                )
+                datasets_written += 1
+                continue
 
-            # Build canonical field order and headers map common to all files
-            fields_order: list[str] = []
-            headers_map: OrderedDict[str, str] = OrderedDict()
-
-            first = True
+            # union of canonical fields over all files, in schema order
+            present: set[str] = set()
             for info in files:
-                file_map = info.get("headers_map") or {}
-                if first:
-                    # preserve order from columns_present if available
-                    order = info.get("columns_present") or list(file_map.keys())
-                    for canon in order:
-                        real = file_map.get(canon)
-                        if real:
-                            headers_map[canon] = real
-                            fields_order.append(canon)
-                    first = False
-                else:
-                    # keep only fields present with identical headers
-                    to_drop = [
-                        canon
-                        for canon, real in headers_map.items()
-                        if file_map.get(canon) != real
-                    ]
-                    for canon in to_drop:
-                        headers_map.pop(canon, None)
-                        if canon in fields_order:
-                            fields_order.remove(canon)
-
-            canon_fields_ds = fields_order
-            if not canon_fields_ds:
+                present.update(info.get("columns_present") or [])
+            schema_order = list(resolver.fields.get(ds_name, {}))
+            fields_order = [c for c in schema_order if c in present]
+            fields_order += sorted(present.difference(schema_order))
+            if not fields_order:
                 logger.info("collect: skipped %s: no fields", ds_name)
                 continue
 
             out_path = out_dir / f"{ds_name}.csv"
+            part_fields = partition_keys.get(ds_name)
+            if part_fields:
+                unknown = [k for k in part_fields if k not in fields_order]
+                if unknown:
+                    logger.error(
+                        "collect: %s: partition field(s) %s not collected",
+                        ds_name,
+                        ",".join(unknown),
+                    )
+                    return 1
+                out_name = "/".join(
+                    [str((out_dir / ds_name).relative_to(root)), "v*"]
+                    + [f"{k}=*" for k in part_fields]
+                )
+            else:
+                out_name = str(out_path.relative_to(root)) + OUTPUT_SUFFIXES.get(
+                    out_compression, ""
+                )
             logger.info(
                 "collect: %s: files=%d, fields=[%s] -> out=%s",
                 ds_name,
                 len(files),
-                ",".join(canon_fields_ds),
-                str(out_path.relative_to(root)),
+                ",".join(fields_order),
+                out_name,
             )
 
-            rows_in = 0
+            dedup = None
+            key_fields = dedup_keys.get(ds_name) if dedup_enabled else None
+            if key_fields:
+                unknown = [k for k in key_fields if k not in fields_order]
+                if unknown:
+                    logger.error(
+                        "collect: %s: dedup key field(s) %s not collected",
+                        ds_name,
+                        ",".join(unknown),
+                    )
+                    return 1
+                dedup = Deduplicator(
+                    [fields_order.index(k) for k in key_fields],
+                    dedup_budget,
+                    out_dir,
+                )
+
+            counter = [0]
+            rows = _iter_rows(root, ds_name, files, fields_order, resolver, counter)
+            if dedup is not None:
+                rows = dedup.process(rows)
+
             rows_out = 0
-            real_headers = [headers_map[c] for c in canon_fields_ds]
-
-            with out_path.open("w", newline="", encoding="utf-8") as out_fh:
-                writer = csv.writer(out_fh)
-                writer.writerow(canon_fields_ds)
-
-                for info in files:
-                    file_path = root / info.get("path", "")
-                    rel_path = info.get("path", "")
-                    try:
-                        with file_path.open("r", newline="", encoding="utf-8") as in_fh:
-                            reader = csv.DictReader(in_fh)
-                            if reader.fieldnames is None:
-                                reader.fieldnames = []
-                            missing = [
-                                h for h in real_headers if h not in reader.fieldnames
-                            ]
-                            if missing:
-                                logger.error(
-                                    "collect: %s: missing column(s) %s in %s -> run 'validate'",
-                                    ds_name,
-                                    ",".join(missing),
-                                    rel_path,
-                                )
-                                return 1
-
-                            for row in reader:
-                                rows_in += 1
-                                writer.writerow([row.get(h, "") for h in real_headers])
-                                rows_out += 1
-                    except FileNotFoundError:
-                        logger.error(
-                            "collect: %s: file not found %s -> run 'validate'",
-                            ds_name,
-                            rel_path,
-                        )
-                        return 1
+            try:
+                if part_fields:
+                    with PartitionWriter(
+                        out_dir / ds_name,
+                        part_fields,
+                        fields_order,
+                        max_open=partition_max_open,
+                    ) as parts:
+                        for row in rows:
+                            parts.write(row)
+                        rows_out = parts.rows
+                        index = parts.commit(dataset=ds_name)
+                    outputs = [out_dir / ds_name / INDEX_NAME] + [
+                        out_dir / ds_name / p["path"] for p in index["partitions"]
+                    ]
+                    # drop the single-file output of earlier runs
+                    for suffix in OUTPUT_SUFFIXES.values():
+                        out_path.with_name(out_path.name + suffix).unlink(missing_ok=True)
+                    sidecar_path(out_path).unlink(missing_ok=True)
+                    logger.info(
+                        "collect: %s: partitions=%d, reopened=%d",
+                        ds_name,
+                        len(index["partitions"]),
+                        parts.reopened,
+                    )
+                else:
+                    with AtomicOutput(
+                        out_path,
+                        compression=out_compression,
+                        level=out_level,
+                        buffer_size=out_buffer,
+                    ) as output:
+                        writer = csv.writer(output.stream)
+                        writer.writerow(fields_order)
+                        for row in rows:
+                            writer.writerow(row)
+                            rows_out += 1
+                        output.rows = rows_out
+                        meta = output.commit(dataset=ds_name, fields=fields_order)
+                    outputs = [out_path.with_name(meta["path"]), sidecar_path(out_path)]
+                    # drop partitions of earlier runs
+                    shutil.rmtree(out_dir / ds_name, ignore_errors=True)
+            except _StaleInput as exc:
+                logger.error("collect: %s", exc)
+                return 1
 
-            logger.info(
-                "collect: %s: rows_in=%d, rows_out=%d", ds_name, rows_in, rows_out
-            )
+            if dedup is not None:
+                logger.info(
+                    "collect: %s: rows_in=%d, rows_out=%d, duplicates=%d, spill_runs=%d",
+                    ds_name,
+                    counter[0],
+                    rows_out,
+                    dedup.duplicates,
+                    dedup.runs,
+                )
+            else:
+                logger.info(
+                    "collect: %s: rows_in=%d, rows_out=%d", ds_name, counter[0], rows_out
+                )
+            if journal is not None:
+                journal.unit_finished("collect", ds_name, outputs)
             datasets_written += 1
 
         logger.info("collect: done (datasets_written=%d)", datasets_written)
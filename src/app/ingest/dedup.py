@@ -0,0 +1,180 @@
+"""Row de-duplication for collect output.
+
+Rows are identified by a digest of their canonical key fields.  While the set
+of seen digests fits the memory budget, duplicates are dropped on the fly and
+unique rows keep their input order.  Once the budget is exceeded the
+deduplicator switches to an external merge sort: the seen digests and every
+further row are spilled to sorted run files under a temporary directory, the
+runs are merged with :func:`heapq.merge` and the first occurrence of each key
+is emitted (rows after the switch come out in key order).  At most
+:data:`MERGE_FAN_IN` runs are open at once: larger run sets are first merged
+in passes into fewer, longer runs.  The switch also
+happens when the process RSS nears the run's memory budget (see
+:mod:`app.utils.resources`).
+"""
+
+from __future__ import annotations
+
+import csv
+import hashlib
+import heapq
+import tempfile
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from app.utils.logging import get_logger
+from app.utils.resources import Governor, get_governor
+
+
+logger = get_logger(__name__)
+
+# rough per-entry cost of a 16-byte digest in a Python set
+_SEEN_ENTRY_BYTES = 96
+# rough fixed cost of a buffered row in spill mode (tuple, list, str headers)
+_ROW_OVERHEAD_BYTES = 160
+# rows between RSS checks
+_RSS_CHECK_EVERY = 8192
+# run files merged (and held open) at once
+MERGE_FAN_IN = 64
+
+
+def _digest(key: str) -> bytes:
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+class Deduplicator:
+    """Drop rows whose key fields repeat an earlier row.
+
+    *key_indexes* are positions of the key fields within each row and
+    *memory_budget* is the approximate number of bytes the deduplicator may
+    hold before spilling to *tmp_dir*.
+    """
+
+    def __init__(
+        self,
+        key_indexes: list[int],
+        memory_budget: int,
+        tmp_dir: Path,
+        governor: Governor | None = None,
+    ) -> None:
+        self.key_indexes = key_indexes
+        self.governor = governor or get_governor()
+        self.memory_budget = max(self.governor.memory_budget(memory_budget, "dedup"), 1)
+        self.tmp_dir = tmp_dir
+        self.rows_in = 0
+        self.rows_out = 0
+        self.runs = 0
+
+    @property
+    def duplicates(self) -> int:
+        return self.rows_in - self.rows_out
+
+    @property
+    def spilled(self) -> bool:
+        return self.runs > 0
+
+    def _key(self, row: list[str]) -> bytes:
+        return _digest("\x1f".join(row[i] if i < len(row) else "" for i in self.key_indexes))
+
+    def process(self, rows: Iterable[list[str]]) -> Iterator[list[str]]:
+        """Yield unique rows from *rows*."""
+
+        seen: set[bytes] = set()
+        max_seen = self.memory_budget // _SEEN_ENTRY_BYTES
+        it = iter(rows)
+        for row in it:
+            self.rows_in += 1
+            key = self._key(row)
+            if key in seen:
+                continue
+            seen.add(key)
+            self.rows_out += 1
+            yield row
+            if len(seen) >= max_seen or (
+                self.rows_in % _RSS_CHECK_EVERY == 0 and self.governor.should_spill("dedup")
+            ):
+                logger.info(
+                    "collect: dedup: memory budget reached (keys=%d) -> external sort",
+                    len(seen),
+                )
+                yield from self._external(seen, it)
+                return
+
+    def _write_run(self, workdir: Path, entries: list[tuple[str, int, list[str]]]) -> Path:
+        entries.sort(key=lambda e: (e[0], e[1]))
+        path = workdir / f"run-{self.runs:05d}.csv"
+        self._write_entries(path, entries)
+        self.runs += 1
+        return path
+
+    @staticmethod
+    def _write_entries(path: Path, entries: Iterable[tuple[str, int, list[str]]]) -> None:
+        with path.open("w", newline="", encoding="utf-8") as fh:
+            writer = csv.writer(fh)
+            for key, seq, row in entries:
+                writer.writerow([key, seq, *row])
+
+    @staticmethod
+    def _read_run(path: Path) -> Iterator[tuple[str, int, list[str]]]:
+        with path.open(newline="", encoding="utf-8") as fh:
+            for rec in csv.reader(fh):
+                yield rec[0], int(rec[1]), rec[2:]
+
+    def _external(self, seen: set[bytes], rows: Iterator[list[str]]) -> Iterator[list[str]]:
+        with tempfile.TemporaryDirectory(dir=self.tmp_dir, prefix=".dedup-") as tmp:
+            workdir = Path(tmp)
+            # keys already emitted sort before any row with the same key
+            run_paths = [self._write_run(workdir, [(k.hex(), -1, []) for k in seen])]
+            seen.clear()
+
+            buffer: list[tuple[str, int, list[str]]] = []
+            buffered = 0
+            seq = 0
+            for row in rows:
+                self.rows_in += 1
+                buffer.append((self._key(row).hex(), seq, row))
+                seq += 1
+                buffered += _ROW_OVERHEAD_BYTES + sum(len(v) for v in row)
+                if buffered >= self.memory_budget or (
+                    seq % _RSS_CHECK_EVERY == 0 and self.governor.should_spill("dedup")
+                ):
+                    run_paths.append(self._write_run(workdir, buffer))
+                    buffer = []
+                    buffered = 0
+            if buffer:
+                run_paths.append(self._write_run(workdir, buffer))
+                buffer = []
+
+            passes = 0
+            while len(run_paths) > MERGE_FAN_IN:
+                passes += 1
+                merged_paths = []
+                for i in range(0, len(run_paths), MERGE_FAN_IN):
+                    group = run_paths[i : i + MERGE_FAN_IN]
+                    path = workdir / f"merge-{passes:02d}-{len(merged_paths):05d}.csv"
+                    self._write_entries(path, self._merge(group))
+                    for old in group:
+                        old.unlink()
+                    merged_paths.append(path)
+                run_paths = merged_paths
+            if passes:
+                logger.info(
+                    "collect: dedup: %d runs merged in %d pass(es)", self.runs, passes
+                )
+
+            for key, seq, row in self._merge(run_paths):
+                if seq < 0:
+                    continue
+                self.rows_out += 1
+                yield row
+
+    def _merge(self, paths: list[Path]) -> Iterator[tuple[str, int, list[str]]]:
+        """Merge sorted runs at *paths*, keeping the first entry of each key."""
+
+        merged = heapq.merge(*(self._read_run(p) for p in paths), key=lambda e: (e[0], e[1]))
+        last_key = None
+        for entry in merged:
+            if entry[0] == last_key:
+                continue
+            last_key = entry[0]
+            yield entry
@@ -70,6 +70,11 @@ def _run_handler(args: List[str]) -> int:
     parser.add_argument("--dry-run", dest="dry_run", action="store_true")
     parser.add_argument("--clean-first", dest="clean_first", action="store_true")
     parser.add_argument("--yes", action="store_true")
+    parser.add_argument("--max-memory", dest="max_memory")
+    parser.add_argument("--jobs", type=int)
+    parser.add_argument("--resume", nargs="?", const="", default=None)
+    parser.add_argument("--sample")
+    parser.add_argument("--allow-sampled", dest="allow_sampled", action="store_true")
 
     try:
         ns = parser.parse_args(args)
@@ -85,6 +90,24 @@ def _run_handler(args: List[str]) -> int:
         return 2
 
     from app.pipeline import flows, runner
+    from app.utils import resources
+
+    if ns.jobs is not None and ns.jobs < 1:
+        logger.error("run: --jobs must be >= 1")
+        return 2
+    if ns.sample is not None:
+        from app.validate.sampling import parse_sample
+
+        try:
+            parse_sample(ns.sample)
+        except ValueError as exc:
+            logger.error("run: --sample: %s", exc)
+            return 2
+    try:
+        governor = resources.configure(max_memory=ns.max_memory, jobs=ns.jobs)
+    except ValueError as exc:
+        logger.error("run: --max-memory: %s", exc)
+        return 2
 
     steps = flows.STEPS
 
@@ -95,6 +118,29 @@ def _run_handler(args: List[str]) -> int:
         logger.error("run: --only is mutually exclusive with --from/--to/--skip")
         return 2
 
+    if ns.resume is not None:
+        if ns.only or ns.from_step or ns.to_step or ns.skip or ns.sample:
+            logger.error(
+                "run: --resume is mutually exclusive with --only/--from/--to/--skip/--sample"
+            )
+            return 2
+        from app.pipeline.journal import RunJournal
+        from app.utils.paths import project_root
+
+        journal = RunJournal.load(project_root(), ns.resume or None)
+        if journal is None and ns.resume:
+            logger.error("run: --resume: unknown run '%s'", ns.resume)
+            return 2
+        if journal is not None:
+            logger.info("run: start")
+            logger.info("run: plan = %s (resume %s)", ", ".join(journal.flow), journal.run_id)
+            code = runner.run_flow(flow=journal.flow, resume=journal, **journal.options)
+            governor.summary()
+            logger.info("run: done")
+            return code
+        logger.info("run: nothing to resume (the latest run did not fail)")
+        return 0
+
     errors = []
     if ns.only and ns.only not in steps:
         errors.append(("only", ns.only))
@@ -137,13 +183,39 @@ def _run_handler(args: List[str]) -> int:
         "dry_run": ns.dry_run,
         "clean_first": ns.clean_first,
         "yes": ns.yes,
+        "sample": ns.sample,
+        "allow_sampled": ns.allow_sampled,
     }
 
     code = runner.run_flow(flow=plan, **kwargs)
+    governor.summary()
     logger.info("run: done")
     return code
 
 
+def _watch_handler(args: List[str]) -> int:
+    """Handler for the watch option."""
+    parser = _RunArgumentParser(prog="watch", add_help=False, allow_abbrev=False)
+    parser.add_argument("--interval", type=float, default=5.0)
+    parser.add_argument("--debounce", type=float, default=10.0)
+    parser.add_argument("--once", action="store_true")
+
+    try:
+        ns = parser.parse_args(args)
+    except ValueError as exc:
+        logger.error("watch: %s", exc)
+        logger.error("Hint: see 'python3 scripts/processor.py help watch'")
+        return 2
+
+    if ns.interval <= 0 or ns.debounce < 0:
+        logger.error("watch: --interval must be > 0 and --debounce >= 0")
+        return 2
+
+    from app.pipeline.watch import watch
+
+    return watch(interval=ns.interval, debounce=ns.debounce, once=ns.once)
+
+
 def get_options() -> Dict[str, Dict[str, object]]:
     """Return registry of CLI options."""
     if "help" not in _OPTIONS:
@@ -169,10 +241,19 @@ def get_options() -> Dict[str, Dict[str, object]]:
                     "--yes",
                     "автоматично підтверджувати потенційно руйнівні дії (для --clean-first)",
                 ),
+                ("--max-memory SIZE", "бюджет пам'яті запуску (напр. 2G); понад нього — скидання на диск"),
+                ("--jobs N", "максимум паралельних воркерів"),
+                (
+                    "--resume [RUN_ID]",
+                    "продовжити перерваний запуск (за замовчуванням — останній незавершений)",
+                ),
+                ("--sample N|P%", "validate: перевіряти вміст лише на вибірці рядків кожного файла"),
+                ("--allow-sampled", "collect: приймати маніфест, створений з --sample"),
             ],
             "notes": [
                 f"Allowed steps: {allowed_steps}",
                 "--only не можна комбінувати з --from/--to/--skip",
+                "--resume не можна комбінувати з --only/--from/--to/--skip/--sample",
             ],
             "examples": [
                 ("Повний цикл", "python3 scripts/processor.py run"),
@@ -182,7 +263,29 @@ def get_options() -> Dict[str, Dict[str, object]]:
                 ("Пропустити додаткові перевірки", "python3 scripts/processor.py run --skip checks"),
                 ("Запустити тільки один крок (лише collect)", "python3 scripts/processor.py run --only collect"),
                 ("Пропустити кілька кроків", "python3 scripts/processor.py run --skip normalize,checks"),
+                ("Обмежити пам'ять і кількість воркерів", "python3 scripts/processor.py run --max-memory 2G --jobs 4"),
+                ("Продовжити перерваний запуск", "python3 scripts/processor.py run --resume"),
+                ("Швидка перевірка на 1% рядків", "python3 scripts/processor.py run --only validate --sample 1%"),
             ],
             "handler": _run_handler,
         }
+    if "watch" not in _OPTIONS:
+        _OPTIONS["watch"] = {
+            "about": "Стежить за data/raw і обробляє нові файли (validate → collect → normalize → interim)",
+            "usage": "python scripts/processor.py watch [опції]",
+            "flags": [
+                ("--interval SEC", "період опитування каталогів (за замовчуванням 5)"),
+                ("--debounce SEC", "скільки секунд файли мають не змінюватись перед обробкою (10)"),
+                ("--once", "обробити наявні зміни й завершитись"),
+            ],
+            "notes": [
+                "Обробляються лише датасети зі зміненими файлами; зміна schemas.yml зачіпає всі",
+                "Стан: .pscope/watch/status.json; зупинка — Ctrl+C",
+            ],
+            "examples": [
+                ("Постійне спостереження", "python3 scripts/processor.py watch"),
+                ("Одноразова обробка змін", "python3 scripts/processor.py watch --once --debounce 0"),
+            ],
+            "handler": _watch_handler,
+        }
     return _OPTIONS
@@ -13,6 +13,9 @@ STEPS = [
 # Default pipeline sequence simply includes all known steps.
 DEFAULT_FLOW = list(STEPS)
 
+# Steps re-run by watch mode for datasets whose raw files changed.
+WATCH_FLOW = ["validate", "collect", "normalize", "interim"]
+
 # Placeholder for future custom flows.
 EXAMPLE_FLOW = DEFAULT_FLOW
 
@@ -0,0 +1,225 @@
+"""Run journal for resumable pipeline runs.
+
+Every run writes ``.pscope/runs/<run_id>/journal.json`` recording the planned
+flow, the status of each step, fingerprints of the outputs of completed steps
+and finished units of work inside a step (e.g. datasets written by collect).
+``run --resume [run_id]`` reloads the journal, skips completed steps and units
+whose outputs still match their fingerprints and continues from the first
+incomplete one.
+"""
+
+from __future__ import annotations
+
+import json
+import shutil
+from datetime import datetime
+from pathlib import Path
+
+from app.collectors.files import open_fingerprint_cache
+from app.utils.logging import get_logger
+from app.validate.manifests import load_latest
+
+
+logger = get_logger(__name__)
+
+KEEP_RUNS = 20
+
+# step -> outputs (globs relative to the project root) verified on resume;
+# collect records its outputs per dataset unit instead
+STEP_OUTPUTS: dict[str, list[str]] = {
+    "validate": [".pscope/latest.json"],
+    "normalize": ["data/stage/normalize/*.csv", "data/stage/normalize/*.meta.json"],
+    "interim": ["data/stage/interim/leases.tl"],
+    "checks": ["data/stage/checks/*.csv"],
+    "report": ["data/reports/*.csv", "data/reports/*.xlsx"],
+}
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def runs_dir(root: Path) -> Path:
+    return root / ".pscope" / "runs"
+
+
+def _run_order(run_dir: Path) -> tuple[str, int]:
+    # run ids are "<timestamp>" or "<timestamp>-<n>" for runs in the same second
+    base, _, n = run_dir.name.partition("-")
+    return base, int(n) if n.isdigit() else 1
+
+
+class RunJournal:
+    """Checkpoint record of one pipeline run."""
+
+    def __init__(self, root: Path, data: dict) -> None:
+        self.root = root
+        self.data = data
+        self.path = runs_dir(root) / data["run_id"] / "journal.json"
+
+    @property
+    def run_id(self) -> str:
+        return self.data["run_id"]
+
+    @property
+    def flow(self) -> list[str]:
+        return list(self.data.get("flow") or [])
+
+    @property
+    def options(self) -> dict:
+        return dict(self.data.get("options") or {})
+
+    # --- lifecycle --------------------------------------------------------
+
+    @classmethod
+    def create(cls, root: Path, flow: list[str], options: dict | None = None) -> "RunJournal":
+        base = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        run_id, n = base, 1
+        while (runs_dir(root) / run_id).exists():
+            n += 1
+            run_id = f"{base}-{n}"
+        journal = cls(
+            root,
+            {
+                "run_id": run_id,
+                "status": "running",
+                "flow": list(flow),
+                "options": options or {},
+                "created": _now(),
+                "updated": _now(),
+                "steps": {},
+            },
+        )
+        journal.save()
+        journal._cleanup()
+        return journal
+
+    @classmethod
+    def load(cls, root: Path, run_id: str | None = None) -> "RunJournal | None":
+        """Load journal *run_id*, or the latest run when it failed.
+
+        Without *run_id* only the most recent journal is considered: a run
+        that finished or is still running (e.g. started by watch) leaves
+        nothing to resume.
+        """
+
+        base = runs_dir(root)
+        if run_id:
+            path = base / run_id / "journal.json"
+        else:
+            paths = sorted(base.glob("*/journal.json"), key=lambda p: _run_order(p.parent))
+            if not paths:
+                return None
+            path = paths[-1]
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if not run_id and data.get("status") != "failed":
+            logger.info("run: latest run %s is %s", data.get("run_id"), data.get("status"))
+            return None
+        return cls(root, data)
+
+    def save(self) -> None:
+        self.data["updated"] = _now()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(self.data, indent=2, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(self.path)
+
+    def _cleanup(self) -> None:
+        dirs = sorted((p for p in runs_dir(self.root).iterdir() if p.is_dir()), key=_run_order)
+        for old in dirs[:-KEEP_RUNS]:
+            shutil.rmtree(old, ignore_errors=True)
+
+    def finish(self, code: int) -> None:
+        self.data["status"] = "done" if code == 0 else "failed"
+        self.data["code"] = code
+        self.save()
+
+    # --- steps ------------------------------------------------------------
+
+    def _step(self, step: str) -> dict:
+        return self.data["steps"].setdefault(step, {"status": "pending", "units": {}})
+
+    def step_started(self, step: str) -> None:
+        entry = self._step(step)
+        entry.update(status="running", started=_now())
+        self.save()
+
+    def step_finished(self, step: str, status: str, code: int, duration: float) -> None:
+        entry = self._step(step)
+        entry.update(status=status, code=code, finished=_now(), duration=round(duration, 3))
+        if status == "done":
+            entry["outputs"] = self._fingerprints(self._step_outputs(step))
+            if step == "validate":
+                entry["inputs"] = self._manifest_inputs()
+        self.save()
+
+    def reset_step(self, step: str) -> None:
+        """Forget progress of *step* (its units are redone)."""
+
+        self.data["steps"].pop(step, None)
+
+    def _manifest_inputs(self) -> dict[str, dict]:
+        manifest = load_latest(self.root)
+        if manifest is None:
+            return {}
+        return {
+            info["path"]: info.get("fingerprint") or {}
+            for ds in (manifest.get("datasets") or {}).values()
+            for info in ds.get("files") or []
+        }
+
+    def _step_outputs(self, step: str) -> list[Path]:
+        paths: list[Path] = []
+        for pattern in STEP_OUTPUTS.get(step, []):
+            paths.extend(sorted(self.root.glob(pattern)))
+        return paths
+
+    def step_done(self, step: str) -> bool:
+        """Return True when *step* completed and its outputs are unchanged."""
+
+        entry = self.data["steps"].get(step) or {}
+        if entry.get("status") not in ("done", "skipped"):
+            return False
+        checks = [entry.get("outputs") or {}, entry.get("inputs") or {}]
+        checks += [u.get("outputs") or {} for u in (entry.get("units") or {}).values()]
+        return all(self._verify(fps) for fps in checks)
+
+    # --- units ------------------------------------------------------------
+
+    def unit_finished(self, step: str, unit: str, outputs: list[Path]) -> None:
+        """Record finished unit *unit* of *step* with its output files."""
+
+        self._step(step)["units"][unit] = {
+            "finished": _now(),
+            "outputs": self._fingerprints(outputs),
+        }
+        self.save()
+
+    def unit_done(self, step: str, unit: str) -> bool:
+        """Return True when *unit* of *step* finished and outputs are unchanged."""
+
+        entry = (self.data["steps"].get(step) or {}).get("units", {}).get(unit)
+        if entry is None:
+            return False
+        return self._verify(entry.get("outputs") or {})
+
+    # --- fingerprints -----------------------------------------------------
+
+    def _fingerprints(self, paths: list[Path]) -> dict[str, dict]:
+        with open_fingerprint_cache(self.root) as fingerprints:
+            return {
+                str(Path(p).relative_to(self.root)): fingerprints.fingerprint(p)
+                for p in paths
+                if Path(p).is_file()
+            }
+
+    def _verify(self, files: dict[str, dict]) -> bool:
+        with open_fingerprint_cache(self.root) as fingerprints:
+            for rel, fp in files.items():
+                if not fingerprints.matches(self.root / rel, fp):
+                    logger.info("run: resume: changed since checkpoint: %s", rel)
+                    return False
+        return True
@@ -4,10 +4,13 @@ from __future__ import annotations
 
 import importlib
 import time
+from pathlib import Path
 from typing import Dict
 
+from app.pipeline.journal import RunJournal
 from app.pipeline.status import DONE, SKIPPED
 from app.utils.logging import get_logger
+from app.utils.paths import project_root
 
 
 MODULES: Dict[str, str] = {
@@ -23,46 +26,106 @@ MODULES: Dict[str, str] = {
 logger = get_logger(__name__)
 
 
-def run_flow(*, flow: list[str], **kwargs) -> int:
-    """Execute the given flow of pipeline steps."""
+def _options(kwargs: dict) -> dict:
+    # keep only JSON-serialisable options for the journal
+    return {
+        k: str(v) if isinstance(v, Path) else v
+        for k, v in kwargs.items()
+        if isinstance(v, (str, int, float, bool, list, Path, type(None)))
+    }
+
+
+def run_flow(
+    *,
+    flow: list[str],
+    resume: RunJournal | None = None,
+    root: str | Path | None = None,
+    **kwargs,
+) -> int:
+    """Execute the given flow of pipeline steps.
+
+    Steps run against data *root* (default: the source checkout); *root* and
+    all other *kwargs* are passed on to every step.  Progress is checkpointed
+    in a run journal.  A dry run (``dry_run=True``) only logs the plan: no
+    step runs and no journal is written.  With *resume* (a journal of a
+    failed or interrupted run) completed steps whose outputs are unchanged
+    are skipped and the first incomplete step continues from its recorded
+    units.
+    """
+    root = project_root(root)
+    kwargs["root"] = root
+    if kwargs.get("dry_run"):
+        for step in flow:
+            logger.info("⏭ step=%s status=skipped reason=dry-run", step)
+        return DONE
+    if resume is not None:
+        journal = resume
+        logger.info("run: resuming run %s", journal.run_id)
+    else:
+        options = _options(kwargs)
+        options.pop("root", None)
+        journal = RunJournal.create(root, flow, options)
+    reuse = resume is not None
+    try:
+        code = _run_steps(flow, journal, reuse, kwargs)
+    except KeyboardInterrupt:
+        # an interrupted run is resumable like a failed one
+        journal.finish(130)
+        raise
+    journal.finish(code)
+    return code
+
+
+def _run_steps(flow: list[str], journal: RunJournal, reuse: bool, kwargs: dict) -> int:
     manifest = None
     for step in flow:
+        if reuse and journal.step_done(step):
+            logger.info("⏭ step=%s status=skipped reason=resume", step)
+            continue
+        if not reuse:
+            journal.reset_step(step)
+        reuse = False
+        journal.step_started(step)
         start = time.perf_counter()
         logger.info("▶ step=%s status=start", step)
         try:
             module = importlib.import_module(MODULES[step])
             try:
                 if step == "validate":
-                    code, manifest = module.run(**kwargs)
+                    code, manifest = module.run(journal=journal, **kwargs)
                 elif step == "collect" and manifest is not None:
-                    code = module.run(validated_manifest=manifest, **kwargs)
+                    code = module.run(validated_manifest=manifest, journal=journal, **kwargs)
                 else:
-                    code = module.run(**kwargs)
+                    code = module.run(journal=journal, **kwargs)
             except NotImplementedError:
                 code = SKIPPED
             except Exception:
                 duration = time.perf_counter() - start
                 logger.info("✖ step=%s status=error duration=%.3fs", step, duration)
+                journal.step_finished(step, "failed", 1, duration)
                 return 1
             duration = time.perf_counter() - start
             if code == DONE:
                 logger.info(
                     "✓ step=%s status=done duration=%.3fs", step, duration
                 )
+                journal.step_finished(step, "done", code, duration)
             elif code == SKIPPED:
                 logger.info(
                     "⏭ step=%s status=skipped reason=noop duration=%.3fs",
                     step,
                     duration,
                 )
+                journal.step_finished(step, "skipped", code, duration)
             else:
                 logger.info(
                     "✖ step=%s status=error duration=%.3fs", step, duration
                 )
+                journal.step_finished(step, "failed", code, duration)
                 return code
         except Exception:
             duration = time.perf_counter() - start
             logger.info("✖ step=%s status=error duration=%.3fs", step, duration)
+            journal.step_finished(step, "failed", 1, duration)
             return 1
     return DONE
-
@@ -0,0 +1,299 @@
+"""Watch mode: re-run the pipeline for datasets whose raw files changed.
+
+The watcher polls the dataset directories from ``configs/schemas.yml`` and
+compares ``(size, mtime_ns)`` of every raw CSV with the previous poll.  The
+files of every successfully processed dataset are recorded in
+``.pscope/watch/snapshot.json``; on start the baseline is seeded from that
+record, falling back to the fingerprints of the latest validate manifest, so
+files already processed are not processed again after a restart (datasets
+without a schema have no files in the manifest and rely on the record).  A
+dataset is processed once its files stopped changing for *debounce* seconds
+(files still being copied keep changing size); then validate → collect →
+normalize → interim run for the affected datasets only.  Datasets of a failed
+run stay pending and are retried after another *debounce* period, also after
+a restart.  A change of ``schemas.yml`` affects every dataset.  Progress is
+written to ``.pscope/watch/status.json``.
+
+Only polling is used: the standard library has no portable file system
+notification API.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+from app.collectors.files import list_csv_in_dir, open_fingerprint_cache, source_path
+from app.pipeline import runner
+from app.pipeline.flows import WATCH_FLOW
+from app.utils.config import load_yaml
+from app.utils.logging import get_logger
+from app.utils.paths import project_root, schemas_path
+from app.validate.manifests import load_latest
+
+
+logger = get_logger(__name__)
+
+DEFAULT_INTERVAL = 5.0
+DEFAULT_DEBOUNCE = 10.0
+
+# snapshot key of schemas.yml
+_SCHEMAS = "*"
+
+
+def _stat(path: str) -> tuple[int, int] | None:
+    try:
+        st = os.stat(source_path(path))
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class Watcher:
+    """Poll dataset directories and run the pipeline for changed datasets."""
+
+    def __init__(
+        self,
+        root: Path,
+        *,
+        config_file: str | Path | None = None,
+        debounce: float = DEFAULT_DEBOUNCE,
+    ) -> None:
+        self.root = root
+        self.config_file = config_file
+        self.config_path = schemas_path(root, config_file)
+        self.status_path = root / ".pscope" / "watch" / "status.json"
+        self.processed_path = root / ".pscope" / "watch" / "snapshot.json"
+        self.debounce = debounce
+        self.dirs: dict[str, Path] = {}
+        self.ignore_suffixes: list[str] = []
+        self.snapshot: dict[str, tuple[str, tuple[int, int] | None]] = {}
+        # dataset -> (first change seen, last change seen), monotonic seconds
+        self.pending: dict[str, tuple[float, float]] = {}
+        self.runs = 0
+        self.last_run: dict | None = None
+        self.schemas_hash: str | None = None
+        # dataset -> {path: (size, mtime_ns)} of its last successful run
+        self.processed: dict[str, dict[str, tuple[int, int] | None]] = {}
+        self.failed: set[str] = set()
+        self._load_config()
+        self._seed()
+
+    def _load_config(self) -> None:
+        validate_cfg = load_yaml(self.config_path).get("validate") or {}
+        settings = validate_cfg.get("settings") or {}
+        self.ignore_suffixes = settings.get("ignore_suffixes", ["example.csv"])
+        self.dirs = {
+            name: self.root / ds["dir"]
+            for name, ds in (validate_cfg.get("datasets") or {}).items()
+            if isinstance(ds, dict) and isinstance(ds.get("dir"), str)
+        }
+
+    def _load_processed(self) -> None:
+        try:
+            data = json.loads(self.processed_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get("schemas_hash") != self.schemas_hash:
+            return
+        self.processed = {
+            ds: {path: tuple(st) if st else None for path, st in files.items()}
+            for ds, files in (data.get("datasets") or {}).items()
+        }
+        self.failed = set(data.get("failed") or [])
+
+    def _save_processed(self) -> None:
+        data = {
+            "schemas_hash": self.schemas_hash,
+            "datasets": self.processed,
+            "failed": sorted(self.failed),
+        }
+        self.processed_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.processed_path.with_name(self.processed_path.name + ".tmp")
+        tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(self.processed_path)
+
+    def _seed(self) -> None:
+        """Seed the baseline snapshot from the processed record and the manifest."""
+
+        with open_fingerprint_cache(self.root) as fingerprints:
+            self.schemas_hash = fingerprints.digest(self.config_path)
+        latest = load_latest(self.root)
+        if latest is None:
+            logger.info("watch: no manifest -> all datasets are new")
+            return
+        if latest.get("schemas_hash") != self.schemas_hash:
+            logger.info("watch: schemas.yml changed since last run")
+            return
+        self._load_processed()
+        self.snapshot[_SCHEMAS] = (_SCHEMAS, _stat(str(self.config_path)))
+        for ds_name, ds in (latest.get("datasets") or {}).items():
+            if ds_name in self.processed or ds_name in self.failed:
+                continue
+            for entry in ds.get("files") or []:
+                fp = entry.get("fingerprint") or {}
+                key = str(self.root / entry["path"])
+                self.snapshot[key] = (ds_name, (fp.get("size"), fp.get("mtime_ns")))
+        for ds_name, files in self.processed.items():
+            if ds_name in self.failed:
+                continue
+            for key, st in files.items():
+                self.snapshot[key] = (ds_name, st)
+        if self.failed:
+            logger.info("watch: retrying failed %s", ", ".join(sorted(self.failed)))
+
+    def _scan(self) -> dict[str, tuple[str, tuple[int, int] | None]]:
+        snap = {_SCHEMAS: (_SCHEMAS, _stat(str(self.config_path)))}
+        for ds_name, dir_path in self.dirs.items():
+            for path in list_csv_in_dir(
+                str(dir_path), ignore_suffixes=self.ignore_suffixes, recursive=False
+            ):
+                snap[path] = (ds_name, _stat(path))
+        return snap
+
+    def poll(self) -> set[str]:
+        """Scan once and return datasets with changes since the last scan."""
+
+        snap = self._scan()
+        changed: set[str] = set()
+        for key in snap.keys() | self.snapshot.keys():
+            new = snap.get(key)
+            old = self.snapshot.get(key)
+            if new is not None and old is not None and new[1] == old[1]:
+                continue
+            changed.add((new or old)[0])
+        if _SCHEMAS in changed:
+            logger.info("watch: schemas.yml changed -> all datasets")
+            self._load_config()
+            snap = self._scan()
+            changed = set(self.dirs)
+            with open_fingerprint_cache(self.root) as fingerprints:
+                self.schemas_hash = fingerprints.digest(self.config_path)
+            self.processed = {}
+        self.snapshot = snap
+
+        now = time.monotonic()
+        for ds_name in sorted(changed):
+            first, _ = self.pending.get(ds_name, (now, now))
+            if ds_name not in self.pending:
+                logger.info("watch: change detected in %s", ds_name)
+            self.pending[ds_name] = (first, now)
+        return changed
+
+    def ready(self) -> list[str]:
+        """Return pending datasets that were quiet for the debounce period."""
+
+        cutoff = time.monotonic() - self.debounce
+        return sorted(ds for ds, (_, last) in self.pending.items() if last <= cutoff)
+
+    def process(self, datasets: list[str]) -> int:
+        """Run the watch flow for *datasets* and clear them from the queue.
+
+        On failure the datasets stay queued and are retried after another
+        debounce period.
+        """
+
+        detected = min(self.pending[ds][0] for ds in datasets)
+        files = {
+            ds: {key: st for key, (name, st) in self.snapshot.items() if name == ds}
+            for ds in datasets
+        }
+        self.write_status("running", running=datasets)
+        start = time.monotonic()
+        logger.info("watch: processing %s", ", ".join(datasets))
+        code = runner.run_flow(
+            flow=WATCH_FLOW,
+            datasets=datasets,
+            root=self.root,
+            config_file=self.config_file,
+        )
+        end = time.monotonic()
+        self.runs += 1
+        self.last_run = {
+            "datasets": datasets,
+            "code": code,
+            "latency": round(end - detected, 3),
+            "duration": round(end - start, 3),
+            "finished": datetime.utcnow().isoformat() + "Z",
+        }
+        if code:
+            for ds in datasets:
+                self.pending[ds] = (self.pending[ds][0], end)
+            self.failed.update(datasets)
+        else:
+            for ds in datasets:
+                del self.pending[ds]
+            self.processed.update(files)
+            self.failed.difference_update(datasets)
+        self._save_processed()
+        if code:
+            logger.error("watch: run failed (code=%d) for %s", code, ", ".join(datasets))
+        else:
+            logger.info(
+                "watch: done %s (latency=%.3fs, duration=%.3fs)",
+                ", ".join(datasets),
+                self.last_run["latency"],
+                self.last_run["duration"],
+            )
+        return code
+
+    def write_status(self, state: str, **extra) -> None:
+        status = {
+            "pid": os.getpid(),
+            "state": state,
+            "queue_depth": len(self.pending),
+            "pending": sorted(self.pending),
+            "runs": self.runs,
+            "last_run": self.last_run,
+            "updated": datetime.utcnow().isoformat() + "Z",
+            **extra,
+        }
+        self.status_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.status_path.with_name(self.status_path.name + ".tmp")
+        tmp.write_text(json.dumps(status, indent=2, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(self.status_path)
+
+
+def watch(
+    *,
+    root: str | Path | None = None,
+    config_file: str | Path | None = None,
+    interval: float = DEFAULT_INTERVAL,
+    debounce: float = DEFAULT_DEBOUNCE,
+    once: bool = False,
+) -> int:
+    """Run the watch loop until interrupted.
+
+    With *once* the loop exits as soon as no changes are pending or a run
+    failed (its datasets are retried on the next start).
+    """
+
+    watcher = Watcher(project_root(root), config_file=config_file, debounce=debounce)
+    logger.info(
+        "watch: start (datasets=%d, interval=%.1fs, debounce=%.1fs)",
+        len(watcher.dirs),
+        interval,
+        debounce,
+    )
+    code = 0
+    try:
+        while True:
+            watcher.poll()
+            ready = watcher.ready()
+            if ready:
+                failed = watcher.process(ready)
+                code = failed or code
+                if once and failed:
+                    break
+            if once and not watcher.pending:
+                break
+            watcher.write_status("waiting" if watcher.pending else "idle")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        logger.info("watch: interrupted")
+    watcher.write_status("stopped")
+    logger.info("watch: stopped (runs=%d)", watcher.runs)
+    return code
@@ -1,11 +1,434 @@
-"""Normalize step prepares data for further processing."""
+"""Normalize step prepares data for further processing.
+
+The step runs an early prefilter over the collected event datasets (siem,
+dhcp, ubiq) before the interim aggregation: every event is routed by its MAC
+
+* to nowhere, when the MAC is on the ignore list (``configs/local.yml`` →
+  ``ignore.mac``);
+* to ``data/stage/normalize/<dataset>.known.csv``, when the MAC belongs to a
+  device already in the ARM/MKP registries (``mac`` or ``randmac`` of their
+  collect outputs);
+* to ``data/stage/normalize/<dataset>.csv`` otherwise.
+
+While the outputs are up to date with the collect output (see
+:func:`prefiltered_files`) interim loads only ``<dataset>.csv`` into the
+device store for the registry joins, so ignored and known traffic never
+reaches them, and builds the lease timeline from both streams, so every
+non-ignored device keeps its history.  Ignored MACs are matched exactly;
+registry MACs are kept in a set, or in a Bloom filter
+(:mod:`app.utils.bloom`) for large registries or near the memory budget —
+a false positive only moves an unknown device's events to the known stream,
+where the timeline still sees them.  Settings live
+under ``normalize.prefilter`` in ``configs/schemas.yml``.
+"""
 
 from __future__ import annotations
 
-from app.pipeline.status import SKIPPED
+import csv
+import hashlib
+import json
+from pathlib import Path
+from typing import Iterator
+
+from app.collectors.files import (
+    AtomicOutput,
+    FingerprintCache,
+    open_csv_dicts,
+    open_fingerprint_cache,
+    open_text,
+    read_output,
+    sidecar_path,
+)
+from app.collectors.partitions import dataset_files, dataset_rows
+from app.pipeline.status import DONE, SKIPPED
+from app.utils.addr import mac_to_int
+from app.utils.bloom import BloomFilter
+from app.utils.config import load_yaml
+from app.utils.logging import get_logger
+from app.utils.paths import project_root, schemas_path
+from app.utils.resources import get_governor
+
+
+logger = get_logger(__name__)
+
+EVENT_DATASETS = ["siem", "dhcp", "ubiq"]
+REGISTRY_DATASETS = ["arm", "mkp"]
+REGISTRY_FIELDS = ("mac", "randmac")
+KNOWN_MODES = ("route", "drop", "keep")
+
+# registries with room for at least this many MACs are kept in a Bloom filter
+BLOOM_MIN_ITEMS = 1_000_000
+
+# distinct raw MAC strings whose route is memoized
+ROUTE_CACHE_SIZE = 1 << 20
+
+PASS, KNOWN, IGNORED = 0, 1, 2
+
+
+def normalize_dir(root: Path) -> Path:
+    return root / "data" / "stage" / "normalize"
+
+
+def _lookup(config: dict, dotted: str) -> object:
+    node: object = config
+    for part in dotted.split("."):
+        if not isinstance(node, dict):
+            return None
+        node = node.get(part)
+    return node
+
+
+def _ignored_macs(local_cfg: dict, dotted: str) -> set[int]:
+    """Return MACs of list *dotted* (mapping or list) in ``configs/local.yml``."""
+
+    value = _lookup(local_cfg, dotted)
+    if isinstance(value, dict):
+        raw = value.values()
+    elif isinstance(value, list):
+        raw = value
+    else:
+        return set()
+    return {mac for mac in (mac_to_int(str(v)) for v in raw) if mac is not None}
+
+
+def _registry_macs(collect_dir: Path, datasets: list[str]) -> Iterator[int]:
+    """Yield ``mac``/``randmac`` values of the registry collect outputs."""
+
+    for ds in datasets:
+        for path in dataset_files(collect_dir, ds):
+            for row in open_csv_dicts(str(path)):
+                for field in REGISTRY_FIELDS:
+                    mac = mac_to_int(row.get(field))
+                    if mac is not None:
+                        yield mac
+
+
+def _known_filter(
+    collect_dir: Path, datasets: list[str], bloom: str, error_rate: float
+) -> set[int] | BloomFilter:
+    """Return registry MACs as a set or, when *bloom* asks for it, a Bloom filter.
+
+    The choice and the filter size come from the registry row counts in the
+    collect sidecars/partition indexes (up to two MACs per row), so MACs are
+    streamed straight into whichever structure is used and never held twice.
+    """
+
+    capacity = sum(dataset_rows(collect_dir, ds) for ds in datasets) * len(REGISTRY_FIELDS)
+    use_bloom = capacity > 0 and (
+        bloom == "true"
+        or (
+            bloom == "auto"
+            and (capacity >= BLOOM_MIN_ITEMS or get_governor().should_spill("prefilter"))
+        )
+    )
+    if not use_bloom:
+        macs = set(_registry_macs(collect_dir, datasets))
+        logger.info("normalize: known macs=%d (set)", len(macs))
+        return macs
+    known = BloomFilter(capacity, error_rate)
+    for mac in _registry_macs(collect_dir, datasets):
+        known.add(mac)
+    logger.info(
+        "normalize: known macs=%d (bloom %d KiB for %d, error_rate=%g)",
+        len(known),
+        known.nbytes // 1024,
+        capacity,
+        error_rate,
+    )
+    return known
+
+
+class _Router:
+    """Route raw MAC strings to PASS, KNOWN or IGNORED (memoized)."""
+
+    def __init__(self, ignored: set[int], known: set[int] | BloomFilter) -> None:
+        self.ignored = ignored
+        self.known = known
+        self.cache: dict[str, int] = {}
+
+    def route(self, raw: str) -> int:
+        route = self.cache.get(raw)
+        if route is None:
+            mac = mac_to_int(raw)
+            if mac is None:
+                route = PASS
+            elif mac in self.ignored:
+                route = IGNORED
+            elif mac in self.known:
+                route = KNOWN
+            else:
+                route = PASS
+            if len(self.cache) < ROUTE_CACHE_SIZE:
+                self.cache[raw] = route
+        return route
+
+
+def _sources(root: Path, files: list[Path], fingerprints: FingerprintCache) -> dict[str, dict]:
+    return {str(Path(p).relative_to(root)): fingerprints.fingerprint(p) for p in files}
+
+
+def _unchanged(root: Path, recorded: dict, files: list[Path]) -> bool:
+    """Return True when *files* are exactly the *recorded* fingerprinted files."""
+
+    if {str(Path(p).relative_to(root)) for p in files} != set(recorded):
+        return False
+    with open_fingerprint_cache(root) as fingerprints:
+        return all(fingerprints.matches(root / rel, fp) for rel, fp in recorded.items())
+
+
+def _settings(cfg: dict) -> dict:
+    """Return the prefilter settings that decide where events are routed."""
+
+    return {
+        "registry": list(cfg.get("registry") or REGISTRY_DATASETS),
+        "ignore_list": str(cfg.get("ignore_list") or "ignore.mac"),
+        "known": str(cfg.get("known") or "route").lower(),
+        "bloom": str(cfg.get("bloom", "auto")).lower(),
+        "error_rate": float(cfg.get("error_rate") or 0.001),
+    }
+
+
+def _ignore_digest(ignored: set[int]) -> str:
+    text = ",".join(f"{mac:012x}" for mac in sorted(ignored))
+    return hashlib.sha256(text.encode("ascii")).hexdigest()
+
+
+def _registry_files(collect_dir: Path, datasets: list[str]) -> list[Path]:
+    return [p for ds in datasets for p in dataset_files(collect_dir, ds)]
+
+
+def _prefilter_cfg(config: dict) -> dict:
+    return (config.get("normalize") or {}).get("prefilter") or {}
+
+
+def _remove_outputs(root: Path, ds_name: str) -> None:
+    out_dir = normalize_dir(root)
+    for base in (out_dir / f"{ds_name}.csv", out_dir / f"{ds_name}.known.csv"):
+        out = read_output(base)
+        if out is not None:
+            out.unlink(missing_ok=True)
+        base.unlink(missing_ok=True)
+        sidecar_path(base).unlink(missing_ok=True)
+
+
+def prefiltered_files(
+    root: Path, ds_name: str, config: dict, *, known: bool = False
+) -> list[Path] | None:
+    """Return the prefiltered events of *ds_name* for interim.
+
+    That is ``<ds>.csv``, plus ``<ds>.known.csv`` (when routed) with
+    *known*.  ``None`` means the prefilter is disabled in *config*, there is
+    no normalize output, or it is stale: the collect output, the registry
+    outputs, the ignore list or the routing settings changed since it was
+    written.  Callers then read the collect output instead.
+    """
+
+    cfg = _prefilter_cfg(config)
+    if not cfg.get("enabled"):
+        return None
+    base = normalize_dir(root) / f"{ds_name}.csv"
+    out = read_output(base)
+    if out is None:
+        return None
+    try:
+        meta = json.loads(sidecar_path(base).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    settings = _settings(cfg)
+    state = meta.get("state") or {}
+    if state.get("settings") != settings:
+        return None
+    local_cfg = load_yaml(root / "configs" / "local.yml")
+    if state.get("ignore") != _ignore_digest(_ignored_macs(local_cfg, settings["ignore_list"])):
+        return None
+    collect_dir = root / "data" / "stage" / "collect"
+    if not _unchanged(root, meta.get("sources") or {}, dataset_files(collect_dir, ds_name)):
+        return None
+    registry = _registry_files(collect_dir, settings["registry"])
+    if not _unchanged(root, state.get("registry") or {}, registry):
+        return None
+    if not known:
+        return [out]
+    known_base = normalize_dir(root) / f"{ds_name}.known.csv"
+    if not sidecar_path(known_base).exists():
+        return [out]
+    known_out = read_output(known_base)
+    return [out, known_out] if known_out is not None else None
+
+
+def _prefilter(
+    root: Path,
+    ds_name: str,
+    files: list[Path],
+    router: _Router,
+    known_mode: str,
+    fingerprints: FingerprintCache,
+    state: dict,
+) -> dict[str, int] | None:
+    """Route events of *files* into the normalize outputs of *ds_name*.
+
+    *state* (settings, ignore list digest, registry fingerprints) is stored
+    in the sidecar for :func:`prefiltered_files`.
+    """
+
+    with open_text(files[0]) as fh:
+        fields = next(csv.reader(fh), [])
+    out_dir = normalize_dir(root)
+    known_path = out_dir / f"{ds_name}.known.csv"
+    if "mac" not in fields:
+        logger.info("normalize: skipped %s: no mac field", ds_name)
+        _remove_outputs(root, ds_name)
+        return None
+    mac_idx = fields.index("mac")
+    counts = {"rows": 0, "passed": 0, "known": 0, "ignored": 0}
+    with AtomicOutput(out_dir / f"{ds_name}.csv") as output:
+        known_out = AtomicOutput(known_path) if known_mode == "route" else None
+        try:
+            writer = csv.writer(output.stream)
+            writer.writerow(fields)
+            known_writer = None
+            if known_out is not None:
+                known_writer = csv.writer(known_out.stream)
+                known_writer.writerow(fields)
+            for path in files:
+                with open_text(path) as fh:
+                    reader = csv.reader(fh)
+                    header = next(reader, [])
+                    indexes = None
+                    if header != fields:
+                        indexes = [header.index(f) if f in header else -1 for f in fields]
+                    for row in reader:
+                        if indexes is not None:
+                            width = len(row)
+                            row = [row[i] if 0 <= i < width else "" for i in indexes]
+                        counts["rows"] += 1
+                        route = router.route(row[mac_idx] if mac_idx < len(row) else "")
+                        if route == IGNORED:
+                            counts["ignored"] += 1
+                            continue
+                        if route == KNOWN:
+                            counts["known"] += 1
+                            if known_mode == "drop":
+                                continue
+                            if known_writer is not None:
+                                known_writer.writerow(row)
+                                continue
+                        counts["passed"] += 1
+                        writer.writerow(row)
+            output.rows = counts["passed"]
+            output.commit(
+                dataset=ds_name,
+                fields=fields,
+                sources=_sources(root, files, fingerprints),
+                state=state,
+                counts=counts,
+            )
+            if known_out is not None:
+                known_out.rows = counts["known"]
+                known_out.commit(dataset=ds_name, fields=fields)
+        except BaseException:
+            if known_out is not None:
+                known_out.abort()
+            raise
+    if known_out is None:
+        known_path.unlink(missing_ok=True)
+        sidecar_path(known_path).unlink(missing_ok=True)
+    return counts
+
+
+def run(
+    *,
+    datasets: list[str] | None = None,
+    root: str | Path | None = None,
+    config_file: str | Path | None = None,
+    **kwargs,
+) -> int:
+    """Run the normalize step.
+
+    When *datasets* is given only those event datasets are filtered, unless
+    a registry dataset is among them (then all are, as known MACs changed).
+    """
+    try:
+        root = project_root(root)
+        config = load_yaml(schemas_path(root, config_file))
+        cfg = _prefilter_cfg(config)
+        if not cfg.get("enabled"):
+            # stale outputs must not be picked up by interim
+            stale = {
+                path.name[: -len(".meta.json")].removesuffix(".known")
+                for path in normalize_dir(root).glob("*.meta.json")
+            }
+            for ds_name in sorted(stale):
+                _remove_outputs(root, ds_name)
+            logger.info("normalize: prefilter disabled (removed outputs=%d)", len(stale))
+            return SKIPPED
+
+        settings = _settings(cfg)
+        event_ds = list(cfg.get("datasets") or EVENT_DATASETS)
+        registry_ds = settings["registry"]
+        known_mode = settings["known"]
+        if known_mode not in KNOWN_MODES:
+            logger.error(
+                "normalize: unknown prefilter.known '%s' (allowed: %s)",
+                known_mode,
+                ", ".join(KNOWN_MODES),
+            )
+            return 1
+        if datasets and not set(datasets) & set(registry_ds):
+            event_ds = [ds for ds in event_ds if ds in datasets]
+
+        collect_dir = root / "data" / "stage" / "collect"
+        targets = {ds: dataset_files(collect_dir, ds) for ds in event_ds}
+        targets = {ds: files for ds, files in targets.items() if files}
+        if not targets:
+            logger.info("normalize: no collected event datasets -> skipped")
+            return SKIPPED
 
+        local_cfg = load_yaml(root / "configs" / "local.yml")
+        ignored = _ignored_macs(local_cfg, settings["ignore_list"])
+        known = _known_filter(
+            collect_dir, registry_ds, settings["bloom"], settings["error_rate"]
+        )
+        logger.info("normalize: ignored macs=%d", len(ignored))
+        router = _Router(ignored, known)
 
-def run(**kwargs) -> int:
-    """Run the normalize step."""
-    return SKIPPED
+        normalize_dir(root).mkdir(parents=True, exist_ok=True)
+        totals = {"rows": 0, "passed": 0, "known": 0, "ignored": 0}
+        with open_fingerprint_cache(root) as fingerprints:
+            state = {
+                "settings": settings,
+                "ignore": _ignore_digest(ignored),
+                "registry": _sources(
+                    root, _registry_files(collect_dir, registry_ds), fingerprints
+                ),
+            }
+            for ds_name, files in targets.items():
+                counts = _prefilter(
+                    root, ds_name, files, router, known_mode, fingerprints, state
+                )
+                if counts is None:
+                    continue
+                for key, value in counts.items():
+                    totals[key] += value
+                logger.info(
+                    "normalize: %s: rows=%d, passed=%d, known=%d (%s), ignored=%d",
+                    ds_name,
+                    counts["rows"],
+                    counts["passed"],
+                    counts["known"],
+                    known_mode,
+                    counts["ignored"],
+                )
 
+        short = totals["rows"] - totals["passed"]
+        logger.info(
+            "normalize: prefilter: rows=%d, short-circuited=%d (%.1f%%), passed=%d",
+            totals["rows"],
+            short,
+            100 * short / totals["rows"] if totals["rows"] else 0.0,
+            totals["passed"],
+        )
+        return DONE
+    except Exception as exc:  # pragma: no cover - minimal error handling
+        logger.error("normalize: unexpected error: %s", exc)
+        return 1
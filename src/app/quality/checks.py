@@ -1,11 +1,495 @@
-"""Checks step performs extra manual validations."""
+"""Checks step performs extra manual validations.
+
+Rules are declared in ``configs/schemas.yml`` under ``checks.rules`` and are
+evaluated over the interim artifacts.  CSV observation rows are read once to
+build hash indexes (MAC→IPs and IP→MACs with first/last timestamps) and every
+rule then works on those indexes, so adding a rule does not add another pass
+over the data.  Lease events of the interim timeline (``leases.tl``, see
+:mod:`app.stage.timeline`) are folded into the same indexes, so
+``mac_multi_ip``/``ip_multi_mac`` also see the collected siem/dhcp/ubiq
+events.  With ``storage.backend: sqlite`` the artifacts kept in the device
+store are not loaded at all: rules run indexed queries against it.  Findings
+are written to ``data/stage/checks/findings.csv``.
+"""
 
 from __future__ import annotations
 
-from app.pipeline.status import SKIPPED
+import csv
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+from app.pipeline.status import DONE, SKIPPED
+from app.stage.store import (
+    ARTIFACTS,
+    DeviceStore,
+    artifact_rows,
+    open_store,
+    storage_backend,
+    store_path,
+)
+from app.stage.timeline import Timeline
+from app.utils.addr import (
+    format_ip,
+    int_to_mac,
+    ip_key,
+    is_locally_administered,
+    mac_to_int,
+)
+from app.utils.config import load_yaml
+from app.utils.paths import project_root, schemas_path
+from app.utils.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+FINDING_FIELDS = ["rule", "kind", "severity", "mac", "ip", "detail"]
+
+
+def _to_int(value: str | None) -> int | None:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+class _Index:
+    """Hash indexes over observations and registry built in a single pass.
+
+    MACs are keyed as 48-bit ints and IPv4 addresses as 32-bit ints (see
+    :mod:`app.utils.addr`); other IP values keep their text form.
+    """
+
+    def __init__(self) -> None:
+        # mac -> ip -> [first, last]
+        self.mac_ips: dict[int, dict[int | str, list]] = {}
+        # ip -> mac -> [first, last]
+        self.ip_macs: dict[int | str, dict[int, list]] = {}
+        self.registry_macs: set[int] = set()
+        self.registry_randmacs: set[int] = set()
+        self.registry_names: dict[int, str] = {}
+        self.observations = 0
+        self.events = 0
+
+    @staticmethod
+    def _touch(table: dict, key, sub, first: int | None, last: int | None) -> None:
+        span = table.setdefault(key, {}).get(sub)
+        if span is None:
+            table[key][sub] = [first, last]
+            return
+        if first is not None and (span[0] is None or first < span[0]):
+            span[0] = first
+        if last is not None and (span[1] is None or last > span[1]):
+            span[1] = last
+
+    def add_observation(self, row: dict[str, str]) -> None:
+        mac = mac_to_int(row.get("mac"))
+        if mac is None:
+            return
+        self.observations += 1
+        ip = ip_key(row.get("ip"))
+        first = _to_int(row.get("firstDate"))
+        last = _to_int(row.get("lastDate"))
+        if last is None:
+            last = first
+        if first is None:
+            first = last
+        self._touch(self.mac_ips, mac, ip, first, last)
+        if ip != "":
+            self._touch(self.ip_macs, ip, mac, first, last)
+
+    def add_timeline(self, timeline: Timeline) -> None:
+        """Fold per-(MAC, IP) spans of lease *timeline* events into the index."""
+
+        times, ips, offsets = timeline.times, timeline.ips, timeline.offsets
+        for i, mac in enumerate(timeline.macs):
+            lo, hi = offsets[i], offsets[i + 1]
+            for pos in range(lo, hi):
+                ts = times[pos]
+                ip = ips[pos] or ""
+                self._touch(self.mac_ips, mac, ip, ts, ts)
+                if ip != "":
+                    self._touch(self.ip_macs, ip, mac, ts, ts)
+            self.events += hi - lo
+
+    def add_registry(self, row: dict[str, str]) -> None:
+        mac = mac_to_int(row.get("mac"))
+        randmac = mac_to_int(row.get("randmac"))
+        name = (row.get("name") or "").strip()
+        if mac is not None:
+            self.registry_macs.add(mac)
+            self.registry_names.setdefault(mac, name)
+        if randmac is not None:
+            self.registry_randmacs.add(randmac)
+            self.registry_names.setdefault(randmac, name)
+
+    # --- lookups (shared with _StoreIndex) ----------------------------------
+
+    def macs(self, min_ips: int = 0) -> Iterator[int]:
+        return (mac for mac, ips in self.mac_ips.items() if len(ips) >= min_ips)
+
+    def ips(self, min_macs: int = 0) -> Iterator[int | str]:
+        return (ip for ip, macs in self.ip_macs.items() if len(macs) >= min_macs)
+
+    def ips_for_mac(self, mac: int) -> dict[int | str, list]:
+        return self.mac_ips.get(mac) or {}
+
+    def macs_for_ip(self, ip: int | str) -> dict[int, list]:
+        return self.ip_macs.get(ip) or {}
+
+    def registry(self) -> Iterator[tuple[int, str]]:
+        for mac in sorted(self.registry_macs):
+            yield mac, self.registry_names.get(mac, "")
+
+    def registered(self, mac: int) -> bool:
+        return mac in self.registry_randmacs or mac in self.registry_macs
+
+
+class _StoreIndex:
+    """The :class:`_Index` lookups answered by indexed device store queries.
+
+    Nothing is loaded up front: candidates come from grouped queries and
+    per-key spans from ``ips_for_mac``/``macs_for_ip``/``registry_for_mac``.
+    """
+
+    def __init__(
+        self, store: DeviceStore, observations: bool, statuses: list[str]
+    ) -> None:
+        self.store = store
+        self.observations = observations
+        self.statuses = statuses
+
+    def macs(self, min_ips: int = 0) -> Iterator[int]:
+        if not self.observations:
+            return
+        for text in self.store.observed_macs(min_ips):
+            mac = mac_to_int(text)
+            if mac is not None:
+                yield mac
+
+    def ips(self, min_macs: int = 0) -> Iterator[int | str]:
+        if not self.observations:
+            return
+        for text in self.store.observed_ips(min_macs):
+            yield ip_key(text)
+
+    def ips_for_mac(self, mac: int) -> dict[int | str, list]:
+        if not self.observations:
+            return {}
+        return {
+            ip_key(ip): [first, last]
+            for ip, first, last in self.store.ips_for_mac(int_to_mac(mac))
+        }
+
+    def macs_for_ip(self, ip: int | str) -> dict[int, list]:
+        if not self.observations:
+            return {}
+        spans: dict[int, list] = {}
+        for text, first, last in self.store.macs_for_ip(format_ip(ip)):
+            mac = mac_to_int(text)
+            if mac is not None:
+                spans[mac] = [first, last]
+        return spans
+
+    def registry(self) -> Iterator[tuple[int, str]]:
+        for text, name in self.store.registry_macs(self.statuses):
+            mac = mac_to_int(text)
+            if mac is not None:
+                yield mac, name
+
+    def registered(self, mac: int) -> bool:
+        return any(
+            entry["status"] in self.statuses
+            for entry in self.store.registry_for_mac(int_to_mac(mac))
+        )
+
+
+def _merge(spans: dict, more: dict) -> dict:
+    if not spans:
+        return more
+    table = {None: {key: list(span) for key, span in spans.items()}}
+    for key, (first, last) in more.items():
+        _Index._touch(table, None, key, first, last)
+    return table[None]
+
+
+class _Lookups:
+    """Rule-facing view merging the lookups of several indexes."""
+
+    def __init__(self, *parts) -> None:
+        self.parts = parts
+
+    def _spans(self, enum: str, lookup: str, minimum: int) -> Iterator[tuple]:
+        last = len(self.parts) - 1
+        for i, part in enumerate(self.parts):
+            # merged counts are only known for the last index; earlier ones
+            # enumerate every key
+            for key in getattr(part, enum)(minimum if i == last else 0):
+                if any(getattr(p, lookup)(key) for p in self.parts[:i]):
+                    continue  # already yielded with an earlier index
+                spans = getattr(part, lookup)(key)
+                for other in self.parts[i + 1 :]:
+                    spans = _merge(spans, getattr(other, lookup)(key))
+                if len(spans) >= minimum:
+                    yield key, spans
+
+    def mac_spans(self, min_ips: int = 0) -> Iterator[tuple[int, dict]]:
+        """Yield ``(mac, {ip: [first, last]})`` of MACs with *min_ips* IPs."""
+
+        return self._spans("macs", "ips_for_mac", min_ips)
 
+    def ip_spans(self, min_macs: int = 0) -> Iterator[tuple[int | str, dict]]:
+        """Yield ``(ip, {mac: [first, last]})`` of IPs with *min_macs* MACs."""
 
-def run(**kwargs) -> int:
+        return self._spans("ips", "macs_for_ip", min_macs)
+
+    def ips_for_mac(self, mac: int) -> dict:
+        spans: dict = {}
+        for part in self.parts:
+            spans = _merge(spans, part.ips_for_mac(mac))
+        return spans
+
+    def registry(self) -> Iterator[tuple[int, str]]:
+        for part in self.parts:
+            yield from part.registry()
+
+    def registered(self, mac: int) -> bool:
+        return any(part.registered(mac) for part in self.parts)
+
+
+Finding = tuple[str, str, str]  # (mac, ip, detail)
+
+
+def _overlapping(spans: dict, window_ms: int) -> list:
+    """Return keys of *spans* whose intervals lie within *window_ms* of another."""
+
+    # keys may mix ints (IPv4) and strings, so never compare them
+    ordered = sorted(
+        ((s[0] or 0, s[1] or s[0] or 0, key) for key, s in spans.items() if key != ""),
+        key=lambda item: (item[0], item[1]),
+    )
+    hits: list = []
+    seen: set = set()
+    max_last: int | None = None
+    max_key = None
+    for first, last, key in ordered:
+        if max_last is not None and first - max_last <= window_ms:
+            for k in (max_key, key):
+                if k not in seen:
+                    seen.add(k)
+                    hits.append(k)
+        if max_last is None or last > max_last:
+            max_last, max_key = last, key
+    return hits
+
+
+def _ips(keys) -> str:
+    return ";".join(format_ip(k) for k in keys if k != "")
+
+
+def _rule_mac_multi_ip(index: _Lookups, params: dict) -> Iterator[Finding]:
+    window_ms = int(params.get("window_ms", 86_400_000))
+    for mac, ips in index.mac_spans(2):
+        hits = _overlapping(ips, window_ms)
+        if hits:
+            yield int_to_mac(mac), _ips(hits), f"ips={len(hits)} window_ms={window_ms}"
+
+
+def _rule_ip_multi_mac(index: _Lookups, params: dict) -> Iterator[Finding]:
+    window_ms = int(params.get("window_ms", 86_400_000))
+    for ip, macs in index.ip_spans(2):
+        hits = _overlapping(macs, window_ms)
+        if hits:
+            macs_text = ";".join(int_to_mac(m) for m in hits)
+            yield macs_text, format_ip(ip), f"macs={len(hits)} window_ms={window_ms}"
+
+
+def _rule_registry_unseen(index: _Lookups, params: dict) -> Iterator[Finding]:
+    for mac, name in index.registry():
+        if index.ips_for_mac(mac):
+            continue
+        yield int_to_mac(mac), "", f"name={name}"
+
+
+def _rule_mac_in_list(index: _Lookups, params: dict) -> Iterator[Finding]:
+    for label, mac in (params.get("_values") or {}).items():
+        ips = index.ips_for_mac(mac)
+        if ips:
+            yield int_to_mac(mac), _ips(ips), f"label={label}"
+
+
+def _rule_random_mac_unregistered(index: _Lookups, params: dict) -> Iterator[Finding]:
+    for mac, ips in index.mac_spans():
+        if not is_locally_administered(mac):
+            continue
+        if index.registered(mac):
+            continue
+        yield int_to_mac(mac), _ips(ips), "locally administered"
+
+
+# Registry of supported rule kinds
+RULES: dict[str, Callable[[_Lookups, dict], Iterable[Finding]]] = {
+    "mac_multi_ip": _rule_mac_multi_ip,
+    "ip_multi_mac": _rule_ip_multi_mac,
+    "registry_unseen": _rule_registry_unseen,
+    "mac_in_list": _rule_mac_in_list,
+    "random_mac_unregistered": _rule_random_mac_unregistered,
+}
+
+
+def _lookup(config: dict, dotted: str) -> object:
+    node: object = config
+    for part in dotted.split("."):
+        if not isinstance(node, dict):
+            return None
+        node = node.get(part)
+    return node
+
+
+def _resolve_list(value: object, local_cfg: dict) -> dict[str, int]:
+    """Return ``{label: mac}`` for rule parameter ``list``.
+
+    *value* is either a dotted path into ``configs/local.yml`` (e.g.
+    ``ignore.mac``) or an inline list/mapping of MACs.
+    """
+
+    if isinstance(value, str):
+        value = _lookup(local_cfg, value)
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = ((str(v), v) for v in value)
+    else:
+        return {}
+    result: dict[str, int] = {}
+    for label, raw in items:
+        mac = mac_to_int(str(raw))
+        if mac is not None:
+            result[str(label)] = mac
+    return result
+
+
+def _stored_table(store: DeviceStore | None, path: str) -> str | None:
+    """Return the store table holding artifact *path*, if any."""
+
+    if store is None or Path(path).stem not in ARTIFACTS:
+        return None
+    return ARTIFACTS[Path(path).stem][0]
+
+
+def _as_list(value: object) -> list[str]:
+    if isinstance(value, str):
+        return [value]
+    return [str(v) for v in value or []]
+
+
+def run(
+    *,
+    root: str | Path | None = None,
+    config_file: str | Path | None = None,
+    **kwargs,
+) -> int:
     """Run the checks step."""
-    return SKIPPED
+    try:
+        root = project_root(root)
+        config = load_yaml(schemas_path(root, config_file))
+        checks_cfg = config.get("checks") or {}
+        rules_cfg = checks_cfg.get("rules") or {}
+        if not rules_cfg:
+            logger.info("checks: no rules configured")
+            return SKIPPED
+
+        artifacts = checks_cfg.get("artifacts") or {}
+        obs_paths = _as_list(artifacts.get("observations"))
+        reg_paths = _as_list(artifacts.get("registry"))
+        tl_paths = [
+            p for p in _as_list(artifacts.get("timeline")) if (root / p).exists()
+        ]
+        use_store = storage_backend(config) == "sqlite"
+        if use_store:
+            available = store_path(root).exists()
+        else:
+            available = any((root / p).exists() for p in obs_paths + reg_paths)
+        available = available or bool(tl_paths)
+        if not available:
+            logger.info("checks: no interim artifacts found -> run 'interim' first")
+            return SKIPPED
+
+        local_cfg = load_yaml(root / "configs" / "local.yml")
+
+        rules: list[tuple[str, str, str, Callable, dict]] = []
+        for name, info in rules_cfg.items():
+            info = dict(info or {})
+            kind = info.get("kind", name)
+            fn = RULES.get(kind)
+            if fn is None:
+                logger.error("checks: unknown rule kind '%s' for %s", kind, name)
+                return 1
+            if "list" in info:
+                info["_values"] = _resolve_list(info["list"], local_cfg)
+            rules.append((name, kind, info.get("severity", "warning"), fn, info))
+
+        # artifacts kept in the store are queried through its indexes; the
+        # rest are read once into the in-memory index
+        index = _Index()
+        store = open_store(root) if use_store else None
+        try:
+            parts: list = [index]
+            store_obs = False
+            statuses: list[str] = []
+            for path in obs_paths:
+                if _stored_table(store, path) == "observations":
+                    store_obs = True
+                    continue
+                for row in artifact_rows(root, path):
+                    index.add_observation(row)
+            for path in reg_paths:
+                if _stored_table(store, path) == "registry":
+                    statuses.append(Path(path).stem)
+                    continue
+                for row in artifact_rows(root, path):
+                    index.add_registry(row)
+            for path in tl_paths:
+                with Timeline.load(root / path) as timeline:
+                    index.add_timeline(timeline)
+            if store is not None:
+                parts.append(_StoreIndex(store, store_obs, statuses))
+            logger.info(
+                "checks: indexed observations=%d, events=%d, macs=%d, ips=%d, "
+                "registry=%d%s",
+                index.observations,
+                index.events,
+                len(index.mac_ips),
+                len(index.ip_macs),
+                len(index.registry_macs),
+                " (+ store lookups)" if store is not None else "",
+            )
+            lookups = _Lookups(*parts)
+
+            out_dir = root / "data" / "stage" / "checks"
+            out_dir.mkdir(parents=True, exist_ok=True)
+            out_path = out_dir / "findings.csv"
+            total = 0
+            with out_path.open("w", newline="", encoding="utf-8") as out_fh:
+                writer = csv.writer(out_fh)
+                writer.writerow(FINDING_FIELDS)
+                for name, kind, severity, fn, params in rules:
+                    count = 0
+                    for mac, ip, detail in fn(lookups, params):
+                        writer.writerow([name, kind, severity, mac, ip, detail])
+                        count += 1
+                    logger.info("checks: %s: findings=%d", name, count)
+                    total += count
+        finally:
+            if store is not None:
+                store.close()
 
+        logger.info(
+            "checks: done (rules=%d, findings=%d) -> %s",
+            len(rules),
+            total,
+            str(out_path.relative_to(root)),
+        )
+        return DONE
+    except Exception as exc:  # pragma: no cover - minimal error handling
+        logger.error("checks: unexpected error: %s", exc)
+        return 1
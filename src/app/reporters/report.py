@@ -1,11 +1,306 @@
-"""Report step produces final summaries."""
+"""Report step renders final reports from interim artifacts.
+
+Report definitions live in ``configs/schemas.yml`` under ``report.reports``.
+Each report lists its input artifacts (``sources``), output formats and
+column templates such as ``"{ip}\\n{mac}"``.  Every input artifact is read
+once and each row is fanned out to all reports that use it, so rows are
+streamed straight into the output writers and the report is never held in
+memory.  Templates may also use ``{seen_ips}``, ``{first_seen}`` and
+``{last_seen}``, looked up by the row's MAC in the observations artifact.
+With ``storage.backend: sqlite`` rows are read from the device store instead
+of the CSV artifacts and those lookups are indexed store queries.  XLSX
+output requires ``openpyxl`` (write-only mode); without it only CSV files are
+produced.
+"""
 
 from __future__ import annotations
 
-from app.pipeline.status import SKIPPED
+import csv
+import string
+from pathlib import Path
+
+from app.pipeline.status import DONE, SKIPPED
+from app.stage.store import (
+    ARTIFACTS,
+    DeviceStore,
+    artifact_rows,
+    open_store,
+    storage_backend,
+    store_path,
+)
+from app.utils.addr import mac_to_int
+from app.utils.config import load_yaml
+from app.utils.paths import project_root, schemas_path
+from app.utils.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+
+class _Row(dict):
+    """Row mapping that renders missing template fields as empty strings."""
+
+    def __missing__(self, key: str) -> str:
+        return ""
+
+
+# template fields looked up by the row's MAC in the observations
+LOOKUP_FIELDS = frozenset({"seen_ips", "first_seen", "last_seen"})
+
+
+def _check_template(template: str) -> set[str]:
+    """Return fields of *template*; raise ValueError unless all are named."""
+
+    fields = set()
+    for _, field, _, _ in string.Formatter().parse(template):
+        if field is None:
+            continue
+        if not field or field.isdigit():
+            raise ValueError(f"positional field in {template!r}")
+        if any(c in field for c in ".["):
+            raise ValueError(f"attribute/index access in {template!r}")
+        fields.add(field)
+    return fields
+
+
+class _Observations:
+    """Per-MAC observation lookups for the :data:`LOOKUP_FIELDS`.
+
+    Uses the indexed ``ips_for_mac`` query of the device store for the
+    observations artifact (without event observations, so both storage
+    backends agree), or else reads the artifact once into a MAC-keyed map.
+    """
+
+    def __init__(self, root: Path, path: str, store: DeviceStore | None) -> None:
+        table = ARTIFACTS.get(Path(path).stem, ("",))[0]
+        self.store = store if table == "observations" else None
+        self._spans: dict[int, dict[str, list]] = {}
+        if self.store is not None:
+            return
+        for row in artifact_rows(root, path, store):
+            mac = mac_to_int(row.get("mac"))
+            if mac is None:
+                continue
+            first = _to_int(row.get("firstDate"))
+            last = _to_int(row.get("lastDate"))
+            span = self._spans.setdefault(mac, {}).setdefault(
+                (row.get("ip") or "").strip(), [first, last]
+            )
+            if first is not None and (span[0] is None or first < span[0]):
+                span[0] = first
+            if last is not None and (span[1] is None or last > span[1]):
+                span[1] = last
+
+    def fields(self, mac: str | None) -> dict[str, str]:
+        if self.store is not None:
+            spans = self.store.ips_for_mac(mac or "", events=False)
+        else:
+            value = mac_to_int(mac)
+            found = self._spans.get(value) if value is not None else None
+            spans = [(ip, *span) for ip, span in (found or {}).items()]
+        firsts = [first for _, first, _ in spans if first is not None]
+        lasts = [last for _, _, last in spans if last is not None]
+        return {
+            "seen_ips": ";".join(ip for ip, _, _ in spans if ip),
+            "first_seen": str(min(firsts)) if firsts else "",
+            "last_seen": str(max(lasts)) if lasts else "",
+        }
+
+
+def _to_int(value: str | None) -> int | None:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
 
+class _CsvSink:
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._fh = path.open("w", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._fh)
 
-def run(**kwargs) -> int:
+    def write(self, values: list[str]) -> None:
+        self._writer.writerow(values)
+
+    def close(self) -> None:
+        self._fh.close()
+
+
+class _XlsxSink:
+    def __init__(self, path: Path, title: str) -> None:
+        from openpyxl import Workbook  # type: ignore
+
+        self.path = path
+        self._wb = Workbook(write_only=True)
+        self._ws = self._wb.create_sheet(title=title[:31] or "report")
+
+    def write(self, values: list[str]) -> None:
+        self._ws.append(values)
+
+    def close(self) -> None:
+        self._wb.save(self.path)
+
+
+class _Report:
+    """Single report definition with its open output sinks."""
+
+    def __init__(self, name: str, cfg: dict, out_dir: Path) -> None:
+        self.name = name
+        columns = cfg.get("columns") or {}
+        self.headers = list(columns.keys())
+        # templates are str.format strings; "\n" escapes are honoured even
+        # when the config was read by the fallback YAML parser
+        self.templates = [str(t).replace("\\n", "\n") for t in columns.values()]
+        fields: set[str] = set()
+        for header, template in zip(self.headers, self.templates):
+            try:
+                fields |= _check_template(template)
+            except ValueError as exc:
+                raise ValueError(f"{name}: column {header}: {exc}") from None
+        self.lookups = bool(fields & LOOKUP_FIELDS)
+        sources = cfg.get("sources") or {}
+        if isinstance(sources, list):
+            sources = {s: {} for s in sources}
+        self.sources: dict[str, dict] = {
+            str(k): dict(v or {}) for k, v in sources.items()
+        }
+        self.formats = [f.lower() for f in (cfg.get("formats") or ["csv"])]
+        self.out_dir = out_dir
+        self.sinks: list = []
+        self.rows = 0
+
+    def open(self) -> None:
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        for fmt in self.formats:
+            path = self.out_dir / f"{self.name}.{fmt}"
+            if fmt == "csv":
+                sink = _CsvSink(path)
+            elif fmt == "xlsx":
+                try:
+                    sink = _XlsxSink(path, self.name)
+                except ImportError:
+                    logger.warning(
+                        "report: %s: openpyxl not installed -> xlsx skipped", self.name
+                    )
+                    continue
+            else:
+                logger.warning("report: %s: unknown format '%s'", self.name, fmt)
+                continue
+            sink.write(self.headers)
+            self.sinks.append(sink)
+
+    def write(self, source: str, row: dict[str, str], extra: dict[str, str]) -> None:
+        values = _Row(self.sources.get(source) or {})
+        if self.lookups:
+            values.update(extra)
+        values.update((k, v) for k, v in row.items() if v not in (None, ""))
+        values["_source"] = source
+        rendered = [t.format_map(values) for t in self.templates]
+        for sink in self.sinks:
+            sink.write(rendered)
+        self.rows += 1
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.close()
+
+
+def run(
+    *,
+    root: str | Path | None = None,
+    config_file: str | Path | None = None,
+    **kwargs,
+) -> int:
     """Run the report step."""
-    return SKIPPED
+    try:
+        root = project_root(root)
+        config = load_yaml(schemas_path(root, config_file))
+        report_cfg = config.get("report") or {}
+        reports_cfg = report_cfg.get("reports") or {}
+        artifacts = report_cfg.get("artifacts") or {}
+        if not reports_cfg:
+            logger.info("report: no reports configured")
+            return SKIPPED
+
+        out_dir = root / (report_cfg.get("out_dir") or "data/reports")
+        try:
+            reports = [_Report(name, cfg or {}, out_dir) for name, cfg in reports_cfg.items()]
+        except ValueError as exc:
+            logger.error("report: invalid template: %s", exc)
+            return 1
+
+        # group reports by source so every artifact is read exactly once
+        by_source: dict[str, list[_Report]] = {}
+        for rep in reports:
+            for source in rep.sources:
+                if source not in artifacts:
+                    logger.error(
+                        "report: %s: unknown source '%s' (see report.artifacts)",
+                        rep.name,
+                        source,
+                    )
+                    return 1
+                by_source.setdefault(source, []).append(rep)
+
+        use_store = storage_backend(config) == "sqlite"
+        if use_store:
+            available = store_path(root).exists()
+        else:
+            available = any((root / artifacts[s]).exists() for s in by_source)
+        if not available:
+            logger.info("report: no interim artifacts found -> run 'interim' first")
+            return SKIPPED
+
+        store: DeviceStore | None = None
+        if use_store:
+            store = open_store(root)
+
+        observations = None
+        if any(rep.lookups for rep in reports):
+            obs_source = str(report_cfg.get("observations") or "dhcp")
+            if obs_source not in artifacts:
+                logger.error(
+                    "report: unknown observations source '%s' (see report.artifacts)",
+                    obs_source,
+                )
+                if store is not None:
+                    store.close()
+                return 1
+            observations = _Observations(root, artifacts[obs_source], store)
+
+        for rep in reports:
+            rep.open()
+        try:
+            for source, consumers in by_source.items():
+                rows = 0
+                lookups = observations is not None and any(r.lookups for r in consumers)
+                for row in artifact_rows(root, artifacts[source], store):
+                    rows += 1
+                    extra = observations.fields(row.get("mac")) if lookups else {}
+                    for rep in consumers:
+                        rep.write(source, row, extra)
+                logger.info(
+                    "report: source %s: rows=%d, reports=%d",
+                    source,
+                    rows,
+                    len(consumers),
+                )
+        finally:
+            for rep in reports:
+                rep.close()
+            if store is not None:
+                store.close()
 
+        for rep in reports:
+            logger.info(
+                "report: %s: rows=%d, outputs=%s",
+                rep.name,
+                rep.rows,
+                ",".join(str(s.path.relative_to(root)) for s in rep.sinks) or "-",
+            )
+        logger.info("report: done (reports=%d)", len(reports))
+        return DONE
+    except Exception as exc:  # pragma: no cover - minimal error handling
+        logger.error("report: unexpected error: %s", exc)
+        return 1
@@ -1,11 +1,176 @@
-"""Interim step builds temporary artifacts."""
+"""Interim step builds the lease timeline and syncs the device store.
+
+The lease/association events of the collected ``siem``, ``dhcp`` and
+``ubiq`` datasets are folded into one timeline segment,
+``data/stage/interim/leases.tl`` (see :mod:`app.stage.timeline`).  While the
+normalize prefilter outputs are up to date both of its streams are read —
+events still to be joined and events of registry devices — so no
+non-ignored device drops out of the history; otherwise the collect output is
+read directly.
+
+With ``storage.backend: sqlite`` the interim CSV artifacts
+(``data/interim/*.csv``) and the events left for joining are then loaded
+into the device store (``.pscope/store.db``, see :mod:`app.stage.store`),
+observations older than ``storage.retention_days`` are pruned and the
+device table is refreshed.
+"""
 
 from __future__ import annotations
 
-from app.pipeline.status import SKIPPED
+import time
+from pathlib import Path
+from typing import Iterator
+
+from app.pipeline.status import DONE, SKIPPED
+from app.stage.store import (
+    ARTIFACTS,
+    EVENT_SOURCE,
+    open_store,
+    retention_days,
+    storage_backend,
+)
+from app.stage.timeline import build_from_files, iter_events
+from app.collectors.files import open_csv_dicts
+from app.collectors.partitions import dataset_files
+from app.processors.normalize import REGISTRY_DATASETS, prefiltered_files
+from app.utils.addr import int_to_ipv4, int_to_mac
+from app.utils.config import load_yaml
+from app.utils.paths import project_root, schemas_path
+from app.utils.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+
+# collected datasets that carry lease/association events
+TIMELINE_DATASETS = ["siem", "dhcp", "ubiq"]
+
+
+def _event_files(root: Path, config: dict, ds: str, *, known: bool) -> list[Path]:
+    """Return event files of *ds*, prefiltered by normalize when up to date.
+
+    With *known* the events normalize routed to the known stream are
+    included; otherwise only the events that still need joining are.
+    """
+
+    collect_dir = root / "data" / "stage" / "collect"
+    files = prefiltered_files(root, ds, config, known=known)
+    if files is not None:
+        logger.info("interim: %s: using prefiltered events", ds)
+        return files
+    files = dataset_files(collect_dir, ds)
+    if not files and any(collect_dir.glob(f"{ds}.csv*")):
+        logger.warning("interim: %s: collect output not committed -> skipped", ds)
+    return files
+
+
+def _event_observations(ds: str, files: list[Path]) -> Iterator[dict[str, str]]:
+    """Yield events of *files* as observation rows of source ``events:<ds>``."""
+
+    for path in files:
+        for mac, ts, ip in iter_events(path):
+            yield {
+                "source": EVENT_SOURCE + ds,
+                "mac": int_to_mac(mac),
+                "ip": int_to_ipv4(ip) if ip else "",
+                "firstDate": str(ts),
+                "lastDate": str(ts),
+            }
+
+
+def _sync_store(root: Path, config: dict) -> int:
+    """Load interim CSV artifacts and event observations into the store.
+
+    Only events normalize left for joining (``<ds>.csv``) are loaded; known
+    and ignored traffic never reaches the store.  With
+    ``storage.retention_days`` set, observations not seen for that many days
+    are pruned afterwards.
+    """
+
+    keep_days = retention_days(config)
+    interim_dir = root / "data" / "interim"
+    loaded = 0
+    with open_store(root) as store:
+        for name in ARTIFACTS:
+            path = interim_dir / f"{name}.csv"
+            if not path.exists():
+                continue
+            rows = store.load_artifact(name, open_csv_dicts(str(path)))
+            logger.info("interim: store: %s: rows=%d", name, rows)
+            loaded += 1
+        for ds in TIMELINE_DATASETS:
+            files = _event_files(root, config, ds, known=False)
+            if not files:
+                continue
+            rows = store.upsert_observations(_event_observations(ds, files))
+            logger.info("interim: store: %s events: rows=%d", ds, rows)
+            loaded += 1
+        if loaded and keep_days:
+            before = int(time.time() * 1000) - keep_days * 86_400_000
+            pruned = store.prune(before)
+            logger.info(
+                "interim: store: pruned observations=%d (older than %d days)",
+                pruned,
+                keep_days,
+            )
+        if loaded:
+            devices = store.refresh_devices()
+            logger.info("interim: store: devices upserted=%d", devices)
+    return loaded
+
+
+def _build_timeline(root: Path, config: dict) -> bool:
+    """Build the lease timeline segment from collected event datasets.
+
+    Both streams of an up-to-date normalize prefilter are read, so devices
+    routed to the known stream (including Bloom false positives) stay in
+    the history; otherwise the collect output is read directly.
+    """
+
+    paths = []
+    for ds in TIMELINE_DATASETS:
+        paths.extend(_event_files(root, config, ds, known=True))
+    if not paths:
+        return False
+    out_path = root / "data" / "stage" / "interim" / "leases.tl"
+    with build_from_files(paths, out_path) as timeline:
+        logger.info(
+            "interim: timeline: devices=%d, events=%d -> %s",
+            timeline.device_count(),
+            len(timeline),
+            str(out_path.relative_to(root)),
+        )
+    return True
 
 
-def run(**kwargs) -> int:
-    """Run the interim step."""
-    return SKIPPED
+def run(
+    *,
+    datasets: list[str] | None = None,
+    root: str | Path | None = None,
+    config_file: str | Path | None = None,
+    **kwargs,
+) -> int:
+    """Run the interim step.
 
+    The timeline is one segment over all event datasets: when *datasets* is
+    given it is rebuilt in full if any of them feeds it (an event dataset,
+    or a registry that changes the normalize routing), and kept otherwise.
+    """
+    try:
+        root = project_root(root)
+        config = load_yaml(schemas_path(root, config_file))
+        inputs = set(TIMELINE_DATASETS) | set(REGISTRY_DATASETS)
+        if datasets and not inputs & set(datasets):
+            logger.info("interim: timeline: no event dataset changed -> kept")
+            did_work = False
+        else:
+            did_work = _build_timeline(root, config)
+        if storage_backend(config) == "sqlite":
+            if _sync_store(root, config):
+                did_work = True
+            else:
+                logger.info("interim: no interim artifacts to load into store")
+        return DONE if did_work else SKIPPED
+    except Exception as exc:  # pragma: no cover - minimal error handling
+        logger.error("interim: unexpected error: %s", exc)
+        return 1
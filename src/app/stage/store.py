@@ -0,0 +1,405 @@
+"""SQLite-backed device store for interim data.
+
+An optional alternative to the flat interim CSV artifacts (``dhcp.csv``,
+``verified.csv``, ``pending.csv``) kept in ``.pscope/store.db``.  The database
+runs in WAL mode and keeps three tables:
+
+* ``observations`` – one row per ``(source, mac, ip)`` with first/last seen,
+  from ``dhcp.csv`` and from prefiltered events (source ``events:<ds>``);
+* ``devices`` – one row per MAC aggregated from observations;
+* ``registry`` – verified/pending registry entries.
+
+Bulk loads go through ``executemany`` inside large transactions and
+observations/devices are upserted so ``firstDate`` only moves back and
+``lastDate`` only moves forward.  Steps read rows back in the interim CSV
+layout via :meth:`DeviceStore.iter_artifact`, or run indexed lookups by MAC
+or IP (checks and report do).  Observations not seen for
+``storage.retention_days`` are pruned by :meth:`DeviceStore.prune`.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from app.collectors.files import open_csv_dicts
+from app.utils.logging import get_logger
+from app.utils.resources import get_governor
+
+
+logger = get_logger(__name__)
+
+BATCH_SIZE = 50_000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS observations (
+    source TEXT NOT NULL,
+    mac TEXT NOT NULL,
+    ip TEXT NOT NULL,
+    name TEXT,
+    first_date INTEGER,
+    last_date INTEGER,
+    PRIMARY KEY (source, mac, ip)
+);
+CREATE INDEX IF NOT EXISTS observations_mac ON observations (mac);
+CREATE INDEX IF NOT EXISTS observations_ip ON observations (ip);
+
+CREATE TABLE IF NOT EXISTS devices (
+    mac TEXT PRIMARY KEY,
+    ip TEXT,
+    name TEXT,
+    source TEXT,
+    first_date INTEGER,
+    last_date INTEGER
+);
+CREATE INDEX IF NOT EXISTS devices_ip ON devices (ip);
+
+CREATE TABLE IF NOT EXISTS registry (
+    status TEXT NOT NULL,
+    type TEXT,
+    source TEXT,
+    name TEXT,
+    ip TEXT,
+    mac TEXT,
+    randmac TEXT,
+    owner TEXT,
+    note TEXT,
+    first_date INTEGER,
+    last_date INTEGER,
+    personal TEXT
+);
+CREATE INDEX IF NOT EXISTS registry_mac ON registry (mac);
+CREATE INDEX IF NOT EXISTS registry_randmac ON registry (randmac);
+CREATE INDEX IF NOT EXISTS registry_ip ON registry (ip);
+CREATE INDEX IF NOT EXISTS registry_source_mac ON registry (source, mac);
+"""
+
+# interim artifact name -> (table, registry status, CSV columns)
+ARTIFACTS: dict[str, tuple[str, str | None, list[str]]] = {
+    "dhcp": (
+        "observations",
+        None,
+        ["source", "ip", "mac", "name", "firstDate", "lastDate"],
+    ),
+    "verified": (
+        "registry",
+        "verified",
+        [
+            "type",
+            "source",
+            "name",
+            "ip",
+            "mac",
+            "randmac",
+            "owner",
+            "note",
+            "firstDate",
+            "lastDate",
+            "personal",
+        ],
+    ),
+    "pending": (
+        "registry",
+        "pending",
+        ["type", "source", "ip", "mac", "name", "firstDate", "lastDate"],
+    ),
+}
+
+# source prefix of observations loaded from events rather than dhcp.csv;
+# they take part in lookups but are not part of the dhcp artifact
+EVENT_SOURCE = "events:"
+
+# CSV column -> table column
+_COLUMNS = {"firstDate": "first_date", "lastDate": "last_date"}
+
+
+def _mac(value: str | None) -> str:
+    return (value or "").strip().upper().replace("-", ":")
+
+
+def _int(value: str | None) -> int | None:
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def _batches(rows: Iterable[tuple], size: int | None = None) -> Iterator[list[tuple]]:
+    size = size or get_governor().batch_size(BATCH_SIZE, reason="store")
+    batch: list[tuple] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def store_path(root: Path) -> Path:
+    return root / ".pscope" / "store.db"
+
+
+class DeviceStore:
+    """Thin wrapper around the ``store.db`` SQLite database."""
+
+    def __init__(self, path: str | Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(str(path))
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def __enter__(self) -> "DeviceStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._conn.commit()
+        self._conn.close()
+
+    # --- writes -----------------------------------------------------------
+
+    def upsert_observations(self, rows: Iterable[dict[str, str]]) -> int:
+        """Upsert observation rows in the ``dhcp.csv`` layout."""
+
+        sql = (
+            "INSERT INTO observations (source, mac, ip, name, first_date, last_date) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (source, mac, ip) DO UPDATE SET "
+            "name = COALESCE(NULLIF(excluded.name, ''), name), "
+            "first_date = MIN(COALESCE(first_date, excluded.first_date), "
+            "COALESCE(excluded.first_date, first_date)), "
+            "last_date = MAX(COALESCE(last_date, excluded.last_date), "
+            "COALESCE(excluded.last_date, last_date))"
+        )
+        values = (
+            (
+                (r.get("source") or "").strip(),
+                _mac(r.get("mac")),
+                (r.get("ip") or "").strip(),
+                r.get("name") or "",
+                _int(r.get("firstDate")),
+                _int(r.get("lastDate")),
+            )
+            for r in rows
+            if r.get("mac")
+        )
+        total = 0
+        with self._conn:
+            for batch in _batches(values):
+                self._conn.executemany(sql, batch)
+                total += len(batch)
+        return total
+
+    def replace_registry(self, status: str, rows: Iterable[dict[str, str]]) -> int:
+        """Replace registry entries with *status* by *rows*."""
+
+        columns = ARTIFACTS[status][2]
+        db_columns = [_COLUMNS.get(c, c) for c in columns]
+        sql = (
+            f"INSERT INTO registry (status, {', '.join(db_columns)}) "
+            f"VALUES (?, {', '.join('?' for _ in columns)})"
+        )
+
+        def _values(row: dict[str, str]) -> tuple:
+            out: list = [status]
+            for col in columns:
+                value = row.get(col) or ""
+                if col in ("mac", "randmac"):
+                    value = _mac(value)
+                elif col in _COLUMNS:
+                    value = _int(value)
+                out.append(value)
+            return tuple(out)
+
+        total = 0
+        with self._conn:
+            self._conn.execute("DELETE FROM registry WHERE status = ?", (status,))
+            for batch in _batches(_values(r) for r in rows):
+                self._conn.executemany(sql, batch)
+                total += len(batch)
+        return total
+
+    def refresh_devices(self) -> int:
+        """Upsert per-MAC device rows from the observations table."""
+
+        sql = (
+            "INSERT INTO devices (mac, ip, name, source, first_date, last_date) "
+            # bare columns come from the row holding MAX(last_date)
+            "SELECT mac, ip, name, source, "
+            "(SELECT MIN(first_date) FROM observations i WHERE i.mac = o.mac), "
+            "MAX(last_date) "
+            "FROM observations o WHERE true GROUP BY mac "
+            "ON CONFLICT (mac) DO UPDATE SET "
+            "ip = excluded.ip, name = excluded.name, source = excluded.source, "
+            "first_date = MIN(COALESCE(first_date, excluded.first_date), "
+            "COALESCE(excluded.first_date, first_date)), "
+            "last_date = MAX(COALESCE(last_date, excluded.last_date), "
+            "COALESCE(excluded.last_date, last_date))"
+        )
+        with self._conn:
+            cur = self._conn.execute(sql)
+        return cur.rowcount
+
+    def prune(self, before_ms: int) -> int:
+        """Delete observations and devices last seen before *before_ms*."""
+
+        with self._conn:
+            cur = self._conn.execute(
+                "DELETE FROM observations WHERE COALESCE(last_date, first_date) < ?",
+                (before_ms,),
+            )
+            self._conn.execute(
+                "DELETE FROM devices WHERE COALESCE(last_date, first_date) < ?",
+                (before_ms,),
+            )
+        return cur.rowcount
+
+    def load_artifact(self, name: str, rows: Iterable[dict[str, str]]) -> int:
+        """Load interim artifact *name* (``dhcp``/``verified``/``pending``)."""
+
+        table, status, _ = ARTIFACTS[name]
+        if table == "observations":
+            return self.upsert_observations(rows)
+        return self.replace_registry(status or name, rows)
+
+    # --- reads ------------------------------------------------------------
+
+    def iter_artifact(self, name: str) -> Iterator[dict[str, str]]:
+        """Yield rows of artifact *name* in its interim CSV layout."""
+
+        table, status, columns = ARTIFACTS[name]
+        db_columns = [_COLUMNS.get(c, c) for c in columns]
+        sql = f"SELECT {', '.join(db_columns)} FROM {table}"
+        params: tuple = ()
+        if status is not None:
+            sql += " WHERE status = ?"
+            params = (status,)
+        else:
+            sql += " WHERE source NOT LIKE ?"
+            params = (EVENT_SOURCE + "%",)
+        for row in self._conn.execute(sql, params):
+            yield {
+                col: "" if value is None else str(value)
+                for col, value in zip(columns, row)
+            }
+
+    def observed_macs(self, min_ips: int = 0) -> Iterator[str]:
+        """Yield MACs observed with at least *min_ips* distinct IPs."""
+
+        for (mac,) in self._conn.execute(
+            "SELECT mac FROM observations GROUP BY mac "
+            "HAVING COUNT(DISTINCT NULLIF(ip, '')) >= ? ORDER BY mac",
+            (min_ips,),
+        ):
+            yield mac
+
+    def observed_ips(self, min_macs: int = 0) -> Iterator[str]:
+        """Yield IPs observed with at least *min_macs* distinct MACs."""
+
+        for (ip,) in self._conn.execute(
+            "SELECT ip FROM observations WHERE ip != '' GROUP BY ip "
+            "HAVING COUNT(DISTINCT mac) >= ? ORDER BY ip",
+            (min_macs,),
+        ):
+            yield ip
+
+    def ips_for_mac(
+        self, mac: str, *, events: bool = True
+    ) -> list[tuple[str, int | None, int | None]]:
+        """Return ``(ip, first_date, last_date)`` observed for *mac*.
+
+        With ``events=False`` only ``dhcp`` artifact rows are used, as in
+        :meth:`iter_artifact`.
+        """
+
+        sql = "SELECT ip, MIN(first_date), MAX(last_date) FROM observations WHERE mac = ?"
+        params: tuple = (_mac(mac),)
+        if not events:
+            sql += " AND source NOT LIKE ?"
+            params += (EVENT_SOURCE + "%",)
+        return self._conn.execute(
+            sql + " GROUP BY ip ORDER BY MIN(first_date)", params
+        ).fetchall()
+
+    def macs_for_ip(self, ip: str) -> list[tuple[str, int | None, int | None]]:
+        """Return ``(mac, first_date, last_date)`` observed for *ip*."""
+
+        return self._conn.execute(
+            "SELECT mac, MIN(first_date), MAX(last_date) FROM observations "
+            "WHERE ip = ? GROUP BY mac ORDER BY MIN(first_date)",
+            (ip.strip(),),
+        ).fetchall()
+
+    def registry_for_mac(self, mac: str) -> list[dict[str, str]]:
+        """Return registry entries whose ``mac`` or ``randmac`` is *mac*."""
+
+        mac = _mac(mac)
+        cur = self._conn.execute(
+            "SELECT * FROM registry WHERE mac = ? "
+            "UNION ALL SELECT * FROM registry WHERE randmac = ?",
+            (mac, mac),
+        )
+        names = [d[0] for d in cur.description]
+        return [dict(zip(names, row)) for row in cur.fetchall()]
+
+    def registry_macs(self, statuses: Iterable[str]) -> Iterator[tuple[str, str]]:
+        """Yield distinct ``(mac, name)`` of registry entries with *statuses*."""
+
+        statuses = list(statuses)
+        if not statuses:
+            return
+        marks = ", ".join("?" for _ in statuses)
+        for mac, name in self._conn.execute(
+            f"SELECT mac, MIN(name) FROM registry WHERE status IN ({marks}) "
+            "AND mac != '' GROUP BY mac ORDER BY mac",
+            statuses,
+        ):
+            yield mac, name or ""
+
+
+def storage_backend(config: dict) -> str:
+    """Return configured interim storage backend (``csv`` or ``sqlite``)."""
+
+    return str((config.get("storage") or {}).get("backend") or "csv").lower()
+
+
+def retention_days(config: dict) -> int:
+    """Return ``storage.retention_days``; ``0`` keeps observations forever."""
+
+    value = (config.get("storage") or {}).get("retention_days")
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def open_store(root: Path) -> DeviceStore:
+    """Open the project device store at ``<root>/.pscope/store.db``."""
+
+    return DeviceStore(store_path(root))
+
+
+def artifact_rows(
+    root: Path, path: str, store: DeviceStore | None = None
+) -> Iterable[dict[str, str]]:
+    """Return rows of the interim artifact at *path*.
+
+    Rows come from *store* when one is given and knows the artifact (matched
+    by file stem, e.g. ``data/interim/dhcp.csv`` → ``dhcp``), otherwise from
+    the CSV file itself.  A missing file yields no rows.
+    """
+
+    name = Path(path).stem
+    if store is not None and name in ARTIFACTS:
+        return store.iter_artifact(name)
+    full = root / path
+    if not full.exists():
+        return []
+    return open_csv_dicts(str(full))
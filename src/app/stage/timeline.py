@@ -0,0 +1,382 @@
+"""Time-indexed lease history per device.
+
+Events ``(mac, deviceTime, ip)`` are sorted once by MAC and time and kept in
+parallel arrays (CSR layout):
+
+* ``macs`` – sorted unique MACs (48-bit ints);
+* ``offsets`` – ``offsets[i]:offsets[i + 1]`` is the event range of ``macs[i]``;
+* ``times`` – event timestamps (epoch ms), ascending within each MAC;
+* ``ips`` – IPv4 address of each event as a 32-bit int (``0`` when unknown).
+
+Range queries ("which IPs did this MAC have between t1 and t2", first/last
+seen) are two binary searches.  Timelines are saved as a flat segment file
+that :meth:`Timeline.load` memory-maps instead of reading into memory.
+
+Near the run's memory budget :func:`build_from_files` spills: buffered
+events are sorted into run segments on disk and the runs are k-way merged
+straight into the output segment, so only one buffer is held at a time.
+"""
+
+from __future__ import annotations
+
+import csv
+import heapq
+import mmap
+import re
+import shutil
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from app.collectors.files import open_text
+from app.collectors.partitions import map_partitions
+from app.utils.addr import ipv4_to_int, mac_to_int
+from app.utils.dates import to_epoch_ms
+from app.utils.logging import get_logger
+from app.utils.resources import get_governor
+
+try:  # optional vectorised sort
+    import numpy as np  # type: ignore
+except Exception:  # pragma: no cover - optional dependency
+    np = None
+
+
+logger = get_logger(__name__)
+
+_MAGIC = b"PSTL"
+_VERSION = 1
+# magic, version, byte order (0=little, 1=big), pad, n_macs, n_events
+_HEADER = struct.Struct("<4sHBxQQ")
+
+# events buffered per column chunk while merging spilled runs
+MERGE_CHUNK = 1 << 16
+
+_ASSIGNED_RE = re.compile(r"assigned (\d{1,3}(?:\.\d{1,3}){3})", re.ASCII)
+
+
+def _header(n_macs: int, n_events: int) -> bytes:
+    return _HEADER.pack(
+        _MAGIC, _VERSION, 0 if sys.byteorder == "little" else 1, n_macs, n_events
+    )
+
+
+class TimelineBuilder:
+    """Accumulate events in compact arrays and sort them into a timeline."""
+
+    def __init__(self) -> None:
+        self._macs = array("Q")
+        self._times = array("q")
+        self._ips = array("I")
+
+    def __len__(self) -> int:
+        return len(self._times)
+
+    def add(self, mac: int, ts: int, ip: int = 0) -> None:
+        self._macs.append(mac)
+        self._times.append(ts)
+        self._ips.append(ip)
+
+    def extend(self, events: Iterable[tuple[int, int, int]]) -> None:
+        for mac, ts, ip in events:
+            self.add(mac, ts, ip)
+
+    def extend_columns(self, macs: array, times: array, ips: array) -> None:
+        """Append events given as parallel ``(macs, times, ips)`` arrays."""
+
+        self._macs.extend(macs)
+        self._times.extend(times)
+        self._ips.extend(ips)
+
+    def spill(self, path: str | Path) -> None:
+        """Sort buffered events into a run segment at *path* and clear them."""
+
+        self.build().save(path)
+        self._macs, self._times, self._ips = array("Q"), array("q"), array("I")
+
+    def build(self) -> "Timeline":
+        n = len(self._times)
+        if np is not None and n:
+            macs_np = np.frombuffer(self._macs, dtype=np.uint64)
+            times_np = np.frombuffer(self._times, dtype=np.int64)
+            order = np.lexsort((times_np, macs_np))
+            sorted_macs = macs_np[order]
+            times = array("q", times_np[order].tobytes())
+            ips = array("I", np.frombuffer(self._ips, dtype=np.uint32)[order].tobytes())
+            uniq, starts = np.unique(sorted_macs, return_index=True)
+            macs = array("Q", uniq.tobytes())
+            offsets = array("Q", starts.astype(np.uint64).tobytes())
+        else:
+            order = sorted(range(n), key=lambda i: (self._macs[i], self._times[i]))
+            times = array("q", (self._times[i] for i in order))
+            ips = array("I", (self._ips[i] for i in order))
+            macs = array("Q")
+            offsets = array("Q")
+            prev = None
+            for pos, i in enumerate(order):
+                mac = self._macs[i]
+                if mac != prev:
+                    macs.append(mac)
+                    offsets.append(pos)
+                    prev = mac
+        offsets.append(n)
+        return Timeline(macs, offsets, times, ips)
+
+
+class Timeline:
+    """Per-device sorted event history with ``bisect`` range lookups."""
+
+    def __init__(self, macs, offsets, times, ips, *, _mmap: mmap.mmap | None = None) -> None:
+        self.macs = macs
+        self.offsets = offsets
+        self.times = times
+        self.ips = ips
+        self._mmap = _mmap
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def __enter__(self) -> "Timeline":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            for view in (self.macs, self.offsets, self.times, self.ips):
+                view.release()
+            self._mmap.close()
+            self._mmap = None
+
+    def _span(self, mac: int) -> tuple[int, int]:
+        idx = bisect_left(self.macs, mac)
+        if idx >= len(self.macs) or self.macs[idx] != mac:
+            return 0, 0
+        return self.offsets[idx], self.offsets[idx + 1]
+
+    def device_count(self) -> int:
+        return len(self.macs)
+
+    def first_last(self, mac: int) -> tuple[int, int] | None:
+        """Return ``(first_seen, last_seen)`` for *mac* or ``None``."""
+
+        lo, hi = self._span(mac)
+        if lo == hi:
+            return None
+        return self.times[lo], self.times[hi - 1]
+
+    def events(self, mac: int, t1: int | None = None, t2: int | None = None) -> Iterator[tuple[int, int]]:
+        """Yield ``(time, ip)`` for *mac* with ``t1 <= time <= t2``."""
+
+        lo, hi = self._span(mac)
+        if t1 is not None:
+            lo = bisect_left(self.times, t1, lo, hi)
+        if t2 is not None:
+            hi = bisect_right(self.times, t2, lo, hi)
+        for pos in range(lo, hi):
+            yield self.times[pos], self.ips[pos]
+
+    def rows(self) -> Iterator[tuple[int, int, int]]:
+        """Yield all ``(mac, time, ip)`` events in timeline order."""
+
+        for i, mac in enumerate(self.macs):
+            for pos in range(self.offsets[i], self.offsets[i + 1]):
+                yield mac, self.times[pos], self.ips[pos]
+
+    def ips_between(self, mac: int, t1: int, t2: int) -> set[int]:
+        """Return distinct IPs *mac* had between *t1* and *t2* (inclusive)."""
+
+        return {ip for _, ip in self.events(mac, t1, t2) if ip}
+
+    def ip_at(self, mac: int, ts: int) -> int | None:
+        """Return the IP of the latest event of *mac* at or before *ts*."""
+
+        lo, hi = self._span(mac)
+        pos = bisect_right(self.times, ts, lo, hi) - 1
+        if pos < lo:
+            return None
+        return self.ips[pos] or None
+
+    # --- on-disk segment --------------------------------------------------
+
+    def save(self, path: str | Path) -> None:
+        """Write the timeline as a segment file (atomically)."""
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with tmp.open("wb") as fh:
+            fh.write(_header(len(self.macs), len(self.times)))
+            for column in (self.macs, self.offsets, self.times, self.ips):
+                fh.write(memoryview(column).cast("B"))
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "Timeline":
+        """Memory-map segment file at *path*."""
+
+        with open(path, "rb") as fh:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, order, n_macs, n_events = _HEADER.unpack_from(mm, 0)
+        if magic != _MAGIC or version != _VERSION:
+            mm.close()
+            raise ValueError(f"not a timeline segment: {path}")
+        native = 0 if sys.byteorder == "little" else 1
+        layout = [("Q", n_macs), ("Q", n_macs + 1), ("q", n_events), ("I", n_events)]
+        pos = _HEADER.size
+        if order != native:
+            # foreign byte order: fall back to loading and swapping
+            columns = []
+            for code, count in layout:
+                column = array(code)
+                column.frombytes(mm[pos : pos + count * column.itemsize])
+                column.byteswap()
+                columns.append(column)
+                pos += count * column.itemsize
+            mm.close()
+            return cls(*columns)
+        buf = memoryview(mm)
+        views = []
+        for code, count in layout:
+            size = count * array(code).itemsize
+            views.append(buf[pos : pos + size].cast(code))
+            pos += size
+        buf.release()
+        return cls(*views, _mmap=mm)
+
+
+def iter_events(path: str | Path) -> Iterator[tuple[int, int, int]]:
+    """Yield ``(mac, time_ms, ip)`` events from a collected CSV file.
+
+    Uses the ``mac`` and ``date`` columns; the IP comes from an ``ip`` column
+    or, for siem/dhcp exports, from ``payload`` (``... assigned <ip> for ...``).
+    Rows without a valid MAC or time are skipped.
+    """
+
+    with open_text(path) as fh:
+        reader = csv.DictReader(fh)
+        for row in reader:
+            mac = mac_to_int(row.get("mac"))
+            ts = to_epoch_ms(row.get("date"))
+            if mac is None or ts is None:
+                continue
+            ip = ipv4_to_int(row.get("ip"))
+            if ip is None:
+                match = _ASSIGNED_RE.search(row.get("payload") or "")
+                ip = ipv4_to_int(match.group(1)) if match else None
+            yield mac, ts, ip or 0
+
+
+def read_events(path: str | Path) -> tuple[array, array, array]:
+    """Return events of *path* as parallel ``(macs, times, ips)`` arrays."""
+
+    macs, times, ips = array("Q"), array("q"), array("I")
+    for mac, ts, ip in iter_events(path):
+        macs.append(mac)
+        times.append(ts)
+        ips.append(ip)
+    return macs, times, ips
+
+
+def merge_runs(runs: list[Path], path: str | Path) -> None:
+    """K-way merge sorted run segments *runs* into one segment at *path*.
+
+    Columns are streamed into side files in chunks of :data:`MERGE_CHUNK`
+    events and concatenated behind the header, so memory use stays flat.
+    """
+
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    names = ("macs", "offsets", "times", "ips")
+    parts = {name: tmp.with_name(f"{tmp.name}.{name}") for name in names}
+    timelines = [Timeline.load(run) for run in runs]
+    handles = {name: part.open("wb") for name, part in parts.items()}
+    try:
+        columns = {
+            "macs": array("Q"),
+            "offsets": array("Q"),
+            "times": array("q"),
+            "ips": array("I"),
+        }
+
+        def flush() -> None:
+            for name, column in columns.items():
+                handles[name].write(memoryview(column).cast("B"))
+                del column[:]
+
+        n_macs = n_events = 0
+        prev = None
+        for mac, ts, ip in heapq.merge(*(t.rows() for t in timelines)):
+            if mac != prev:
+                columns["macs"].append(mac)
+                columns["offsets"].append(n_events)
+                n_macs += 1
+                prev = mac
+            columns["times"].append(ts)
+            columns["ips"].append(ip)
+            n_events += 1
+            if len(columns["times"]) >= MERGE_CHUNK:
+                flush()
+        columns["offsets"].append(n_events)
+        flush()
+        for fh in handles.values():
+            fh.close()
+        with tmp.open("wb") as out:
+            out.write(_header(n_macs, n_events))
+            for name in names:
+                with parts[name].open("rb") as fh:
+                    shutil.copyfileobj(fh, out)
+        tmp.replace(path)
+    finally:
+        for fh in handles.values():
+            fh.close()
+        for timeline in timelines:
+            timeline.close()
+        for part in parts.values():
+            part.unlink(missing_ok=True)
+        tmp.unlink(missing_ok=True)
+
+
+def build_from_files(
+    paths: Iterable[str | Path],
+    out_path: str | Path,
+    *,
+    jobs: int | None = None,
+) -> Timeline:
+    """Build a timeline segment at *out_path* from collected event files.
+
+    Files (e.g. partitions) are parsed in parallel by up to *jobs* processes.
+    Near the run's memory budget they are parsed one at a time and, whenever
+    the budget is still exceeded after a file, the buffered events are
+    spilled to a sorted run next to *out_path*; the runs are then merged into
+    the segment.  The returned timeline is memory-mapped from *out_path*.
+    """
+
+    out_path = Path(out_path)
+    governor = get_governor()
+    if governor.should_spill("timeline"):
+        jobs = 1
+    runs_dir = out_path.with_name(out_path.name + ".runs")
+    runs: list[Path] = []
+    builder = TimelineBuilder()
+    try:
+        for columns in map_partitions(read_events, paths, jobs=jobs):
+            builder.extend_columns(*columns)
+            if len(builder) and governor.should_spill("timeline"):
+                runs_dir.mkdir(parents=True, exist_ok=True)
+                runs.append(runs_dir / f"run-{len(runs):04d}.tl")
+                builder.spill(runs[-1])
+        if not runs:
+            builder.build().save(out_path)
+        else:
+            if len(builder):
+                runs.append(runs_dir / f"run-{len(runs):04d}.tl")
+                builder.spill(runs[-1])
+            logger.info("timeline: merging %d spilled runs", len(runs))
+            merge_runs(runs, out_path)
+    finally:
+        shutil.rmtree(runs_dir, ignore_errors=True)
+    return Timeline.load(out_path)
@@ -0,0 +1,89 @@
+"""Bloom filter for compact set membership tests.
+
+A :class:`BloomFilter` answers "maybe present" / "definitely absent" using a
+fixed bit array sized for *capacity* items at false-positive rate
+*error_rate*; it never gives false negatives.  Keys are ints (e.g. MACs as
+48-bit ints, see :mod:`app.utils.addr`), strings or bytes.  Bit positions
+come from double hashing of one 128-bit BLAKE2b digest per key; the bit
+count is prime so every probe sequence covers the whole array.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import math
+from typing import Iterable
+
+# smallest bit array; tiny arrays make double-hashed probes collide
+MIN_BITS = 1024
+
+
+def _next_prime(n: int) -> int:
+    n = max(n, 2)
+    if n > 2 and n % 2 == 0:
+        n += 1
+    while True:
+        if n == 2 or (n % 2 and all(n % d for d in range(3, math.isqrt(n) + 1, 2))):
+            return n
+        n += 2
+
+
+def _key_bytes(key: int | str | bytes) -> bytes:
+    if isinstance(key, int):
+        return key.to_bytes(8, "little", signed=key < 0)
+    if isinstance(key, str):
+        return key.encode("utf-8")
+    return bytes(key)
+
+
+class BloomFilter:
+    """Probabilistic set sized for *capacity* items at *error_rate*."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001) -> None:
+        if not 0 < error_rate < 1:
+            raise ValueError(f"invalid error_rate: {error_rate!r}")
+        capacity = max(int(capacity), 1)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = _next_prime(
+            max(
+                int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))),
+                MIN_BITS,
+            )
+        )
+        self.hashes = max(int(round(-math.log2(error_rate))), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    @classmethod
+    def from_items(
+        cls, items: Iterable[int | str | bytes], capacity: int, error_rate: float = 0.001
+    ) -> "BloomFilter":
+        bloom = cls(capacity, error_rate)
+        for item in items:
+            bloom.add(item)
+        return bloom
+
+    def _positions(self, key: int | str | bytes) -> list[int]:
+        digest = hashlib.blake2b(_key_bytes(key), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, key: int | str | bytes) -> None:
+        bits = self.bits
+        for pos in self._positions(key):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: int | str | bytes) -> bool:
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.bits)
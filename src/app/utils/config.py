@@ -0,0 +1,99 @@
+"""Helpers for loading YAML configuration files."""
+
+from __future__ import annotations
+
+import copy
+from pathlib import Path
+
+
+def _simple_yaml_parse(text: str) -> dict:
+    """Very small YAML subset parser used when PyYAML is unavailable."""
+
+    import ast
+
+    root: dict = {}
+    stack: list[tuple[int, dict]] = [(0, root)]
+
+    for raw_line in text.splitlines():
+        if not raw_line.strip() or raw_line.lstrip().startswith("#"):
+            continue
+        indent = len(raw_line) - len(raw_line.lstrip(" "))
+        level = indent // 2
+        line = raw_line.strip()
+        if ":" not in line:
+            continue
+        key, value_part = line.split(":", 1)
+        key = key.strip()
+        value_part = value_part.strip()
+        if value_part and not (
+            (value_part.startswith('"') and value_part.endswith('"'))
+            or (value_part.startswith("'") and value_part.endswith("'"))
+        ):
+            if "#" in value_part:
+                value_part = value_part.split("#", 1)[0].strip()
+
+        while stack and stack[-1][0] >= level + 1:
+            stack.pop()
+        current = stack[-1][1]
+
+        if not value_part:
+            new_dict: dict = {}
+            current[key] = new_dict
+            stack.append((level + 1, new_dict))
+            continue
+
+        if value_part.startswith("{") or value_part.startswith("["):
+            try:
+                value = ast.literal_eval(value_part)
+            except Exception:
+                value = {}
+        elif value_part in {"true", "false"}:
+            value = value_part == "true"
+        elif (value_part.startswith('"') and value_part.endswith('"')) or (
+            value_part.startswith("'") and value_part.endswith("'")
+        ):
+            value = value_part[1:-1]
+        else:
+            try:
+                value = ast.literal_eval(value_part)
+            except Exception:
+                value = value_part
+
+        current[key] = value
+
+    return root
+
+
+def _parse_yaml(text: str) -> dict:
+    try:  # prefer PyYAML when available
+        import yaml  # type: ignore
+
+        return yaml.safe_load(text) or {}
+    except Exception:
+        return _simple_yaml_parse(text)
+
+
+# resolved path -> ((size, mtime_ns), parsed mapping)
+_CACHE: dict[str, tuple[tuple[int, int], dict]] = {}
+
+
+def load_yaml(path: Path) -> dict:
+    """Load YAML mapping from *path*, preferring PyYAML when available.
+
+    Parsed files are cached in process until their size or mtime changes,
+    so steps and pipelines sharing a config parse it once; callers get a
+    deep copy they may modify.  Returns an empty dict when the file does
+    not exist.
+    """
+
+    try:
+        st = path.stat()
+    except OSError:
+        return {}
+    key = str(path.resolve())
+    stamp = (st.st_size, st.st_mtime_ns)
+    cached = _CACHE.get(key)
+    if cached is None or cached[0] != stamp:
+        cached = (stamp, _parse_yaml(path.read_text(encoding="utf-8")))
+        _CACHE[key] = cached
+    return copy.deepcopy(cached[1])
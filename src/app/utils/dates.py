@@ -0,0 +1,43 @@
+"""Parsing of event timestamps found in raw exports."""
+
+from __future__ import annotations
+
+from datetime import datetime, timezone
+
+# UniFi export format, e.g. "Aug 07 2025 3:01 PM"
+UBIQ_DATE = "%b %d %Y %I:%M %p"
+
+# epoch ms of 10000-01-01, the first instant datetime cannot represent
+MAX_EPOCH_MS = 253_402_300_800_000
+
+
+def to_epoch_ms(value: str | None) -> int | None:
+    """Return epoch milliseconds for *value* or ``None`` if it is not a time.
+
+    Accepts epoch milliseconds (SIEM ``deviceTime``) in ``0..MAX_EPOCH_MS``
+    and the UniFi format; the latter is taken as UTC.
+    """
+
+    value = (value or "").strip()
+    if not value:
+        return None
+    if value.isascii() and value.isdigit():
+        ms = int(value)
+        return ms if 0 <= ms < MAX_EPOCH_MS else None
+    try:
+        dt = datetime.strptime(value, UBIQ_DATE).replace(tzinfo=timezone.utc)
+        return int(dt.timestamp() * 1000)
+    except (OverflowError, OSError, ValueError):
+        return None
+
+
+def to_day(value: str | None) -> str | None:
+    """Return the UTC day ``YYYY-MM-DD`` of time *value* or ``None``."""
+
+    ms = to_epoch_ms(value)
+    if ms is None:
+        return None
+    try:
+        return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+    except (OverflowError, OSError, ValueError):
+        return None
@@ -0,0 +1,106 @@
+"""Resolve raw CSV headers to canonical field names.
+
+:class:`HeaderResolver` compiles the ``validate.datasets.*.fields`` aliases of
+``configs/schemas.yml`` once into per-dataset lookup tables (normalised alias
+→ canonical field) and memoises every raw header it has seen, so repeated
+headers are resolved with a single dict lookup.  Resolvers are cached in
+process per schemas hash and shared by validate and collect.
+"""
+
+from __future__ import annotations
+
+from typing import Callable
+
+
+def build_normalizer(settings: dict) -> Callable[..., str]:
+    """Return header normaliser configured by ``normalize_headers`` *settings*."""
+
+    remove_bom = settings.get("remove_bom", False)
+    trim = settings.get("trim", False)
+    collapse = settings.get("collapse_spaces", False)
+    casefold = settings.get("casefold", False)
+
+    def normalize(value: str, *, is_first: bool = False) -> str:
+        if is_first and remove_bom and value.startswith("\ufeff"):
+            value = value.lstrip("\ufeff")
+        if trim:
+            value = value.strip()
+        if collapse:
+            value = " ".join(value.split())
+        if casefold:
+            value = value.casefold()
+        return value
+
+    return normalize
+
+
+class HeaderResolver:
+    """Precompiled raw header → canonical field lookup for all datasets."""
+
+    def __init__(self, validate_cfg: dict) -> None:
+        settings = validate_cfg.get("settings") or {}
+        self.normalize = build_normalizer(settings.get("normalize_headers", {}))
+        self.fields: dict[str, dict[str, dict]] = {}
+        self._aliases: dict[str, dict[str, str]] = {}
+        self._memo: dict[str, dict[tuple[str, bool], str | None]] = {}
+        for ds_name, ds in (validate_cfg.get("datasets") or {}).items():
+            fields_cfg = (ds or {}).get("fields") or {}
+            field_defs: dict[str, dict] = {}
+            alias_map: dict[str, str] = {}
+            for canonical, info in fields_cfg.items():
+                info = info or {}
+                aliases_raw = info.get("headers") or []
+                aliases_norm = [self.normalize(h) for h in aliases_raw]
+                field_defs[canonical] = {
+                    "aliases": aliases_norm,
+                    "aliases_raw": aliases_raw,
+                    "required": bool(info.get("required")),
+                    "check": info.get("check", "any"),
+                }
+                for a in aliases_norm:
+                    alias_map.setdefault(a, canonical)
+            self.fields[ds_name] = field_defs
+            self._aliases[ds_name] = alias_map
+            self._memo[ds_name] = {}
+
+    def canonical(self, ds_name: str, header: str, *, is_first: bool = False) -> str | None:
+        """Return canonical field for raw *header* of *ds_name* or ``None``."""
+
+        memo = self._memo.get(ds_name)
+        if memo is None:
+            return None
+        key = (header, is_first)
+        try:
+            return memo[key]
+        except KeyError:
+            pass
+        canonical = self._aliases[ds_name].get(self.normalize(header, is_first=is_first))
+        memo[key] = canonical
+        return canonical
+
+    def resolve(self, ds_name: str, headers: list[str]) -> dict[str, tuple[str, int]]:
+        """Map canonical fields to ``(raw header, column index)`` in *headers*.
+
+        The first column matching a field wins; order follows *headers*.
+        """
+
+        found: dict[str, tuple[str, int]] = {}
+        for idx, header in enumerate(headers):
+            canonical = self.canonical(ds_name, header, is_first=idx == 0)
+            if canonical and canonical not in found:
+                found[canonical] = (header, idx)
+        return found
+
+
+_RESOLVERS: dict[str, HeaderResolver] = {}
+
+
+def get_resolver(validate_cfg: dict, schemas_hash: str) -> HeaderResolver:
+    """Return the cached resolver for *schemas_hash*, compiling it if needed."""
+
+    resolver = _RESOLVERS.get(schemas_hash)
+    if resolver is None:
+        resolver = HeaderResolver(validate_cfg)
+        _RESOLVERS.clear()
+        _RESOLVERS[schemas_hash] = resolver
+    return resolver
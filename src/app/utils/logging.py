@@ -1,10 +1,141 @@
+"""Logging setup for PrimeScope.
+
+Records are handed to a :class:`logging.handlers.QueueHandler` on the caller's
+thread and written by a :class:`logging.handlers.QueueListener` running in a
+background thread, so steps that log heavily (e.g. validate content errors)
+are not blocked on terminal or disk I/O.
+"""
+
 from __future__ import annotations
 
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import threading
+from datetime import datetime, timezone
 from pathlib import Path
 
 
-def setup_logging(level: str = "INFO", log_file: str = "logs/pscope.log") -> None:
+_listener: logging.handlers.QueueListener | None = None
+_queue_handler: "_RateLimitedQueueHandler | None" = None
+
+
+class _JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects (JSON-lines)."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        suppressed = getattr(record, "suppressed", None)
+        if suppressed is not None:
+            entry["suppressed"] = suppressed
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _RateLimitedQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that rate-limits records per message template.
+
+    At most *burst* records sharing the same ``(logger, level, template)`` are
+    enqueued per *window* seconds.  The rest are counted and reported as a
+    single "suppressed N similar messages" record when the window rolls over
+    or when logging shuts down.
+    """
+
+    def __init__(self, q: queue.Queue, *, burst: int, window: float) -> None:
+        super().__init__(q)
+        self.burst = burst
+        self.window = window
+        # key -> [window_start, emitted, suppressed, last_record]
+        self._windows: dict[tuple, list] = {}
+        self._windows_lock = threading.Lock()
+
+    def _summary(self, key: tuple, count: int, last: logging.LogRecord) -> logging.LogRecord:
+        name, levelno, template = key
+        return logging.makeLogRecord(
+            {
+                "name": name,
+                "levelno": levelno,
+                "levelname": logging.getLevelName(levelno),
+                "msg": "suppressed %d similar messages: %s",
+                "args": (count, template),
+                "suppressed": count,
+                "created": last.created,
+            }
+        )
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.burst <= 0:
+            super().emit(record)
+            return
+
+        key = (record.name, record.levelno, str(record.msg))
+        now = record.created
+        summary = None
+        with self._windows_lock:
+            state = self._windows.get(key)
+            if state is None or now - state[0] >= self.window:
+                if state is not None and state[2]:
+                    summary = self._summary(key, state[2], state[3])
+                state = [now, 0, 0, record]
+                self._windows[key] = state
+            if state[1] >= self.burst:
+                state[2] += 1
+                state[3] = record
+                return
+            state[1] += 1
+
+        if summary is not None:
+            super().emit(summary)
+        super().emit(record)
+
+    def flush_suppressed(self) -> None:
+        """Emit pending "suppressed" summaries for all templates."""
+
+        with self._windows_lock:
+            pending = [
+                self._summary(key, state[2], state[3])
+                for key, state in self._windows.items()
+                if state[2]
+            ]
+            self._windows.clear()
+        for summary in pending:
+            super().emit(summary)
+
+
+def setup_logging(
+    level: str = "INFO",
+    log_file: str = "logs/pscope.log",
+    *,
+    json_file: str | None = None,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    buffer_capacity: int = 512,
+    burst: int = 50,
+    window: float = 10.0,
+) -> None:
+    """Configure root logging with a background writer thread.
+
+    Console and file output (``logs/pscope.log``, rotated at *max_bytes*) are
+    written by a queue listener.  File output is buffered and flushed every
+    *buffer_capacity* records, on ``ERROR`` and higher records (so step
+    failures reach disk at once) and at shutdown.
+    When *json_file* (or the ``PSCOPE_LOG_JSON`` environment variable) is set,
+    a JSON-lines sink is added as well.  Records repeating the same message
+    template more than *burst* times per *window* seconds are suppressed and
+    summarised; ``burst=0`` disables rate limiting.
+    """
+
+    global _listener, _queue_handler
+
     root = logging.getLogger()
     if root.handlers:
         return
@@ -19,13 +150,61 @@ def setup_logging(level: str = "INFO", log_file: str = "logs/pscope.log") -> Non
 
     console = logging.StreamHandler()
     console.setFormatter(formatter)
-    root.addHandler(console)
 
-    file_handler = logging.FileHandler(path, encoding="utf-8")
+    file_handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+    )
     file_handler.setFormatter(formatter)
-    root.addHandler(file_handler)
+    buffered_file = logging.handlers.MemoryHandler(
+        buffer_capacity, flushLevel=logging.ERROR, target=file_handler
+    )
+
+    handlers: list[logging.Handler] = [console, buffered_file]
+
+    json_file = json_file or os.environ.get("PSCOPE_LOG_JSON") or None
+    if json_file:
+        json_path = Path(json_file)
+        json_path.parent.mkdir(parents=True, exist_ok=True)
+        json_handler = logging.handlers.RotatingFileHandler(
+            json_path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        )
+        json_handler.setFormatter(_JsonFormatter())
+        handlers.append(
+            logging.handlers.MemoryHandler(
+                buffer_capacity, flushLevel=logging.ERROR, target=json_handler
+            )
+        )
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    _queue_handler = _RateLimitedQueueHandler(log_queue, burst=burst, window=window)
+    root.addHandler(_queue_handler)
+
+    _listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging() -> None:
+    """Flush pending records and stop the background writer thread."""
+
+    global _listener, _queue_handler
+
+    if _queue_handler is not None:
+        _queue_handler.flush_suppressed()
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            target = getattr(handler, "target", None)
+            handler.close()
+            if target is not None:
+                target.close()
+        _listener = None
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
 
 
 def get_logger(name: str) -> logging.Logger:
     return logging.getLogger(name)
-
@@ -0,0 +1,27 @@
+"""Project root and configuration paths.
+
+Steps take an optional ``root`` (the data root holding ``data/``,
+``configs/`` and ``.pscope/``) and ``config_file`` (a ``schemas.yml`` shared
+by several roots).  Without them the source checkout is used, as before.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+# checkout containing src/app (default data root)
+SOURCE_ROOT = Path(__file__).resolve().parents[3]
+
+
+def project_root(root: str | Path | None = None) -> Path:
+    """Return *root* resolved, or the source checkout when it is ``None``."""
+
+    return Path(root).resolve() if root is not None else SOURCE_ROOT
+
+
+def schemas_path(root: Path, config_file: str | Path | None = None) -> Path:
+    """Return *config_file*, or ``configs/schemas.yml`` under *root*."""
+
+    if config_file is not None:
+        return Path(config_file).resolve()
+    return root / "configs" / "schemas.yml"
@@ -0,0 +1,220 @@
+"""Process-wide resource governor.
+
+Limits come from the ``resources`` block of ``configs/schemas.yml`` and can be
+overridden on the command line (``run --max-memory 2G --jobs 4``)::
+
+    resources:
+      max_memory: 2G      # RSS budget of the run; null = unlimited
+      jobs: 4             # max worker processes/threads; null = CPU count
+      spill_ratio: 0.8    # spill to disk once RSS reaches this share
+
+Steps query the governor returned by :func:`get_governor` to size batches,
+to decide when buffering aggregations must spill to disk and to cap worker
+pools.  Every throttling decision is logged once per reason and counted.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+from pathlib import Path
+
+from app.utils.config import load_yaml
+from app.utils.logging import get_logger
+from app.utils.paths import project_root, schemas_path
+
+
+logger = get_logger(__name__)
+
+_UNITS = {"": 1, "B": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+# smallest batch handed out by Governor.batch_size
+MIN_BATCH = 1_000
+
+
+def _unset(value) -> bool:
+    # the fallback YAML parser keeps "null" as text and empty keys as {}
+    return value in (None, "", "null", "~", {})
+
+
+def parse_size(value) -> int | None:
+    """Parse ``2G``, ``512M``, ``1.5GB`` or a byte count; empty gives ``None``."""
+
+    if _unset(value):
+        return None
+    if isinstance(value, (int, float)):
+        size = float(value)
+    else:
+        text = str(value).strip().upper().removesuffix("IB").removesuffix("B")
+        if not text:
+            return None
+        unit = text[-1] if text[-1] in _UNITS else ""
+        number = text[: -1] if unit else text
+        try:
+            size = float(number) * _UNITS[unit]
+        except ValueError:
+            raise ValueError(f"invalid size: {value!r}") from None
+    # inf/nan would overflow int() below
+    if not math.isfinite(size) or size <= 0:
+        raise ValueError(f"invalid size: {value!r}")
+    return int(size)
+
+
+def _format_size(size: int) -> str:
+    for unit in ("G", "M", "K"):
+        if size >= _UNITS[unit]:
+            return f"{size / _UNITS[unit]:.1f}{unit}"
+    return f"{size}B"
+
+
+def current_rss() -> int:
+    """Return resident set size of this process in bytes."""
+
+    try:
+        with open("/proc/self/statm", "rb") as fh:
+            pages = int(fh.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:  # pragma: no cover - non-Linux fallback (peak, not current RSS)
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except Exception:  # pragma: no cover
+        return 0
+
+
+class Governor:
+    """Memory budget and worker limits shared by all steps of a run."""
+
+    def __init__(
+        self,
+        max_memory: int | None = None,
+        jobs: int | None = None,
+        spill_ratio: float = 0.8,
+    ) -> None:
+        self.max_memory = max_memory
+        self.jobs = jobs
+        self.spill_ratio = spill_ratio
+        self.peak_rss = 0
+        self.throttled: dict[str, int] = {}
+
+    def rss(self) -> int:
+        rss = current_rss()
+        self.peak_rss = max(self.peak_rss, rss)
+        return rss
+
+    def throttle(self, reason: str, msg: str, *args) -> None:
+        """Count a throttling decision and log it the first time per *reason*."""
+
+        count = self.throttled.get(reason, 0)
+        self.throttled[reason] = count + 1
+        if not count:
+            logger.warning("resources: throttled (%s): " + msg, reason, *args)
+
+    def headroom(self) -> int | None:
+        """Bytes left before the spill threshold, ``None`` when unlimited."""
+
+        if self.max_memory is None:
+            return None
+        return max(int(self.max_memory * self.spill_ratio) - self.rss(), 0)
+
+    def should_spill(self, reason: str = "spill") -> bool:
+        """Return True when RSS reached the spill threshold of the budget."""
+
+        headroom = self.headroom()
+        if headroom is None or headroom > 0:
+            return False
+        self.throttle(
+            reason,
+            "rss=%s reached spill threshold of max_memory=%s",
+            _format_size(self.peak_rss),
+            _format_size(self.max_memory or 0),
+        )
+        return True
+
+    def memory_budget(self, requested: int, reason: str = "memory") -> int:
+        """Return *requested* bytes capped by the remaining headroom."""
+
+        headroom = self.headroom()
+        if headroom is None or requested <= headroom:
+            return requested
+        self.throttle(
+            reason,
+            "budget %s -> %s",
+            _format_size(requested),
+            _format_size(headroom),
+        )
+        return max(headroom, 1)
+
+    def workers(self, requested: int | None = None, reason: str = "workers") -> int:
+        """Return worker count for a pool: *requested* (or CPUs) capped by jobs."""
+
+        wanted = requested or os.cpu_count() or 1
+        if self.jobs is not None and wanted > self.jobs:
+            if requested:
+                self.throttle(reason, "workers %d -> %d", wanted, self.jobs)
+            return max(self.jobs, 1)
+        return max(wanted, 1)
+
+    def batch_size(self, default: int, row_bytes: int = 256, reason: str = "batch") -> int:
+        """Return batch size of at most *default* rows fitting the headroom.
+
+        A batch may take a quarter of the remaining headroom, assuming about
+        *row_bytes* per buffered row.
+        """
+
+        headroom = self.headroom()
+        if headroom is None:
+            return default
+        size = max(headroom // 4 // max(row_bytes, 1), MIN_BATCH)
+        if size >= default:
+            return default
+        self.throttle(reason, "batch %d -> %d rows", default, size)
+        return size
+
+    def summary(self) -> None:
+        """Log peak RSS and throttling counters."""
+
+        self.rss()
+        logger.info(
+            "resources: peak_rss=%s, max_memory=%s, jobs=%s, throttled=%s",
+            _format_size(self.peak_rss),
+            _format_size(self.max_memory) if self.max_memory else "-",
+            self.jobs or "-",
+            ",".join(f"{k}:{v}" for k, v in sorted(self.throttled.items())) or "-",
+        )
+
+
+_GOVERNOR: Governor | None = None
+
+
+def configure(
+    root: str | Path | None = None,
+    *,
+    config_file: str | Path | None = None,
+    max_memory: str | int | None = None,
+    jobs: int | None = None,
+) -> Governor:
+    """Create the process governor from ``schemas.yml`` and CLI overrides."""
+
+    global _GOVERNOR
+    config_path = schemas_path(project_root(root), config_file)
+    cfg = load_yaml(config_path).get("resources") or {}
+    if max_memory is None:
+        max_memory = cfg.get("max_memory")
+    if jobs is None:
+        jobs = cfg.get("jobs")
+    spill_ratio = cfg.get("spill_ratio")
+    _GOVERNOR = Governor(
+        max_memory=parse_size(max_memory),
+        jobs=None if _unset(jobs) else int(jobs),
+        spill_ratio=0.8 if _unset(spill_ratio) else float(spill_ratio),
+    )
+    return _GOVERNOR
+
+
+def get_governor() -> Governor:
+    """Return the process governor, configuring it from ``schemas.yml`` once."""
+
+    return _GOVERNOR if _GOVERNOR is not None else configure()
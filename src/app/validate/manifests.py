@@ -0,0 +1,269 @@
+"""SQLite store of validate manifests (``.pscope/manifests.db``).
+
+Manifests are stored normalised instead of as one JSON document per run:
+
+* ``entries`` – manifest file entries, content-addressed by a hash of their
+  JSON, so an unchanged file is stored once across runs;
+* ``filesets`` – the ordered file list of a dataset, also content-addressed,
+  so a dataset whose files did not change adds no rows at all;
+* ``runs`` / ``run_datasets`` – top-level and per-dataset fields of each run;
+* ``meta`` – the ``latest`` run id.
+
+Saving a run therefore writes only what changed since earlier runs, the
+latest manifest is resolved by one key lookup, retention deletes old runs and
+drops entries no run references, and a single file's entry can be looked up
+by path.  :meth:`ManifestStore.load` returns the manifest in the same dict
+layout validate produces.  ``.pscope/latest.json`` is still written for
+external tools and read as a fallback for trees validated before the store
+existed (see :func:`load_latest`).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+from pathlib import Path
+
+from app.utils.logging import get_logger
+
+
+logger = get_logger(__name__)
+
+KEEP_RUNS = 20
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE,
+    path TEXT NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_path ON entries (path);
+
+CREATE TABLE IF NOT EXISTS filesets (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE
+);
+
+CREATE TABLE IF NOT EXISTS fileset_entries (
+    fileset_id INTEGER NOT NULL,
+    pos INTEGER NOT NULL,
+    entry_id INTEGER NOT NULL,
+    PRIMARY KEY (fileset_id, pos)
+);
+CREATE INDEX IF NOT EXISTS fileset_entries_entry ON fileset_entries (entry_id);
+
+CREATE TABLE IF NOT EXISTS runs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_id TEXT NOT NULL UNIQUE,
+    body TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS run_datasets (
+    run_id TEXT NOT NULL,
+    dataset TEXT NOT NULL,
+    pos INTEGER NOT NULL,
+    fileset_id INTEGER NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (run_id, dataset)
+);
+CREATE INDEX IF NOT EXISTS run_datasets_fileset ON run_datasets (fileset_id);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ManifestStore:
+    """Validate manifests of a project kept in SQLite."""
+
+    def __init__(self, path: str | Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(str(path))
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def __enter__(self) -> "ManifestStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._conn.commit()
+        self._conn.close()
+
+    # --- writing ----------------------------------------------------------
+
+    def _id(self, table: str, digest: str) -> int | None:
+        row = self._conn.execute(
+            f"SELECT id FROM {table} WHERE hash = ?", (digest,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _entry_id(self, info: dict) -> tuple[int, str]:
+        body = _dumps(info)
+        digest = _hash(body)
+        entry_id = self._id("entries", digest)
+        if entry_id is None:
+            cur = self._conn.execute(
+                "INSERT INTO entries (hash, path, body) VALUES (?, ?, ?)",
+                (digest, info.get("path", ""), body),
+            )
+            entry_id = cur.lastrowid
+        return entry_id, digest
+
+    def _fileset_id(self, files: list[dict]) -> int:
+        ids, digests = [], []
+        for info in files:
+            entry_id, digest = self._entry_id(info)
+            ids.append(entry_id)
+            digests.append(digest)
+        digest = _hash(",".join(digests))
+        fileset_id = self._id("filesets", digest)
+        if fileset_id is None:
+            cur = self._conn.execute("INSERT INTO filesets (hash) VALUES (?)", (digest,))
+            fileset_id = cur.lastrowid
+            self._conn.executemany(
+                "INSERT INTO fileset_entries VALUES (?, ?, ?)",
+                [(fileset_id, pos, entry_id) for pos, entry_id in enumerate(ids)],
+            )
+        return fileset_id
+
+    def save(self, manifest: dict, keep: int = KEEP_RUNS) -> None:
+        """Store *manifest* as the latest run and keep the *keep* newest runs."""
+
+        run_id = manifest["run_id"]
+        head = {k: v for k, v in manifest.items() if k != "datasets"}
+        with self._conn:
+            # a re-run within the same second replaces the earlier run
+            self._conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+            self._conn.execute("DELETE FROM run_datasets WHERE run_id = ?", (run_id,))
+            self._conn.execute(
+                "INSERT INTO runs (run_id, body) VALUES (?, ?)", (run_id, _dumps(head))
+            )
+            for pos, (name, ds) in enumerate((manifest.get("datasets") or {}).items()):
+                body = {k: v for k, v in ds.items() if k != "files"}
+                self._conn.execute(
+                    "INSERT INTO run_datasets VALUES (?, ?, ?, ?, ?)",
+                    (run_id, name, pos, self._fileset_id(ds.get("files") or []), _dumps(body)),
+                )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('latest', ?)", (run_id,)
+            )
+            self._prune(keep)
+
+    def _prune(self, keep: int) -> None:
+        old = [
+            r[0]
+            for r in self._conn.execute(
+                "SELECT run_id FROM runs ORDER BY seq DESC LIMIT -1 OFFSET ?", (keep,)
+            )
+        ]
+        if not old:
+            return
+        self._conn.executemany("DELETE FROM runs WHERE run_id = ?", [(r,) for r in old])
+        self._conn.executemany(
+            "DELETE FROM run_datasets WHERE run_id = ?", [(r,) for r in old]
+        )
+        self._conn.execute(
+            "DELETE FROM filesets WHERE id NOT IN (SELECT fileset_id FROM run_datasets)"
+        )
+        self._conn.execute(
+            "DELETE FROM fileset_entries WHERE fileset_id NOT IN (SELECT id FROM filesets)"
+        )
+        self._conn.execute(
+            "DELETE FROM entries WHERE id NOT IN (SELECT entry_id FROM fileset_entries)"
+        )
+        logger.info("validate: manifests: pruned %d old run(s)", len(old))
+
+    # --- reading ----------------------------------------------------------
+
+    def latest_id(self) -> str | None:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'latest'").fetchone()
+        return row[0] if row else None
+
+    def run_ids(self) -> list[str]:
+        """Return stored run ids, newest first."""
+
+        return [r[0] for r in self._conn.execute("SELECT run_id FROM runs ORDER BY seq DESC")]
+
+    def load(self, run_id: str | None = None) -> dict | None:
+        """Return manifest *run_id* (default: the latest) as a dict."""
+
+        run_id = run_id or self.latest_id()
+        if run_id is None:
+            return None
+        row = self._conn.execute("SELECT body FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+        if row is None:
+            return None
+        manifest = json.loads(row[0])
+        datasets: dict[str, dict] = {}
+        for name, body in self._conn.execute(
+            "SELECT dataset, body FROM run_datasets WHERE run_id = ? ORDER BY pos", (run_id,)
+        ):
+            datasets[name] = {**json.loads(body), "files": []}
+        for name, body in self._conn.execute(
+            "SELECT d.dataset, e.body FROM run_datasets d "
+            "JOIN fileset_entries f ON f.fileset_id = d.fileset_id "
+            "JOIN entries e ON e.id = f.entry_id "
+            "WHERE d.run_id = ? ORDER BY d.pos, f.pos",
+            (run_id,),
+        ):
+            datasets[name]["files"].append(json.loads(body))
+        manifest["datasets"] = datasets
+        return manifest
+
+    def file_entry(self, path: str, run_id: str | None = None) -> tuple[str, dict] | None:
+        """Return ``(dataset, entry)`` of file *path* (relative to the root)."""
+
+        run_id = run_id or self.latest_id()
+        row = self._conn.execute(
+            "SELECT d.dataset, e.body FROM entries e "
+            "JOIN fileset_entries f ON f.entry_id = e.id "
+            "JOIN run_datasets d ON d.fileset_id = f.fileset_id "
+            "WHERE e.path = ? AND d.run_id = ? LIMIT 1",
+            (path, run_id),
+        ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+
+def open_manifest_store(root: str | Path) -> ManifestStore:
+    """Open the project manifest store at ``<root>/.pscope/manifests.db``."""
+
+    return ManifestStore(Path(root) / ".pscope" / "manifests.db")
+
+
+def latest_json_path(root: str | Path) -> Path:
+    return Path(root) / ".pscope" / "latest.json"
+
+
+def load_latest(root: str | Path) -> dict | None:
+    """Return the latest manifest of *root*, or ``None`` when there is none.
+
+    Falls back to ``.pscope/latest.json`` when the store has no runs yet.
+    """
+
+    if (Path(root) / ".pscope" / "manifests.db").exists():
+        with open_manifest_store(root) as store:
+            manifest = store.load()
+        if manifest is not None:
+            return manifest
+    try:
+        return json.loads(latest_json_path(root).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
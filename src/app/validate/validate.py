@@ -11,94 +11,22 @@ from datetime import datetime
 
 from app.pipeline.status import DONE
 from app.utils.logging import get_logger
+from app.utils.config import load_yaml
+from app.utils.headers import get_resolver
+from app.utils.paths import project_root, schemas_path
+from app.validate.manifests import latest_json_path, load_latest, open_manifest_store
+from app.validate.sampling import FileSample, parse_sample, wilson_interval
 from app.collectors.files import (
     list_csv_in_dir,
     read_headers,
     open_csv_rows,
+    open_fingerprint_cache,
 )
 
 
 logger = get_logger(__name__)
 
 
-def _simple_yaml_parse(text: str) -> dict:
-    """Very small YAML subset parser used when PyYAML is unavailable."""
-
-    import ast
-
-    root: dict = {}
-    stack: list[tuple[int, dict]] = [(0, root)]
-
-    for raw_line in text.splitlines():
-        if not raw_line.strip() or raw_line.lstrip().startswith("#"):
-            continue
-        indent = len(raw_line) - len(raw_line.lstrip(" "))
-        level = indent // 2
-        line = raw_line.strip()
-        if ":" not in line:
-            continue
-        key, value_part = line.split(":", 1)
-        key = key.strip()
-        value_part = value_part.strip()
-        if value_part and not (
-            (value_part.startswith('"') and value_part.endswith('"'))
-            or (value_part.startswith("'") and value_part.endswith("'"))
-        ):
-            if "#" in value_part:
-                value_part = value_part.split("#", 1)[0].strip()
-
-        while stack and stack[-1][0] >= level + 1:
-            stack.pop()
-        current = stack[-1][1]
-
-        if not value_part:
-            new_dict: dict = {}
-            current[key] = new_dict
-            stack.append((level + 1, new_dict))
-            continue
-
-        if value_part.startswith("{") or value_part.startswith("["):
-            try:
-                value = ast.literal_eval(value_part)
-            except Exception:
-                value = {}
-        elif value_part in {"true", "false"}:
-            value = value_part == "true"
-        elif (value_part.startswith('"') and value_part.endswith('"')) or (
-            value_part.startswith("'") and value_part.endswith("'")
-        ):
-            value = value_part[1:-1]
-        else:
-            try:
-                value = ast.literal_eval(value_part)
-            except Exception:
-                value = value_part
-
-        current[key] = value
-
-    return root
-
-
-def _build_normalizer(settings: dict):
-    remove_bom = settings.get("remove_bom", False)
-    trim = settings.get("trim", False)
-    collapse = settings.get("collapse_spaces", False)
-    casefold = settings.get("casefold", False)
-
-    def normalize(value: str, *, is_first: bool = False) -> str:
-        if is_first and remove_bom and value.startswith("\ufeff"):
-            value = value.lstrip("\ufeff")
-        if trim:
-            value = value.strip()
-        if collapse:
-            value = " ".join(value.split())
-        if casefold:
-            value = value.casefold()
-        return value
-
-    return normalize
-
-
 def _apply_rule(
     value: str,
     rule: dict,
@@ -164,23 +92,37 @@ def _apply_rule(
     return None
 
 
-def run(**kwargs) -> tuple[int, dict | None]:
-    """Run the validate step."""
+def run(
+    *,
+    datasets: list[str] | None = None,
+    sample: str | None = None,
+    root: str | Path | None = None,
+    config_file: str | Path | None = None,
+    **kwargs,
+) -> tuple[int, dict | None]:
+    """Run the validate step.
+
+    When *datasets* is given only those datasets are inventoried and checked;
+    entries of the other datasets are carried over from the latest manifest
+    if it was produced for the same ``schemas.yml``.  With *sample*
+    (``N`` rows or ``P%`` per file) headers are checked in full but content
+    only on sampled rows (see :mod:`app.validate.sampling`); the manifest is
+    then marked ``sampled``.
+    """
 
     try:
-        root = Path(__file__).resolve().parents[3]
-        config_path = root / "configs" / "schemas.yml"
+        root = project_root(root)
+        try:
+            sample_spec = parse_sample(sample) if sample else None
+        except ValueError as exc:
+            logger.error("validate: --sample: %s", exc)
+            return 1, None
+        config_path = schemas_path(root, config_file)
         if not config_path.exists():
             logger.error("validate: відсутній configs/schemas.yml")
             return 1, None
 
-        text = config_path.read_text(encoding="utf-8")
-        try:  # prefer PyYAML when available
-            import yaml  # type: ignore
-
-            config = yaml.safe_load(text) or {}
-        except Exception:
-            config = _simple_yaml_parse(text)
+        config = load_yaml(config_path)
         validate_cfg = config.get("validate") or {}
         settings = validate_cfg.get("settings") or {}
         rules_cfg = validate_cfg.get("rules") or {}
@@ -201,262 +143,316 @@ def run(**kwargs) -> tuple[int, dict | None]:
         primary = roles_cfg.get("primary") or []
         secondary = roles_cfg.get("secondary") or []
 
-        dataset_files: dict[str, list[str]] = {}
-
-        def _inventory(ds_name: str) -> list[str]:
-            ds = datasets_cfg.get(ds_name) or {}
-            rel = ds.get("dir")
-            if not isinstance(rel, str):
-                dataset_files[ds_name] = []
-                return []
-            dir_path = root / rel
-            files = list_csv_in_dir(
-                str(dir_path), ignore_suffixes=ignore_suffixes, recursive=False
-            )
-            dataset_files[ds_name] = files
-            if files:
-                names = [Path(p).name for p in files]
-                logger.info(
-                    "validate: files in %s: %s", rel, ", ".join(sorted(names))
+        with open_fingerprint_cache(root) as fingerprints:
+            schemas_hash = fingerprints.digest(config_path)
+
+            selected: set[str] | None = None
+            previous: dict[str, dict] = {}
+            if datasets:
+                latest = load_latest(root) or {}
+                # entries checked on a sample are not reused by a full run
+                if latest.get("schemas_hash") == schemas_hash and (
+                    sample_spec is not None or not latest.get("sampled")
+                ):
+                    selected = set(datasets)
+                    previous = latest.get("datasets") or {}
+                    logger.info("validate: datasets: %s", ", ".join(sorted(selected)))
+                else:
+                    logger.info("validate: no reusable manifest -> validating all datasets")
+
+            def _reused(ds_name: str) -> bool:
+                return selected is not None and ds_name not in selected
+
+            dataset_files: dict[str, list[str]] = {}
+
+            def _inventory(ds_name: str) -> list[str]:
+                if _reused(ds_name):
+                    prev_files = (previous.get(ds_name) or {}).get("files") or []
+                    files = [str(root / f["path"]) for f in prev_files]
+                    dataset_files[ds_name] = files
+                    return files
+                ds = datasets_cfg.get(ds_name) or {}
+                rel = ds.get("dir")
+                if not isinstance(rel, str):
+                    dataset_files[ds_name] = []
+                    return []
+                dir_path = root / rel
+                files = list_csv_in_dir(
+                    str(dir_path), ignore_suffixes=ignore_suffixes, recursive=False
                 )
-            else:
-                logger.info("validate: no csv in: %s", rel)
-            return files
-
-        total_primary_csv = 0
-        for name in primary:
-            total_primary_csv += len(_inventory(name))
+                dataset_files[ds_name] = files
+                if files:
+                    names = [Path(p).name for p in files]
+                    logger.info(
+                        "validate: files in %s: %s", rel, ", ".join(sorted(names))
+                    )
+                else:
+                    logger.info("validate: no csv in: %s", rel)
+                return files
 
-        for name in secondary:
-            _inventory(name)
+            total_primary_csv = 0
+            for name in primary:
+                total_primary_csv += len(_inventory(name))
 
-        if total_primary_csv == 0:
-            logger.error(
-                "validate: no required csv found across primary datasets (%s): need at least one *.csv (excluding *example.csv)",
-                ", ".join(primary),
-            )
-            logger.error("validate: errors summary: required_any_missing=1")
-            return 1, None
+            for name in secondary:
+                _inventory(name)
 
-        normalize = _build_normalizer(settings.get("normalize_headers", {}))
-
-        # prepare rules (compile regexes)
-        rules: dict[str, dict] = {}
-        for name, info in rules_cfg.items():
-            info = info or {}
-            if info.get("kind") == "regex":
-                pattern = info.get("pattern")
-                try:
-                    info["_compiled"] = re.compile(pattern) if pattern else None
-                except re.error:
-                    info["_compiled"] = None
-            rules[name] = info
-
-        # --- inventory ---
-        # dataset_files already contains entries for datasets from roles.primary and roles.secondary.
-        for ds_name, ds in datasets_cfg.items():
-            if ds_name in dataset_files:
-                continue
-            rel = ds.get("dir")
-            if not isinstance(rel, str):
-                continue
-            dir_path = root / rel
-            files = list_csv_in_dir(
-                str(dir_path), ignore_suffixes=ignore_suffixes, recursive=False
-            )
-            dataset_files[ds_name] = files
-            if files:
-                names = [Path(p).name for p in files]
-                logger.info(
-                    "validate: files in %s: %s", rel, ", ".join(sorted(names))
+            if total_primary_csv == 0:
+                logger.error(
+                    "validate: no required csv found across primary datasets (%s): need at least one *.csv (excluding *example.csv)",
+                    ", ".join(primary),
                 )
-            else:
-                logger.info("validate: no csv in: %s", rel)
-
-        manifest_datasets: dict[str, dict] = {}
-        missing_msgs: list[str] = []
-        content_msgs: list[str] = []
-        confusable_msgs: list[str] = []
-        files_with_missing: set[str] = set()
-        files_with_content: set[str] = set()
-        files_with_confusables: set[str] = set()
-
-        for ds_name, ds in datasets_cfg.items():
-            fields_cfg = ds.get("fields") or {}
-            ds_entry = {
-                "dir": ds.get("dir"),
-                "status": "skipped" if not fields_cfg else "empty",
-                "files": [],
-            }
-            manifest_datasets[ds_name] = ds_entry
-            if not fields_cfg:
-                logger.info("validate: skipped dataset %s: no schema", ds_name)
-                continue
-
-            files = dataset_files.get(ds_name, [])
-            if not files:
-                continue
-
-            field_defs = {}
-            alias_map: dict[str, str] = {}
-            for canonical, info in fields_cfg.items():
-                aliases_raw = info.get("headers") or []
-                aliases_norm = [normalize(h) for h in aliases_raw]
-                field_defs[canonical] = {
-                    "aliases": aliases_norm,
-                    "aliases_raw": aliases_raw,
-                    "required": bool(info.get("required")),
-                    "check": info.get("check", "any"),
-                }
-                for a in aliases_norm:
-                    if a not in alias_map:
-                        alias_map[a] = canonical
-
-            for path in files:
-                rel_path = str(Path(path).relative_to(root))
-                headers = read_headers(path)
-                norm_headers = [normalize(h, is_first=i == 0) for i, h in enumerate(headers)]
-                found: dict[str, tuple[str, int]] = {}
-                for idx, nh in enumerate(norm_headers):
-                    canonical = alias_map.get(nh)
-                    if canonical and canonical not in found:
-                        found[canonical] = (headers[idx], idx)
-
-                missing_fields: list[str] = []
-                for canonical, info in field_defs.items():
-                    if info["required"] and canonical not in found:
-                        aliases = "|".join(info["aliases_raw"])
-                        missing_fields.append(f"{canonical}[aliases={aliases}]")
-
-                if missing_fields:
-                    msg = (
-                        f"validate: missing required in {rel_path}: "
-                        f"{', '.join(missing_fields)}"
+                logger.error("validate: errors summary: required_any_missing=1")
+                return 1, None
+
+            resolver = get_resolver(validate_cfg, schemas_hash)
+
+            # prepare rules (compile regexes)
+            rules: dict[str, dict] = {}
+            for name, info in rules_cfg.items():
+                info = info or {}
+                if info.get("kind") == "regex":
+                    pattern = info.get("pattern")
+                    try:
+                        info["_compiled"] = re.compile(pattern) if pattern else None
+                    except re.error:
+                        info["_compiled"] = None
+                rules[name] = info
+
+            # --- inventory ---
+            # dataset_files already contains entries for datasets from roles.primary and roles.secondary.
+            for ds_name, ds in datasets_cfg.items():
+                if ds_name in dataset_files or _reused(ds_name):
+                    continue
+                rel = ds.get("dir")
+                if not isinstance(rel, str):
+                    continue
+                dir_path = root / rel
+                files = list_csv_in_dir(
+                    str(dir_path), ignore_suffixes=ignore_suffixes, recursive=False
+                )
+                dataset_files[ds_name] = files
+                if files:
+                    names = [Path(p).name for p in files]
+                    logger.info(
+                        "validate: files in %s: %s", rel, ", ".join(sorted(names))
                     )
-                    logger.error(msg)
-                    missing_msgs.append(msg)
-                    files_with_missing.add(rel_path)
                 else:
-                    logger.info("validate: headers ok: %s", rel_path)
-
-                file_has_error = False
-                if found:
-                    allowed_mac_chars = set("0123456789abcdefABCDEF:- ")
-                    for row_idx, row in enumerate(open_csv_rows(path), start=1):
-                        for canonical, (real_header, col_idx) in found.items():
-                            value = row[col_idx] if col_idx < len(row) else ""
-                            info = field_defs[canonical]
-                            rule_name = info["check"]
-                            rule = rules.get(rule_name, {"kind": "any"})
-
-                            if detect_confusables and rule.get("kind") == "mac":
-                                for ch in value:
-                                    if ch not in allowed_mac_chars and ch in confusables_map:
-                                        file_has_error = True
-                                        sugg = confusables_map.get(ch, "")
-                                        msg = (
-                                            "validate: content error: "
-                                            f"{rel_path} @row={row_idx} field={canonical} "
-                                            f"code=confusable_char char='{ch}' U+{ord(ch):04X} "
-                                            f"suggest='{sugg}'"
-                                        )
-                                        logger.error(msg)
-                                        confusable_msgs.append(msg)
-                                        content_msgs.append(msg)
-                                        files_with_content.add(rel_path)
-                                        files_with_confusables.add(rel_path)
-
-                            err = _apply_rule(
-                                value, rule, info["required"], canonical, rule_name
+                    logger.info("validate: no csv in: %s", rel)
+
+            manifest_datasets: dict[str, dict] = {}
+            missing_msgs: list[str] = []
+            # content issues are kept as (path, row, field, code) tuples; the
+            # messages themselves go to the (rate-limited) log only
+            content_msgs: list[tuple[str, int, str, str]] = []
+            confusable_msgs: list[tuple[str, int, str, str]] = []
+            files_with_missing: set[str] = set()
+            files_with_content: set[str] = set()
+            files_with_confusables: set[str] = set()
+            if sample_spec is not None:
+                logger.info(
+                    "validate: content checked on a sample of %s rows per file", sample_spec
+                )
+
+            for ds_name, ds in datasets_cfg.items():
+                if _reused(ds_name) and ds_name in previous:
+                    manifest_datasets[ds_name] = previous[ds_name]
+                    continue
+                fields_cfg = ds.get("fields") or {}
+                ds_entry = {
+                    "dir": ds.get("dir"),
+                    "status": "skipped" if not fields_cfg else "empty",
+                    "files": [],
+                }
+                manifest_datasets[ds_name] = ds_entry
+                if not fields_cfg:
+                    logger.info("validate: skipped dataset %s: no schema", ds_name)
+                    continue
+
+                files = dataset_files.get(ds_name, [])
+                if not files:
+                    continue
+
+                field_defs = resolver.fields.get(ds_name, {})
+                rows_checked = rows_failed = rows_total = 0
+
+                for path in files:
+                    rel_path = str(Path(path).relative_to(root))
+                    found = resolver.resolve(ds_name, read_headers(path))
+
+                    missing_fields: list[str] = []
+                    for canonical, info in field_defs.items():
+                        if info["required"] and canonical not in found:
+                            aliases = "|".join(info["aliases_raw"])
+                            missing_fields.append(f"{canonical}[aliases={aliases}]")
+
+                    if missing_fields:
+                        msg = (
+                            f"validate: missing required in {rel_path}: "
+                            f"{', '.join(missing_fields)}"
+                        )
+                        logger.error(msg)
+                        missing_msgs.append(msg)
+                        files_with_missing.add(rel_path)
+                    else:
+                        logger.info("validate: headers ok: %s", rel_path)
+
+                    file_has_error = False
+                    file_sample = None
+                    if found:
+                        allowed_mac_chars = set("0123456789abcdefABCDEF:- ")
+                        if sample_spec is not None:
+                            file_sample = FileSample(path, sample_spec, seed=rel_path)
+                            rows = iter(file_sample)
+                        else:
+                            rows = (
+                                ("row", idx, row)
+                                for idx, row in enumerate(open_csv_rows(path), start=1)
                             )
-                            if err:
-                                file_has_error = True
-                                msg = (
-                                    f"validate: content error: {rel_path} @row={row_idx} "
-                                    f"field={canonical} code={err} value=\"{value}\""
+                        for unit, row_idx, row in rows:
+                            row_failed = False
+                            for canonical, (real_header, col_idx) in found.items():
+                                value = row[col_idx] if col_idx < len(row) else ""
+                                info = field_defs[canonical]
+                                rule_name = info["check"]
+                                rule = rules.get(rule_name, {"kind": "any"})
+
+                                if detect_confusables and rule.get("kind") == "mac":
+                                    for ch in value:
+                                        if ch not in allowed_mac_chars and ch in confusables_map:
+                                            file_has_error = row_failed = True
+                                            sugg = confusables_map.get(ch, "")
+                                            logger.error(
+                                                "validate: content error: %s @%s=%d field=%s "
+                                                "code=confusable_char char='%s' U+%04X suggest='%s'",
+                                                rel_path,
+                                                unit,
+                                                row_idx,
+                                                canonical,
+                                                ch,
+                                                ord(ch),
+                                                sugg,
+                                            )
+                                            issue = (rel_path, row_idx, canonical, "confusable_char")
+                                            confusable_msgs.append(issue)
+                                            content_msgs.append(issue)
+                                            files_with_content.add(rel_path)
+                                            files_with_confusables.add(rel_path)
+
+                                err = _apply_rule(
+                                    value, rule, info["required"], canonical, rule_name
                                 )
-                                logger.error(msg)
-                                content_msgs.append(msg)
-                                files_with_content.add(rel_path)
-
-                if not missing_fields and not file_has_error:
-                    logger.info("validate: content ok: %s", rel_path)
-                    stat = Path(path).stat()
-                    headers_map = {
-                        canon: hdr for canon, (hdr, _) in found.items()
-                    }
-                    ds_entry["files"].append(
-                        {
+                                if err:
+                                    file_has_error = row_failed = True
+                                    logger.error(
+                                        "validate: content error: %s @%s=%d field=%s code=%s value=\"%s\"",
+                                        rel_path,
+                                        unit,
+                                        row_idx,
+                                        canonical,
+                                        err,
+                                        value,
+                                    )
+                                    content_msgs.append((rel_path, row_idx, canonical, err))
+                                    files_with_content.add(rel_path)
+                            rows_checked += 1
+                            rows_failed += row_failed
+                        if file_sample is not None:
+                            rows_total += file_sample.total
+
+                    if not missing_fields and not file_has_error:
+                        logger.info("validate: content ok: %s", rel_path)
+                        headers_map = {
+                            canon: hdr for canon, (hdr, _) in found.items()
+                        }
+                        file_entry = {
                             "path": rel_path,
-                            "fingerprint": {
-                                "size": stat.st_size,
-                                "mtime": int(stat.st_mtime),
-                            },
+                            "fingerprint": fingerprints.fingerprint(path),
                             "headers_map": headers_map,
                             "columns_present": list(found.keys()),
                             "columns_missing": [
                                 c for c in field_defs.keys() if c not in found
                             ],
                         }
+                        if file_sample is not None:
+                            file_entry["sample"] = {
+                                "method": file_sample.method,
+                                "rows_total": file_sample.total,
+                            }
+                        ds_entry["files"].append(file_entry)
+
+                if ds_entry["files"]:
+                    ds_entry["status"] = "ok"
+
+                if sample_spec is not None and rows_checked:
+                    low, high = wilson_interval(rows_failed, rows_checked)
+                    ds_entry["sample"] = {
+                        "rows_checked": rows_checked,
+                        "rows_total": rows_total,
+                        "rows_with_errors": rows_failed,
+                        "error_rate": round(rows_failed / rows_checked, 6),
+                        "error_rate_low": round(low, 6),
+                        "error_rate_high": round(high, 6),
+                    }
+                    logger.info(
+                        "validate: sample %s: rows=%d of ~%d, rows_with_errors=%d, "
+                        "error_rate=%.3f%% (95%% CI %.3f%%..%.3f%%)",
+                        ds_name,
+                        rows_checked,
+                        rows_total,
+                        rows_failed,
+                        100 * rows_failed / rows_checked,
+                        100 * low,
+                        100 * high,
                     )
 
-            if ds_entry["files"]:
-                ds_entry["status"] = "ok"
-
-        total_issues = len(missing_msgs) + len(content_msgs)
-        logger.info(
-            "validate: errors summary: files_with_confusables=%d, files_with_content_errors=%d, total_issues=%d",
-            len(files_with_confusables),
-            len(files_with_content),
-            total_issues,
-        )
-
-        exit_code = DONE
-        if (
-            settings.get("stop_on_missing_required", True) and missing_msgs
-        ) or (settings.get("stop_on_content_error", True) and content_msgs):
-            exit_code = 1
-
-        manifest: dict | None = None
-        if exit_code == DONE:
-            run_id = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
-            schemas_hash = hashlib.sha256(config_path.read_bytes()).hexdigest()
-            manifest = {
-                "run_id": run_id,
-                "schemas_hash": schemas_hash,
-                "settings_fingerprint": settings_fingerprint,
-                "datasets": manifest_datasets,
-            }
-
-            manifest_dir = root / ".pscope" / "validate"
-            manifest_dir.mkdir(parents=True, exist_ok=True)
-            manifest_path = manifest_dir / f"{run_id}.json"
-            tmp_path = manifest_path.with_suffix(".json.tmp")
-            text = json.dumps(manifest, ensure_ascii=False, indent=2)
-            tmp_path.write_text(text, encoding="utf-8")
-            tmp_path.replace(manifest_path)
-
-            latest_path = root / ".pscope" / "latest.json"
-            tmp_latest = latest_path.with_suffix(".tmp")
-            tmp_latest.write_text(text, encoding="utf-8")
-            tmp_latest.replace(latest_path)
-            logger.info(
-                "validate: manifest saved to %s", str(manifest_path.relative_to(root))
-            )
+            total_issues = len(missing_msgs) + len(content_msgs)
             logger.info(
-                "validate: latest -> %s", str(manifest_path.relative_to(root))
+                "validate: errors summary: files_with_confusables=%d, files_with_content_errors=%d, total_issues=%d",
+                len(files_with_confusables),
+                len(files_with_content),
+                total_issues,
             )
 
-            # cleanup old manifests
-            keep = 20
-            files = sorted(manifest_dir.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
-            for old in files[keep:]:
-                try:
-                    old.unlink()
-                except Exception:
-                    pass
+            exit_code = DONE
+            if (
+                settings.get("stop_on_missing_required", True) and missing_msgs
+            ) or (settings.get("stop_on_content_error", True) and content_msgs):
+                exit_code = 1
+
+            manifest: dict | None = None
+            if exit_code == DONE:
+                run_id = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+                manifest = {
+                    "run_id": run_id,
+                    "schemas_hash": schemas_hash,
+                    "settings_fingerprint": settings_fingerprint,
+                    "datasets": manifest_datasets,
+                }
+                if sample_spec is not None:
+                    # collect refuses sampled manifests unless allowed explicitly
+                    manifest["sampled"] = True
+                    manifest["sample"] = str(sample_spec)
+
+                with open_manifest_store(root) as store:
+                    store.save(manifest)
+                    logger.info(
+                        "validate: manifest %s saved to %s",
+                        run_id,
+                        str(store.path.relative_to(root)),
+                    )
+
+                # compact copy for external tools and older readers
+                latest_path = latest_json_path(root)
+                tmp_latest = latest_path.with_suffix(".tmp")
+                tmp_latest.write_text(
+                    json.dumps(manifest, ensure_ascii=False, separators=(",", ":")),
+                    encoding="utf-8",
+                )
+                tmp_latest.replace(latest_path)
+                logger.info("validate: latest -> %s", run_id)
 
-        return exit_code, manifest
+            return exit_code, manifest
 
     except Exception as exc:  # pragma: no cover - minimal error handling
         logger.error("validate: unexpected error: %s", exc)